@@ -1,125 +1,477 @@
+import atexit
 import random
-from flask import Flask, render_template, request, session, redirect, url_for
+import secrets
+import time
+from flask import Flask, render_template, request, session, redirect, url_for, jsonify, g, send_file, abort, make_response
 import os
 from route import RouteManager
+from game_store import GameState, create_game_store
+from resolver import CountryResolver
+from puzzle_pool import DIFFICULTY_TIERS, PuzzlePool
+from metrics import REGISTRY, SamplingProfiler, span
+from path_render import PathRenderer
+from graph_api import GraphAPI
 
 # Initialize Flask app
 app = Flask(__name__, template_folder=r"templates")
 app.secret_key = os.getenv("SESSION_KEY")  # Set the secret key for session storage
 
-# Initialize the RouteManager
-route_manager = RouteManager(
-    routes_file=r"data/routes.csv",
-    airports_file=r"data/airports.csv"
-)
+# Initialize the RouteManager. Pre-fork workers attach to the snapshot the
+# master published in ROUTE_SNAPSHOT (see gunicorn.conf.py) instead of building their own.
+if os.getenv("ROUTE_SNAPSHOT"):
+    route_manager = RouteManager.attach(os.environ["ROUTE_SNAPSHOT"])
+else:
+    route_manager = RouteManager(
+        routes_file=r"data/routes.csv",
+        airports_file=r"data/airports.csv",
+        granularity=os.getenv("ROUTE_GRANULARITY", "country"),  # "country", "city" or "airport"
+        loader=os.getenv("ROUTE_LOADER", "csv")  # "csv" (stdlib, no pandas import) or "pandas"
+    )
 
-# Create a case-insensitive mapping of country names
-country_map = {}
-for country in route_manager.countries:
-    country_map[country.lower()] = country
+# Game state lives server-side; the session cookie only carries an opaque game ID.
+# GAME_STORE is "memory" (per process) or "sqlite:<path>" (shared between workers).
+game_store = create_game_store(os.getenv("GAME_STORE", "memory"))
+
+# Resolve player input (names, aliases, ISO and IATA codes, typos) against the graph nodes
+country_resolver = CountryResolver.from_route_manager(route_manager)
+
+# How a finished game is scored: "hops" compares flight counts, "distance" compares
+# great-circle kilometres flown with the shortest route by distance
+SCORING = os.getenv("SCORING", "hops")
+
+# Route maps on the win page, drawn on first request and then served from the disk cache
+path_renderer = PathRenderer(route_manager, cache_dir=os.getenv("PATH_IMAGE_CACHE", "data/path_images"))
+
+# Read-only JSON views of the graph under /api/v1, encoded and compressed once per graph version
+graph_api = GraphAPI(route_manager)
+
+# Longest list of moves accepted by one /api/v1/moves request
+MAX_BATCH_MOVES = 32
+
+# Puzzles are generated ahead of time by a background thread; "/" only dequeues
+puzzle_pool = PuzzlePool(route_manager, min_path_length=2).start()
+
+# Metrics served at /metrics in the Prometheus text format
+REQUEST_SECONDS = REGISTRY.histogram("http_request_duration_seconds", "Request latency by endpoint",
+                                     labels=("endpoint", "method", "status"))
+GAME_INPUTS = REGISTRY.counter("game_inputs_total", "Moves submitted to /play by outcome", labels=("outcome",))
+GAMES_STARTED = REGISTRY.counter("games_started_total", "Games started", labels=("kind",))
+GAMES_COMPLETED = REGISTRY.counter("games_completed_total", "Games finished, by whether the route was optimal",
+                                   labels=("optimal",))
+REGISTRY.gauge("puzzle_pool_depth", "Ready puzzles per difficulty tier",
+               lambda: {(tier,): depth for tier, depth in puzzle_pool.stats()["depth"].items()}, labels=("tier",))
+REGISTRY.gauge("game_store_games", "Games held by the game store", lambda: len(game_store))
+REGISTRY.gauge("resolver_cache_hits", "Resolver LRU hits", lambda: country_resolver.cache_info().hits)
+REGISTRY.gauge("resolver_cache_misses", "Resolver LRU misses", lambda: country_resolver.cache_info().misses)
+REGISTRY.gauge("hint_cache_hits", "Hint distance-vector LRU hits", lambda: route_manager.hint_cache_info()["hits"])
+REGISTRY.gauge("hint_cache_misses", "Hint distance-vector LRU misses",
+               lambda: route_manager.hint_cache_info()["misses"])
+
+# Optional stack sampling of a fraction of requests, keeping the slowest ones
+# (PROFILE_SAMPLE_RATE, e.g. 0.01). PROFILE_DUMP names a collapsed-stack file written at exit.
+profiler = SamplingProfiler(sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0")))
+if os.getenv("PROFILE_DUMP"):
+    atexit.register(profiler.dump, os.environ["PROFILE_DUMP"])
+
+
+def load_game():
+    """Fetch the current player's game, timing the store lookup for Server-Timing"""
+    with span("game_store") as timer:
+        state = game_store.get(session.get("game_id"))
+    g.state_seconds = g.get("state_seconds", 0.0) + timer.seconds
+    return state
+
+
+def save_game(game_id, state):
+    with span("game_store") as timer:
+        game_store.put(game_id, state)
+    g.state_seconds = g.get("state_seconds", 0.0) + timer.seconds
+
+
+def country_names(ids):
+    return [route_manager.countries[i] for i in ids]
+
+
+def game_hint(state):
+    """Flights left from the player's current country and the neighbors that make progress"""
+    with span("hint"):
+        return route_manager.hint(route_manager.countries[state.player_path[-1]],
+                                  route_manager.countries[state.destination])
+
+
+def render_game(state, error=None):
+    """Render the game page for a stored game
+
+    The page also gets the graph version, so its script can fetch the
+    cacheable graph payload and check moves before submitting them.
+    """
+    player_path = country_names(state.player_path)
+    hint = game_hint(state)
+    with span("render"):
+        return render_template("game.html", source=route_manager.countries[state.source],
+                               destination=route_manager.countries[state.destination],
+                               path_length=len(state.correct_path) - 1,
+                               player_path=" → ".join(player_path) if len(player_path) > 1 else "",
+                               error=error, hint=hint, current=player_path[-1],
+                               graph_version=graph_api.current().version)
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.profile_token = profiler.start_request()
+
+
+@app.after_request
+def record_request(response):
+    if "state_seconds" in g:
+        response.headers["Server-Timing"] = f"state;dur={g.state_seconds * 1000:.3f}"
+    if "request_start" in g:
+        seconds = time.perf_counter() - g.request_start
+        REQUEST_SECONDS.observe(seconds, request.endpoint or "unmatched", request.method, response.status_code)
+        profiler.finish_request(g.profile_token, f"{request.method} {request.full_path.rstrip('?')}", seconds)
+    return response
+
+
+def start_game(puzzle):
+    """Store a new game for puzzle server-side and keep only its ID in the session"""
+    game_store.delete(session.get("game_id"))
+    game_id = secrets.token_urlsafe(16)
+    ids = route_manager.country_ids
+    state = GameState(ids[puzzle.source], ids[puzzle.destination], [ids[puzzle.source]],
+                      [ids[country] for country in puzzle.path])
+    save_game(game_id, state)
+    session["game_id"] = game_id
+
+    return render_game(state)
 
 
 # Home Page - Start the Game
 @app.route("/")
 def home():
-    # Use RouteManager to pick a random route with at least 2 stops
-    source, destination, correct_path = route_manager.pick_random_route(min_path_length=2)
+    # Take a pre-generated puzzle, optionally of a given difficulty
+    difficulty = request.args.get("difficulty")
+    if difficulty not in DIFFICULTY_TIERS:
+        difficulty = None
+    puzzle = puzzle_pool.get(difficulty)
+
+    if puzzle is None:
+        return "Error: No valid routes found."
+
+    GAMES_STARTED.inc("random")
+    return start_game(puzzle)
+
 
-    if not source or not destination:
+# Daily Challenge - the same puzzle for every player and worker
+@app.route("/daily")
+def daily():
+    puzzle = puzzle_pool.daily_puzzle()
+
+    if puzzle is None:
         return "Error: No valid routes found."
 
-    # Store in session
-    session["source"] = source
-    session["destination"] = destination
-    session["player_path"] = [source]
-    session["correct_path"] = correct_path
+    GAMES_STARTED.inc("daily")
+    return start_game(puzzle)
+
+
+def make_move(state, user_input):
+    """Resolve user_input and, if it is a valid flight, append it to the player's path
+
+    Returns (outcome, error): outcome is one of the GAME_INPUTS labels and
+    error a message for the player, None for a valid move. A move that
+    reaches the destination also counts the finished game; no move is taken
+    after that.
+    """
+    if state.player_path[-1] == state.destination:
+        GAME_INPUTS.inc("finished")
+        return "finished", "The game is already finished"
+
+    with span("resolve"):
+        next_country, matches, total = country_resolver.resolve_one(user_input)
+
+    if next_country is None:
+        # No unique match found, treat as invalid
+        outcome = "ambiguous" if matches else "not_found"
+        GAME_INPUTS.inc(outcome)
+        error_msg = "Country not found. Please check your spelling."
+        if matches:
+            error_msg = f"Ambiguous input. Did you mean one of: {', '.join(c.name for c in matches)}"
+            if total > len(matches):
+                error_msg += f", and {total - len(matches)} others"
+        return outcome, error_msg
+
+    current_country = route_manager.countries[state.player_path[-1]]
+
+    # Check if the selected country is a valid neighbor using RouteManager
+    with span("validate_move"):
+        valid = route_manager.check_valid_move(current_country, next_country)
+    if not valid:
+        GAME_INPUTS.inc("invalid_move")
+        return "invalid_move", f"Invalid move! You can't fly directly from {current_country} to {next_country}"
+
+    # Valid move, append to player path
+    GAME_INPUTS.inc("valid")
+    state.player_path.append(route_manager.country_ids[next_country])
+    if state.player_path[-1] == state.destination:
+        GAMES_COMPLETED.inc(str(score_game(state)["optimal"]).lower())
+    return "valid", None
+
+
+def score_game(state):
+    """Score of a finished game, by flights or by kilometres depending on SCORING"""
+    player_path = country_names(state.player_path)
+    if SCORING == "distance":
+        return distance_score(player_path)
+
+    # Calculate score based on optimal vs actual path length
+    correct_path = country_names(state.correct_path)
+    optimal_length = len(correct_path) - 1  # Number of flights in optimal path
+    player_length = len(player_path) - 1  # Number of flights in player's path
+
+    # Calculate score (100 points for optimal path, deduct points for extra steps)
+    if player_length == optimal_length:
+        score = 100  # Perfect score for optimal path
+        score_message = "Perfect! You found the optimal route!"
+    else:
+        # Deduct points for each extra flight taken (10 points per extra flight)
+        extra_flights = player_length - optimal_length
+        score = max(0, 100 - (extra_flights * 10))
+        score_message = f"You took {extra_flights} more flight(s) than the optimal route."
+
+    return {"score": score, "score_message": score_message, "optimal": player_length == optimal_length,
+            "optimal_route": correct_path, "optimal_path": " → ".join(correct_path)}
+
 
-    return render_template("game.html", source=source, destination=destination,
-                           path_length=len(correct_path) - 1)
+def render_win(state):
+    player_path = country_names(state.player_path)
+    result = score_game(state)
+    return render_template("win.html",
+                           path=" → ".join(player_path),
+                           score=result["score"],
+                           score_message=result["score_message"],
+                           optimal_path=result["optimal_path"],
+                           path_image=path_image_url(player_path),
+                           optimal_path_image=path_image_url(result["optimal_route"]))
 
 
 # Process Player's Input
 @app.route("/play", methods=["POST"])
 def play():
-    # Get the input and standardize it to match our country names
+    state = load_game()
+    if state is None:
+        # Unknown or expired game, start a new one
+        return redirect(url_for("home"))
+
+    # Get the input and resolve it to one of our country names
     user_input = request.form.get("next_country", "").strip()
-    next_country_lower = user_input.lower()
+    outcome, error = make_move(state, user_input)
+    if error:
+        return render_game(state, error=error)
+    save_game(session["game_id"], state)
+
+    # Check if the player reached the destination
+    if state.player_path[-1] == state.destination:
+        return render_win(state)
+
+    # If not, show the current game state again
+    return render_game(state)
+
 
-    # Look up the properly capitalized country name
-    if next_country_lower in country_map:
-        next_country = country_map[next_country_lower]
+# Result page of a game finished through the move API
+@app.route("/result")
+def result():
+    state = load_game()
+    if state is None or state.player_path[-1] != state.destination:
+        return redirect(url_for("home"))
+    return render_win(state)
+
+
+def path_image_url(path):
+    return url_for("path_image", path="|".join(path))
+
+
+def distance_score(player_path):
+    """Score the kilometres flown against the shortest route by distance
+
+    The shortest-path tree towards the destination is cached per destination,
+    so scoring is a lookup once any game to that destination has finished.
+    """
+    with span("score_distance"):
+        result = route_manager.great_circle().score(player_path)
+    player_km, optimal_km = result["player_km"], result["optimal_km"]
+    optimal = player_km <= optimal_km + 0.5
+    if optimal:
+        score = 100
+        score_message = f"Perfect! You flew the shortest route: {player_km:,.0f} km."
     else:
-        # If we can't find an exact match, check for partial matches
-        matches = [country for country_lower, country in country_map.items()
-                   if next_country_lower in country_lower]
-
-        if len(matches) == 1:
-            next_country = matches[0]  # Use the single match
-        else:
-            # No unique match found, treat as invalid
-            player_path = session.get("player_path", [])
-            correct_path = session.get("correct_path", [])
-
-            error_msg = "Country not found. Please check your spelling."
-            if len(matches) > 1:
-                error_msg = f"Ambiguous input. Did you mean one of: {', '.join(matches[:5])}"
-                if len(matches) > 5:
-                    error_msg += f", and {len(matches) - 5} others"
-
-            return render_template("game.html", source=session["source"], destination=session["destination"],
-                                   path_length=len(correct_path) - 1, player_path=" → ".join(player_path),
-                                   error=error_msg)
-
-    player_path = session.get("player_path", [])
-    correct_path = session.get("correct_path", [])
+        score = max(0, round(100 * optimal_km / player_km))
+        score_message = f"You flew {player_km:,.0f} km, {player_km - optimal_km:,.0f} km more than the shortest route."
 
-    # Check if the selected country is a valid neighbor using RouteManager
-    if not route_manager.check_valid_move(player_path[-1], next_country):
-        return render_template("game.html", source=session["source"], destination=session["destination"],
-                               path_length=len(correct_path) - 1, player_path=" → ".join(player_path),
-                               error="Invalid move! You can't fly directly from " + player_path[
-                                   -1] + " to " + next_country)
+    return {"score": score, "score_message": score_message, "optimal": optimal,
+            "optimal_route": result["optimal_path"],
+            "optimal_path": f"{' → '.join(result['optimal_path'])} ({optimal_km:,.0f} km)"}
 
-    # Valid move, append to player path
-    player_path.append(next_country)
-    session["player_path"] = player_path
 
-    # Check if the player reached the destination
-    if next_country == session["destination"]:
-        # Calculate score based on optimal vs actual path length
-        optimal_length = len(correct_path) - 1  # Number of flights in optimal path
-        player_length = len(player_path) - 1  # Number of flights in player's path
-
-        # Calculate score (100 points for optimal path, deduct points for extra steps)
-        if player_length == optimal_length:
-            score = 100  # Perfect score for optimal path
-            score_message = "Perfect! You found the optimal route!"
-        else:
-            # Deduct points for each extra flight taken (10 points per extra flight)
-            extra_flights = player_length - optimal_length
-            score = max(0, 100 - (extra_flights * 10))
-            score_message = f"You took {extra_flights} more flight(s) than the optimal route."
-
-        # Find the optimal path for display
-        optimal_path_display = " → ".join(correct_path)
-
-        return render_template("win.html",
-                               path=" → ".join(player_path),
-                               score=score,
-                               score_message=score_message,
-                               optimal_path=optimal_path_display)
+# Autocomplete for the country input
+@app.route("/api/countries/autocomplete")
+def autocomplete():
+    query = request.args.get("q", "")
+    limit = min(request.args.get("limit", 10, type=int), 50)
+    candidates, total = country_resolver.resolve(query, limit=limit)
+    return jsonify(query=query, total=total, candidates=[c.to_dict() for c in candidates])
 
-    # If not, show the current game state again
-    return render_template("game.html", source=session["source"], destination=session["destination"],
-                           path_length=len(correct_path) - 1, player_path=" → ".join(player_path))
+
+def finished_game_paths(state):
+    """The player's route and the optimal route of a finished game, the only paths drawn for it"""
+    if state is None or state.player_path[-1] != state.destination:
+        return []
+    return [country_names(state.player_path), score_game(state)["optimal_route"]]
+
+
+# Map of a route, e.g. /path-image.png?path=France|Japan; rendered once per path and graph version.
+# Only the routes of the session's own finished game are drawn, so the endpoint cannot be used
+# to render (and store) arbitrary paths.
+@app.route("/path-image.png")
+def path_image():
+    path = request.args.get("path", "").split("|")
+    if path not in finished_game_paths(load_game()):
+        abort(404)
+    try:
+        with span("render_path_image"):
+            file = path_renderer.render(path)
+    except ValueError:
+        abort(404)
+    return send_file(file, mimetype="image/png", etag=os.path.basename(file), max_age=86400)
+
+
+def payload_response(payload, max_age):
+    """Serve a prebuilt Payload, gzipped when the client accepts it, answering If-None-Match with 304
+
+    The gzip and identity bodies are different representations, so each has
+    its own ETag (the gzip one ends in -gz) and responses vary on Accept-Encoding.
+    """
+    gzipped = "gzip" in request.accept_encodings
+    etag = f"{payload.etag}-gz" if gzipped else payload.etag
+    headers = {"ETag": f'"{etag}"', "Vary": "Accept-Encoding",
+               "Cache-Control": f"public, max-age={max_age}" + (", immutable" if max_age >= 86400 else "")}
+    if etag in request.if_none_match:
+        return "", 304, headers
+    if gzipped:
+        headers["Content-Encoding"] = "gzip"
+        return payload.gzipped, 200, {**headers, "Content-Type": "application/json"}
+    return payload.body, 200, {**headers, "Content-Type": "application/json"}
+
+
+def current_payloads(version):
+    """GraphPayloads for version, or a 404 naming the current version if the graph has changed"""
+    payloads = graph_api.current()
+    if version != payloads.version:
+        abort(make_response(jsonify(error="Unknown graph version", version=payloads.version), 404))
+    return payloads
+
+
+# Current graph version; the versioned URLs below never change content and are cached for a year
+@app.route("/api/v1/version")
+def api_version():
+    return jsonify(version=graph_api.current().version)
+
+
+@app.route("/api/v1/<version>/countries")
+def api_countries(version):
+    return payload_response(current_payloads(version).countries, max_age=31536000)
+
+
+# All countries plus every country's neighbors as indices into the list, for client-side move checks
+@app.route("/api/v1/<version>/graph")
+def api_graph(version):
+    return payload_response(current_payloads(version).graph, max_age=31536000)
+
+
+@app.route("/api/v1/<version>/countries/<path:country>/neighbors")
+def api_neighbors(version, country):
+    payload = current_payloads(version).neighbors(country)
+    if payload is None:
+        abort(make_response(jsonify(error=f"Unknown country '{country}'"), 404))
+    return payload_response(payload, max_age=31536000)
+
+
+# Apply several moves of the current game in one request, stopping at the first rejected one
+@app.route("/api/v1/moves", methods=["POST"])
+def api_moves():
+    state = load_game()
+    if state is None:
+        return jsonify(error="No game in progress"), 404
+    body = request.get_json(silent=True) or {}
+    moves = body.get("moves")
+    if not isinstance(moves, list) or not all(isinstance(move, str) for move in moves):
+        return jsonify(error="Expected {\"moves\": [country, ...]}"), 400
+    if len(moves) > MAX_BATCH_MOVES:
+        return jsonify(error=f"At most {MAX_BATCH_MOVES} moves per request"), 400
+
+    results = []
+    applied = 0
+    for move in moves:
+        outcome, error = make_move(state, move.strip())
+        results.append({"input": move, "outcome": outcome, "error": error,
+                        "country": route_manager.countries[state.player_path[-1]] if error is None else None})
+        if error:
+            break
+        applied += 1
+    if applied:
+        save_game(session["game_id"], state)
+
+    finished = state.player_path[-1] == state.destination
+    return jsonify(results=results, player_path=country_names(state.player_path), finished=finished,
+                   hint=None if finished else game_hint(state),
+                   result_url=url_for("result") if finished else None)
+
+
+# Distance remaining for the current game, for clients that update the hint without a reload
+@app.route("/api/hint")
+def hint():
+    state = load_game()
+    if state is None:
+        return jsonify(error="No game in progress"), 404
+    return jsonify(game_hint(state))
+
+
+# Hint distance-vector cache size and hit rate
+@app.route("/hint/stats")
+def hint_stats():
+    return jsonify(route_manager.hint_cache_info())
+
+
+# Game store counters
+@app.route("/store/stats")
+def store_stats():
+    return jsonify(game_store.stats())
+
+
+# Puzzle pool depth and refill latency
+@app.route("/pool/stats")
+def pool_stats():
+    return jsonify(puzzle_pool.stats())
+
+
+# Prometheus metrics
+@app.route("/metrics")
+def metrics():
+    return REGISTRY.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
+# Slowest profiled requests with their most frequent stacks
+@app.route("/metrics/slow")
+def slow_requests():
+    return jsonify(sample_rate=profiler.sample_rate, requests=profiler.slowest())
 
 
 # Restart Game
 @app.route("/restart")
 def restart():
+    game_store.delete(session.get("game_id"))
     session.clear()
     return redirect(url_for("home"))
 
 
 if __name__ == "__main__":
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True)
@@ -0,0 +1,260 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Slowdown of a benchmark's median, relative to the baseline, reported as a regression
+DEFAULT_THRESHOLD = 0.15
+
+# Synthetic network sizes for the scaling run, as (countries, airports per country, routes)
+SCALING_SIZES = ((50, 4, 5000), (100, 4, 10000), (200, 4, 20000), (400, 4, 40000), (800, 4, 80000))
+
+
+def measure(function, repeat=5, number=1, warmup=1):
+    """Time function() and summarize seconds per call over repeat rounds of number calls"""
+    for _ in range(warmup):
+        function()
+    rounds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        rounds.append((time.perf_counter() - start) / number)
+    return {"median_s": statistics.median(rounds), "min_s": min(rounds), "max_s": max(rounds),
+            "mean_s": statistics.fmean(rounds), "repeat": repeat, "number": number}
+
+
+def _quiet(function):
+    """Wrap function so whatever it prints is discarded"""
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return function()
+    return run
+
+
+def _seeded(function, seed):
+    """Reseed the global RNG before each call so sampled workloads repeat exactly"""
+    def run():
+        random.seed(seed)
+        return function()
+    return run
+
+
+def _uncached_statistics(function):
+    """Clear RouteStatistics' per-process memo before each call, so every round computes the statistics"""
+    from route_stats import RouteStatistics
+
+    def run():
+        RouteStatistics._memory.clear()
+        return function()
+    return run
+
+
+def route_manager_benchmarks(routes_file="data/routes.csv", airports_file="data/airports.csv",
+                             granularity="country", repeat=5, seed=0, include_tester=True):
+    """Time RouteManager construction stages, its queries and the route_tester helpers"""
+    from route import RouteManager
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        options = dict(routes_file=routes_file, airports_file=airports_file, granularity=granularity,
+                       snapshot_file=os.path.join(workdir, "snapshot.bin"),
+                       output_file=os.path.join(workdir, "min_stops.csv"))
+        route_manager = RouteManager(use_snapshot=False, **options)
+        csr = route_manager._build_country_graph()
+
+        results["construct.load"] = measure(route_manager._load_data, repeat)
+        results["construct.build_graph"] = measure(route_manager._build_country_graph, repeat)
+        results["construct.distance_index"] = measure(lambda: route_manager._build_distance_index(csr), repeat)
+        results["construct.total"] = measure(lambda: RouteManager(use_snapshot=False, **options), repeat)
+        route_manager.save_snapshot()
+        results["construct.from_snapshot"] = measure(lambda: RouteManager(**options), repeat)
+
+        nodes = route_manager.countries
+        rng = random.Random(seed)
+        edges = [(nodes[u], nodes[v]) for u, neighbors in enumerate(route_manager.csr.adjacency) for v in neighbors]
+        moves = [(rng.choice(nodes), rng.choice(nodes)) for _ in range(10000)]
+        # Half of the checked moves are real edges so both outcomes are timed
+        moves[::2] = [rng.choice(edges) for _ in range(len(moves[::2]))]
+
+        results["pick_random_route"] = measure(_seeded(lambda: route_manager.pick_random_route(2), seed),
+                                               repeat, number=200)
+        results["check_valid_move"] = measure(lambda: [route_manager.check_valid_move(u, v) for u, v in moves],
+                                              repeat)
+        results["check_valid_move"]["calls_per_round"] = len(moves)
+        results["get_neighbors"] = measure(lambda: [route_manager.get_neighbors(u) for u, _ in moves], repeat)
+        results["get_neighbors"]["calls_per_round"] = len(moves)
+        results["find_routes_with_min_stops"] = measure(lambda: route_manager.find_routes_with_min_stops(2),
+                                                        repeat)
+
+        # Fresh routers so every round pays for its searches and trees
+        from geo import GreatCircleRouter
+
+        pairs = [rng.sample(nodes, 2) for _ in range(20)]
+        coordinates = route_manager.node_coordinates() if granularity == "airport" else None
+        results["great_circle.shortest_path"] = measure(
+            lambda: [GreatCircleRouter(route_manager.csr, coordinates).shortest_path(u, v) for u, v in pairs], repeat)
+        results["great_circle.shortest_path"]["calls_per_round"] = len(pairs)
+        results["great_circle.tree"] = measure(
+            lambda: [GreatCircleRouter(route_manager.csr).tree(v) for _, v in pairs], repeat)
+        results["great_circle.tree"]["calls_per_round"] = len(pairs)
+
+        if include_tester:
+            import route_tester
+
+            results["tester.find_paths_with_exact_length"] = measure(
+                lambda: route_tester.find_paths_with_exact_length(route_manager, 3), repeat)
+            results["tester.find_paths_with_exact_length.walk"] = measure(
+                lambda: route_tester.find_paths_with_exact_length(route_manager, 5, mode="walk"), repeat)
+            pair = random.Random(seed).sample(nodes, 2)
+            results["tester.find_path_with_exact_length_between_countries"] = measure(
+                _quiet(lambda: route_tester.find_path_with_exact_length_between_countries(*pair, route_manager, 6)),
+                repeat)
+            results["tester.list_random_examples"] = measure(
+                _quiet(_seeded(lambda: route_tester.list_random_examples(route_manager, 5, 2, 5), seed)), repeat)
+            results["tester.print_route_statistics"] = measure(
+                _quiet(_uncached_statistics(lambda: route_tester.print_route_statistics(route_manager))), repeat)
+
+    for result in results.values():
+        result["nodes"] = len(route_manager.countries)
+        result["edges"] = route_manager.csr.number_of_edges()
+    return results
+
+
+def _latency_summary(latencies):
+    latencies = sorted(latencies)
+    total = sum(latencies)
+    return {"median_s": statistics.median(latencies), "min_s": latencies[0], "mean_s": total / len(latencies),
+            "p95_s": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+            "requests": len(latencies), "throughput_rps": len(latencies) / total if total else 0.0}
+
+
+def app_benchmarks(games=200, seed=0):
+    """Request latency and throughput of / and /play through the Flask test client
+
+    Every game is started with / and then played along its optimal path, so
+    /play covers both the resolver and the move check.
+    """
+    os.environ.setdefault("SESSION_KEY", "benchmark")
+    import app as game_app
+
+    random.seed(seed)
+    client = game_app.app.test_client()
+    latencies = {"/": [], "/play": []}
+    for _ in range(games):
+        start = time.perf_counter()
+        client.get("/")
+        latencies["/"].append(time.perf_counter() - start)
+
+        with client.session_transaction() as session:
+            state = game_app.game_store.get(session["game_id"])
+        for country_id in state.correct_path[1:]:
+            country = game_app.route_manager.countries[country_id]
+            start = time.perf_counter()
+            client.post("/play", data={"next_country": country})
+            latencies["/play"].append(time.perf_counter() - start)
+
+    return {f"app.{endpoint}": _latency_summary(values) for endpoint, values in latencies.items()}
+
+
+def scaling_benchmarks(sizes=SCALING_SIZES, granularity="country", repeat=3, seed=0):
+    """Construction and query timings on synthetic networks of growing size, for charting"""
+    from synthetic_routes import write_network
+
+    results = {}
+    for countries, airports_per_country, routes in sizes:
+        with tempfile.TemporaryDirectory() as workdir:
+            routes_file, airports_file = write_network(workdir, countries=countries,
+                                                       airports_per_country=airports_per_country,
+                                                       routes=routes, seed=seed)
+            size_results = route_manager_benchmarks(routes_file, airports_file, granularity, repeat, seed,
+                                                    include_tester=False)
+        for name, result in size_results.items():
+            result.update(countries=countries, airports=countries * airports_per_country, routes=routes)
+            results[f"scaling.{countries}x{airports_per_country}x{routes}.{name}"] = result
+    return results
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD, metric="median_s"):
+    """Compare one timing metric with a baseline run
+
+    Returns rows of (name, baseline seconds, current seconds, ratio, status)
+    for benchmarks present in both, where status is "regression",
+    "improvement" or "ok".
+    """
+    rows = []
+    for name, result in results.items():
+        old = baseline.get("results", {}).get(name)
+        if old is None or not old.get(metric):
+            continue
+        ratio = result[metric] / old[metric]
+        status = "regression" if ratio > 1 + threshold else "improvement" if ratio < 1 / (1 + threshold) else "ok"
+        rows.append((name, old[metric], result[metric], ratio, status))
+    return rows
+
+
+def environment():
+    return {"python": platform.python_version(), "implementation": platform.python_implementation(),
+            "platform": platform.platform(), "machine": platform.machine(), "cpus": os.cpu_count(),
+            "numpy": np.__version__, "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z")}
+
+
+def main(argv=None):
+    """Run the suite, write JSON and optionally compare it with a baseline file"""
+    parser = argparse.ArgumentParser(description="Benchmark RouteManager, route_tester and the game endpoints")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file for the results")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="relative slowdown reported as a regression")
+    parser.add_argument("--metric", choices=("median_s", "min_s"), default="median_s",
+                        help="timing compared with the baseline; min_s is less sensitive to a noisy machine")
+    parser.add_argument("--repeat", type=int, default=5, help="timed rounds per benchmark")
+    parser.add_argument("--games", type=int, default=200, help="games played through the Flask test client")
+    parser.add_argument("--granularity", choices=("country", "city", "airport"), default="country")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-app", action="store_true", help="skip the Flask endpoint benchmarks")
+    parser.add_argument("--scaling", action="store_true", help="also run the synthetic scaling benchmarks")
+    args = parser.parse_args(argv)
+
+    results = route_manager_benchmarks(granularity=args.granularity, repeat=args.repeat, seed=args.seed)
+    if not args.skip_app:
+        results.update(app_benchmarks(args.games, args.seed))
+    if args.scaling:
+        results.update(scaling_benchmarks(granularity=args.granularity, repeat=min(args.repeat, 3),
+                                          seed=args.seed))
+
+    report = {"environment": environment(), "settings": vars(args), "results": results}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'benchmark':<56} {'median':>12}")
+    for name, result in results.items():
+        print(f"{name:<56} {result['median_s'] * 1000:>9.3f} ms")
+    print(f"\nResults written to '{args.output}'.")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows = compare(results, baseline, args.threshold, args.metric)
+        print(f"\n{'benchmark':<56} {'baseline':>12} {'current':>12} {'ratio':>7}")
+        for name, old, new, ratio, status in rows:
+            flag = "  REGRESSION" if status == "regression" else "  faster" if status == "improvement" else ""
+            print(f"{name:<56} {old * 1000:>9.3f} ms {new * 1000:>9.3f} ms {ratio:>6.2f}x{flag}")
+        regressions = [row for row in rows if row[4] == "regression"]
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}.")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,26 @@
+import csv
+
+
+def read_columns(path, columns):
+    """The named columns of a CSV file as {name: list of strings}, using only the stdlib csv module
+
+    Rows are streamed and only the requested fields are kept, so this needs
+    neither pandas nor memory for the columns it skips. Raises KeyError for
+    a column missing from the header.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        positions = [header.index(name) if name in header else None for name in columns]
+        missing = [name for name, position in zip(columns, positions) if position is None]
+        if missing:
+            raise KeyError(f"{path} has no column {', '.join(missing)}")
+
+        values = [[] for _ in columns]
+        appends = [(column.append, position) for column, position in zip(values, positions)]
+        for row in reader:
+            if not row:
+                continue
+            for append, position in appends:
+                append(row[position])
+    return dict(zip(columns, values))
@@ -0,0 +1,277 @@
+import random
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+# Bytes the batched all-pairs search may use for one block of target columns
+DEFAULT_BLOCK_BUDGET = 64 * 1024 * 1024
+
+
+def _segment_sums(values, indptr, degrees, reduce=np.add):
+    """Per-node reduction of values laid out along CSR rows; 0 / False for nodes without edges
+
+    reduceat returns the first element of an empty segment instead of the
+    identity and rejects offsets equal to the length, so the input is padded
+    and empty rows are masked.
+    """
+    padded = np.concatenate([values, np.zeros((1,) + values.shape[1:], dtype=values.dtype)])
+    result = reduce.reduceat(padded, indptr[:-1], axis=0)
+    result[degrees == 0] = 0
+    return result
+
+
+class ExactLengthPaths:
+    """Exact-length route queries on a CSRGraph by dynamic programming over hop layers
+
+    A walk here is a sequence of flights that only reaches the target with
+    its last flight, as in the original recursive search; a simple path
+    additionally visits no node twice. For a target t, layer j is the vector
+    of the number of j-flight walks from every node to t, computed as
+    layer[j] = A @ layer[j - 1] with t removed as an intermediate stop. The
+    layers answer existence and counts exactly (Python ints, so no overflow)
+    and guide every search so that it only follows flights from which the
+    target is still reachable in the remaining number of hops; the searches
+    use boolean versions of the layers, which are cheaper to build.
+
+    Layers are cached for the max_cached_targets most recently used targets.
+    """
+
+    def __init__(self, csr, max_cached_targets=64):
+        self.csr = csr
+        self.max_cached_targets = max_cached_targets
+        self._degrees = np.diff(csr.indptr)
+        self._layers = OrderedDict()
+        self._reach = OrderedDict()
+
+    def _ids(self, source, target):
+        node_ids = self.csr.node_ids
+        if source not in node_ids or target not in node_ids:
+            raise KeyError(source if source not in node_ids else target)
+        return node_ids[source], node_ids[target]
+
+    def _names(self, ids):
+        return [self.csr.nodes[i] for i in ids]
+
+    def layers(self, target_id, length):
+        """Walk counts to target_id for 0..length hops, as a list of object arrays"""
+        layers = self._layers.get(target_id)
+        if layers is None:
+            first = np.zeros(len(self.csr.nodes), dtype=object)
+            first[target_id] = 1
+            layers = [first]
+        else:
+            self._layers.move_to_end(target_id)
+
+        indices, indptr = self.csr.indices, self.csr.indptr
+        while len(layers) <= length:
+            step = _segment_sums(layers[-1][indices], indptr, self._degrees)
+            step[target_id] = 0  # the target may only be reached by the last flight
+            layers.append(step)
+
+        self._layers[target_id] = layers
+        while len(self._layers) > self.max_cached_targets:
+            self._layers.popitem(last=False)
+        return layers
+
+    def reach_layers(self, target_id, length):
+        """Boolean layers: whether any walk to target_id exists for 0..length hops
+
+        Enough to guide the searches, and much cheaper than the exact counts.
+        """
+        layers = self._reach.get(target_id)
+        if layers is None:
+            first = np.zeros(len(self.csr.nodes), dtype=bool)
+            first[target_id] = True
+            layers = [first]
+        else:
+            self._reach.move_to_end(target_id)
+
+        indices, indptr = self.csr.indices, self.csr.indptr
+        while len(layers) <= length:
+            step = _segment_sums(layers[-1][indices], indptr, self._degrees, reduce=np.logical_or)
+            step[target_id] = False
+            layers.append(step)
+
+        self._reach[target_id] = layers
+        while len(self._reach) > self.max_cached_targets:
+            self._reach.popitem(last=False)
+        return layers
+
+    def count_walks(self, source, target, length):
+        """Number of walks with exactly length flights from source to target"""
+        source_id, target_id = self._ids(source, target)
+        if length == 0:
+            return int(source_id == target_id)
+        return int(self.layers(target_id, length)[length][source_id])
+
+    def has_walk(self, source, target, length):
+        return self.count_walks(source, target, length) > 0
+
+    def iter_walks(self, source, target, length):
+        """Yield every walk of exactly length flights, lazily, in adjacency order
+
+        Each step only enters nodes that can still reach the target in the
+        remaining hops, so no branch is a dead end and the time between two
+        results is proportional to length times the out-degree.
+        """
+        yield from self._iter_paths(source, target, length, simple=False)
+
+    def walk(self, source, target, length):
+        """The first walk in adjacency order, or None"""
+        return next(self.iter_walks(source, target, length), None)
+
+    def random_walk(self, source, target, length, rng=None):
+        """A walk drawn uniformly from all walks of exactly length flights, or None
+
+        Each hop picks the next node with probability proportional to the
+        number of walks that finish from it.
+        """
+        rng = rng or random
+        source_id, target_id = self._ids(source, target)
+        if length == 0:
+            return [source] if source_id == target_id else None
+        layers = self.layers(target_id, length)
+        if not layers[length][source_id]:
+            return None
+
+        path = [source_id]
+        for remaining in range(length - 1, -1, -1):
+            neighbors = self.csr.adjacency[path[-1]]
+            pick = rng.randrange(int(layers[remaining + 1][path[-1]]))
+            for v in neighbors:
+                pick -= int(layers[remaining][v])
+                if pick < 0:
+                    path.append(v)
+                    break
+        return self._names(path)
+
+    def iter_simple_paths(self, source, target, length):
+        """Yield every path of exactly length flights that repeats no node, lazily
+
+        A depth-first search pruned by the walk layers: a branch is only
+        followed while a walk of the remaining length exists from its end.
+        Counting simple paths has no polynomial algorithm in general, but
+        this pruning cuts every branch that cannot finish on length alone.
+        """
+        yield from self._iter_paths(source, target, length, simple=True)
+
+    def _iter_paths(self, source, target, length, simple):
+        source_id, target_id = self._ids(source, target)
+        if length == 0:
+            if source_id == target_id:
+                yield [source]
+            return
+        layers = self.reach_layers(target_id, length)
+        for path in self._search(source_id, length, lambda remaining, v: layers[remaining][v], simple):
+            yield self._names(path)
+
+    def _search(self, source_id, length, viable, simple):
+        """Depth-first search over length-hop paths from source_id, entering v only if viable(remaining, v)"""
+        if not viable(length, source_id):
+            return
+        adjacency = self.csr.adjacency
+        path = [source_id]
+        visited = {source_id}
+        stack = [iter(adjacency[source_id])]
+        while stack:
+            remaining = length - len(path)
+            for v in stack[-1]:
+                if (simple and v in visited) or not viable(remaining, v):
+                    continue
+                if remaining == 0:
+                    yield path + [v]
+                    continue
+                path.append(v)
+                visited.add(v)
+                stack.append(iter(adjacency[v]))
+                break
+            else:
+                stack.pop()
+                visited.discard(path.pop())
+
+    def simple_path(self, source, target, length):
+        """The first simple path in adjacency order, or None"""
+        return next(self.iter_simple_paths(source, target, length), None)
+
+    def has_simple_path(self, source, target, length):
+        return self.simple_path(source, target, length) is not None
+
+    def count_simple_paths(self, source, target, length, limit=None):
+        """Number of simple paths of exactly length flights, counting at most limit"""
+        count = 0
+        for _ in self.iter_simple_paths(source, target, length):
+            count += 1
+            if limit is not None and count >= limit:
+                break
+        return count
+
+    def random_simple_path(self, source, target, length, rng=None, max_attempts=1000, enumeration_limit=100000):
+        """A simple path drawn uniformly at random, or None
+
+        Uniform walks are drawn until one repeats no node, which is uniform
+        over simple paths. If that keeps failing, the simple paths are listed
+        (up to enumeration_limit) and one is chosen from the list.
+        """
+        rng = rng or random
+        if not self.has_walk(source, target, length):
+            return None
+        for _ in range(max_attempts):
+            path = self.random_walk(source, target, length, rng)
+            if len(set(path)) == len(path):
+                return path
+
+        paths = []
+        for path in self.iter_simple_paths(source, target, length):
+            paths.append(path)
+            if len(paths) > enumeration_limit:
+                return None
+        return rng.choice(paths) if paths else None
+
+    def all_pairs(self, length, simple=False, block_budget=DEFAULT_BLOCK_BUDGET):
+        """Yield (source, target, path) for every pair joined by an exactly length-flight walk
+
+        The layers of a whole block of targets are computed together as
+        boolean matrices, with as many target columns per block as fit
+        block_budget. Pairs come target by target, each with the first walk
+        in adjacency order, or with simple=True the first simple path (pairs
+        without one are skipped).
+        """
+        csr = self.csr
+        n = len(csr.nodes)
+        if length < 1 or n == 0:
+            return
+        indices, indptr = csr.indices, csr.indptr
+        bytes_per_column = max(len(indices), n) + n * (length + 1)
+        block = max(1, min(n, block_budget // max(bytes_per_column, 1)))
+
+        for start in range(0, n, block):
+            targets = np.arange(start, min(n, start + block))
+            columns = np.arange(len(targets))
+            layer = np.zeros((n, len(targets)), dtype=bool)
+            layer[targets, columns] = True
+            layers = [layer]
+            for _ in range(length):
+                layer = _segment_sums(layer[indices], indptr, self._degrees, reduce=np.logical_or)
+                layer[targets, columns] = False
+                layers.append(layer)
+            # One plain list per target column keeps the per-hop lookups cheap
+            column_layers = [[layers[j][:, column].tolist() for j in range(length + 1)] for column in columns]
+
+            target_columns, sources = np.nonzero(layers[length].T)
+            for column, source_id in zip(target_columns.tolist(), sources.tolist()):
+                viable = column_layers[column]
+                path = next(self._search(source_id, length, lambda remaining, v: viable[remaining][v], simple), None)
+                if path is not None:
+                    yield csr.nodes[source_id], csr.nodes[int(targets[column])], self._names(path)
+
+
+_engines = weakref.WeakKeyDictionary()
+
+
+def engine_for(csr):
+    """The shared ExactLengthPaths for a graph, so its layer cache survives between calls"""
+    engine = _engines.get(csr)
+    if engine is None:
+        engine = _engines[csr] = ExactLengthPaths(csr)
+    return engine
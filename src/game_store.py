@@ -0,0 +1,228 @@
+import os
+import sqlite3
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+# Default lifetime of an untouched game, in seconds
+DEFAULT_TTL = 6 * 60 * 60
+DEFAULT_MAX_GAMES = 50000
+
+_HEADER = struct.Struct("<BIIII")  # format version, source, destination, player and correct path lengths
+_FORMAT_VERSION = 1
+
+
+class GameState:
+    """One game in progress, with countries stored as RouteManager integer IDs
+
+    IDs are only meaningful for the graph they were taken from, so workers
+    that share a store must load the same snapshot.
+    """
+
+    __slots__ = ("source", "destination", "player_path", "correct_path")
+
+    def __init__(self, source, destination, player_path, correct_path):
+        self.source = source
+        self.destination = destination
+        self.player_path = list(player_path)
+        self.correct_path = list(correct_path)
+
+    def to_bytes(self):
+        """Compact binary form: a fixed header followed by uint32 path arrays"""
+        return _HEADER.pack(_FORMAT_VERSION, self.source, self.destination,
+                            len(self.player_path), len(self.correct_path)) + \
+            struct.pack(f"<{len(self.player_path) + len(self.correct_path)}I",
+                        *self.player_path, *self.correct_path)
+
+    @classmethod
+    def from_bytes(cls, data):
+        version, source, destination, player_length, correct_length = _HEADER.unpack_from(data)
+        if version != _FORMAT_VERSION:
+            raise ValueError(f"Unsupported game state format {version}")
+        ids = struct.unpack_from(f"<{player_length + correct_length}I", data, _HEADER.size)
+        return cls(source, destination, ids[:player_length], ids[player_length:])
+
+
+class GameStore:
+    """Base class with the counters shared by every backend
+
+    Subclasses implement _load, _save and _delete on encoded game states.
+    """
+
+    def __init__(self):
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.serialization_seconds = 0.0
+        self.serialization_count = 0
+
+    def get(self, game_id):
+        """Return the GameState for game_id, or None if it is unknown or expired"""
+        data = self._load(game_id) if game_id else None
+        if data is None:
+            self._count("misses")
+            return None
+
+        start = time.perf_counter()
+        state = GameState.from_bytes(data)
+        self._record_serialization(time.perf_counter() - start)
+        self._count("hits")
+        return state
+
+    def put(self, game_id, state):
+        start = time.perf_counter()
+        data = state.to_bytes()
+        self._record_serialization(time.perf_counter() - start)
+        self._save(game_id, data)
+
+    def delete(self, game_id):
+        if game_id:
+            self._delete(game_id)
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def _record_serialization(self, seconds):
+        with self._stats_lock:
+            self.serialization_seconds += seconds
+            self.serialization_count += 1
+
+    def stats(self):
+        """Counters since start-up (per process for shared backends)"""
+        with self._stats_lock:
+            count = self.serialization_count
+            return {
+                "backend": type(self).__name__,
+                "games": len(self),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "serializations": count,
+                "mean_serialization_us": self.serialization_seconds / count * 1e6 if count else 0.0,
+            }
+
+
+class MemoryGameStore(GameStore):
+    """In-process LRU with a sliding TTL; not shared between worker processes"""
+
+    def __init__(self, max_games=DEFAULT_MAX_GAMES, ttl=DEFAULT_TTL, clock=time.monotonic):
+        super().__init__()
+        self.max_games = max_games
+        self.ttl = ttl
+        self._clock = clock
+        self._games = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._games)
+
+    def _load(self, game_id):
+        with self._lock:
+            entry = self._games.get(game_id)
+            if entry is None:
+                return None
+            data, expires_at = entry
+            if expires_at <= self._clock():
+                del self._games[game_id]
+                self._count("expirations")
+                return None
+            self._games.move_to_end(game_id)
+            return data
+
+    def _save(self, game_id, data):
+        with self._lock:
+            self._games[game_id] = (data, self._clock() + self.ttl)
+            self._games.move_to_end(game_id)
+            evicted = 0
+            while len(self._games) > self.max_games:
+                self._games.popitem(last=False)
+                evicted += 1
+        if evicted:
+            self._count("evictions", evicted)
+
+    def _delete(self, game_id):
+        with self._lock:
+            self._games.pop(game_id, None)
+
+
+class SQLiteGameStore(GameStore):
+    """Game states in a local SQLite file that several worker processes can share
+
+    Expired rows are purged every purge_interval writes; when the table grows
+    past max_games the least recently written games are evicted.
+    """
+
+    def __init__(self, path, max_games=DEFAULT_MAX_GAMES, ttl=DEFAULT_TTL, purge_interval=256):
+        super().__init__()
+        self.path = path
+        self.max_games = max_games
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._local = threading.local()
+        self._writes = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS games ("
+                           "id TEXT PRIMARY KEY, data BLOB NOT NULL, updated_at REAL NOT NULL)")
+        connection.execute("CREATE INDEX IF NOT EXISTS games_updated_at ON games (updated_at)")
+        connection.commit()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM games").fetchone()[0]
+
+    def _load(self, game_id):
+        row = self._connection().execute("SELECT data, updated_at FROM games WHERE id = ?", (game_id,)).fetchone()
+        if row is None:
+            return None
+        data, updated_at = row
+        if updated_at + self.ttl <= time.time():
+            self._delete(game_id)
+            self._count("expirations")
+            return None
+        return data
+
+    def _save(self, game_id, data):
+        self._connection().execute("INSERT OR REPLACE INTO games (id, data, updated_at) VALUES (?, ?, ?)",
+                                   (game_id, data, time.time()))
+        with self._stats_lock:
+            self._writes += 1
+            purge = self._writes % self.purge_interval == 0
+        if purge:
+            self.purge()
+
+    def _delete(self, game_id):
+        self._connection().execute("DELETE FROM games WHERE id = ?", (game_id,))
+
+    def purge(self):
+        """Drop expired games, then the oldest ones beyond max_games"""
+        connection = self._connection()
+        expired = connection.execute("DELETE FROM games WHERE updated_at <= ?", (time.time() - self.ttl,)).rowcount
+        evicted = connection.execute(
+            "DELETE FROM games WHERE id IN (SELECT id FROM games ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_games,)).rowcount
+        self._count("expirations", max(expired, 0))
+        self._count("evictions", max(evicted, 0))
+
+
+def create_game_store(spec="memory", **options):
+    """Build a store from a spec string, either memory or sqlite:<path>"""
+    if spec == "memory":
+        return MemoryGameStore(**options)
+    if spec.startswith("sqlite:"):
+        return SQLiteGameStore(spec[len("sqlite:"):], **options)
+    raise ValueError(f"Unknown game store '{spec}', expected 'memory' or 'sqlite:<path>'")
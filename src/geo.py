@@ -0,0 +1,231 @@
+import heapq
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+# Mean Earth radius (IUGG), which keeps haversine distances within about 0.5% of the ellipsoid
+EARTH_RADIUS_KM = 6371.0088
+
+# How the airport-pair distances of an aggregated edge become one edge length
+DISTANCE_AGGREGATES = ("min", "median")
+
+DEFAULT_MAX_CACHED_TREES = 256
+
+# Approximate memory of one cached tree per node: a float object plus two list slots
+_TREE_BYTES_PER_NODE = 40
+
+# A* heuristics are scaled down by this much so float32 edge lengths can never make them overestimate
+_HEURISTIC_SLACK = 1.0 - 1e-6
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km between points given in degrees, element-wise over arrays"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(value, dtype=np.float64)) for value in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def mean_positions(groups, latitudes, longitudes, count):
+    """Spherical mean (latitude, longitude) in degrees of the points in each of count groups
+
+    groups holds the group number of every point. Points are averaged as unit
+    vectors, so groups spanning the antimeridian do not land on the far side
+    of the globe; groups without points get NaN.
+    """
+    lat, lon = np.radians(latitudes), np.radians(longitudes)
+    vectors = np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=1)
+    sums = np.zeros((count, 3))
+    np.add.at(sums, groups, vectors)
+    with np.errstate(invalid="ignore"):
+        latitude = np.degrees(np.arctan2(sums[:, 2], np.hypot(sums[:, 0], sums[:, 1])))
+        longitude = np.degrees(np.arctan2(sums[:, 1], sums[:, 0]))
+    empty = np.bincount(groups, minlength=count) == 0
+    latitude[empty] = longitude[empty] = np.nan
+    return np.stack([latitude, longitude], axis=1)
+
+
+class GreatCircleRouter:
+    """Shortest routes by flown kilometres on a CSRGraph whose edges carry distance_km
+
+    shortest_path runs A* towards the target. Given node coordinates whose
+    great-circle distances are a lower bound on the edge lengths (true at
+    airport granularity, where an edge is exactly that distance) the
+    heuristic is the distance left to the target; otherwise it is zero and
+    the search is plain Dijkstra.
+
+    Scoring needs the optimum from every node to one destination, so
+    tree(target) runs Dijkstra backwards from the target once and keeps the
+    resulting shortest-path tree for the max_cached_trees most recently used
+    destinations, fewer when max_tree_bytes would not hold that many.
+    """
+
+    def __init__(self, csr, coordinates=None, weight="distance_km", max_cached_trees=DEFAULT_MAX_CACHED_TREES,
+                 max_tree_bytes=None):
+        self.csr = csr
+        self.coordinates = coordinates
+        self.tree_bytes = len(csr.nodes) * _TREE_BYTES_PER_NODE
+        if max_tree_bytes is not None:
+            max_cached_trees = max(1, min(max_cached_trees, max_tree_bytes // max(self.tree_bytes, 1)))
+        self.max_cached_trees = max_cached_trees
+        weights = np.asarray(csr.edge_attributes[weight], dtype=np.float64)
+
+        n = len(csr.nodes)
+        indptr = csr.indptr.tolist()
+        weight_list = weights.tolist()
+        self._edges = [list(zip(csr.adjacency[u], weight_list[indptr[u]:indptr[u + 1]])) for u in range(n)]
+        self._edge_lengths = [dict(edges) for edges in self._edges]
+        # Reverse edges in reverse_indices order, for searches from the destination
+        reverse_indptr = csr.reverse_indptr.tolist()
+        reverse_weights = weights[np.argsort(csr.indices, kind="stable")].tolist()
+        self._reverse_edges = [list(zip(csr.reverse_adjacency[v],
+                                        reverse_weights[reverse_indptr[v]:reverse_indptr[v + 1]])) for v in range(n)]
+
+        self._trees = OrderedDict()
+        self._trees_lock = threading.Lock()
+        self.tree_hits = 0
+        self.tree_misses = 0
+
+    def _id(self, node):
+        node_id = self.csr.node_ids.get(node)
+        if node_id is None:
+            raise KeyError(node)
+        return node_id
+
+    def path_km(self, path):
+        """Kilometres flown along a path of node names, or None if a flight in it does not exist"""
+        ids = [self.csr.node_ids.get(node) for node in path]
+        total = 0.0
+        for u, v in zip(ids[:-1], ids[1:]):
+            length = self._edge_lengths[u].get(v) if u is not None else None
+            if length is None:
+                return None
+            total += length
+        return total
+
+    def _heuristic(self, target_id):
+        if self.coordinates is None:
+            return None
+        latitudes, longitudes = self.coordinates[:, 0], self.coordinates[:, 1]
+        remaining = haversine_km(latitudes, longitudes, latitudes[target_id], longitudes[target_id])
+        return (np.nan_to_num(remaining, nan=0.0) * _HEURISTIC_SLACK).tolist()
+
+    def shortest_path(self, source, target):
+        """(km, path) of the shortest route by distance, or (None, None) when target is unreachable
+
+        Served from a cached tree for target when there is one.
+        """
+        source_id, target_id = self._id(source), self._id(target)
+        with self._trees_lock:
+            tree = self._trees.get(target_id)
+        if tree is not None:
+            return self._tree_path(tree, source_id)
+
+        heuristic = self._heuristic(target_id)
+        distance = {source_id: 0.0}
+        parent = {source_id: None}
+        queue = [(heuristic[source_id] if heuristic else 0.0, 0.0, source_id)]
+        while queue:
+            _, km, u = heapq.heappop(queue)
+            if u == target_id:
+                path = []
+                while u is not None:
+                    path.append(self.csr.nodes[u])
+                    u = parent[u]
+                return km, path[::-1]
+            if km > distance[u]:
+                continue
+            for v, length in self._edges[u]:
+                candidate = km + length
+                if candidate < distance.get(v, float("inf")):
+                    distance[v] = candidate
+                    parent[v] = u
+                    heapq.heappush(queue, (candidate + (heuristic[v] if heuristic else 0.0), candidate, v))
+        return None, None
+
+    def tree(self, target):
+        """Shortest-path tree towards target as (km to target, next node) lists indexed by node ID
+
+        Unreachable nodes have km None.
+        """
+        target_id = self._id(target)
+        with self._trees_lock:
+            tree = self._trees.get(target_id)
+            if tree is not None:
+                self._trees.move_to_end(target_id)
+                self.tree_hits += 1
+                return tree
+            self.tree_misses += 1
+
+        n = len(self.csr.nodes)
+        distance = [None] * n
+        next_hop = [None] * n
+        best = {target_id: 0.0}
+        queue = [(0.0, target_id)]
+        while queue:
+            km, v = heapq.heappop(queue)
+            if distance[v] is not None:
+                continue
+            distance[v] = km
+            for u, length in self._reverse_edges[v]:
+                candidate = km + length
+                if distance[u] is None and candidate < best.get(u, float("inf")):
+                    best[u] = candidate
+                    next_hop[u] = v
+                    heapq.heappush(queue, (candidate, u))
+
+        tree = (distance, next_hop)
+        with self._trees_lock:
+            self._trees[target_id] = tree
+            while len(self._trees) > self.max_cached_trees:
+                self._trees.popitem(last=False)
+        return tree
+
+    def _tree_path(self, tree, source_id):
+        distance, next_hop = tree
+        if distance[source_id] is None:
+            return None, None
+        path = [source_id]
+        while next_hop[path[-1]] is not None:
+            path.append(next_hop[path[-1]])
+        return distance[source_id], [self.csr.nodes[u] for u in path]
+
+    def distance(self, source, target):
+        """Kilometres of the shortest route from source to target, or None"""
+        return self.tree(target)[0][self._id(source)]
+
+    def score(self, path):
+        """Compare the kilometres flown along path with the shortest route between its ends
+
+        Returns a dict with player_km, optimal_km and optimal_path (the km
+        values are None when path uses a missing flight or no route exists).
+        """
+        distance, next_hop = self.tree(path[-1])
+        optimal_km, optimal_path = self._tree_path((distance, next_hop), self._id(path[0]))
+        return {"player_km": self.path_km(path), "optimal_km": optimal_km, "optimal_path": optimal_path}
+
+    def cache_info(self):
+        with self._trees_lock:
+            return {"trees": len(self._trees), "max_trees": self.max_cached_trees,
+                    "bytes": len(self._trees) * self.tree_bytes, "hits": self.tree_hits, "misses": self.tree_misses}
+
+
+_routers = weakref.WeakKeyDictionary()
+_routers_lock = threading.Lock()
+
+
+def router_for(csr, coordinates=None, max_tree_bytes=None):
+    """The shared GreatCircleRouter for a graph, so its tree cache survives between requests"""
+    with _routers_lock:
+        router = _routers.get(csr)
+        if router is None:
+            router = _routers[csr] = GreatCircleRouter(csr, coordinates, max_tree_bytes=max_tree_bytes)
+        return router
+
+
+def router_cache_info(csr):
+    """cache_info of the graph's shared router, or None when no router was created for it"""
+    with _routers_lock:
+        router = _routers.get(csr)
+    return router.cache_info() if router is not None else None
@@ -0,0 +1,81 @@
+import gzip
+import hashlib
+import json
+import threading
+
+from route_stats import graph_version
+
+# Version of the JSON layout served under /api/v1
+API_VERSION = 1
+
+
+class Payload:
+    """A JSON response body encoded once, with its gzip form and ETag"""
+
+    __slots__ = ("body", "gzipped", "etag")
+
+    def __init__(self, data):
+        self.body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.gzipped = gzip.compress(self.body, compresslevel=9, mtime=0)
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+
+
+class GraphPayloads:
+    """Read-only JSON views of one graph version, encoded on first use and then reused
+
+    countries lists node names in ID order; graph adds every node's
+    neighbors as IDs into that list, which is all a client needs to validate
+    moves locally; neighbors(name) is one node's neighbor names.
+    """
+
+    def __init__(self, csr):
+        self.csr = csr
+        self.version = graph_version(csr)[:16]
+        self._countries = None
+        self._graph = None
+        self._neighbors = {}
+        self._lock = threading.Lock()
+
+    @property
+    def countries(self):
+        if self._countries is None:
+            self._countries = Payload({"api": API_VERSION, "version": self.version, "countries": self.csr.nodes})
+        return self._countries
+
+    @property
+    def graph(self):
+        if self._graph is None:
+            self._graph = Payload({"api": API_VERSION, "version": self.version, "countries": self.csr.nodes,
+                                   "neighbors": self.csr.adjacency})
+        return self._graph
+
+    def neighbors(self, country):
+        """Payload with country's neighbors, or None for an unknown country"""
+        payload = self._neighbors.get(country)
+        if payload is None:
+            if country not in self.csr.node_ids:
+                return None
+            payload = Payload({"api": API_VERSION, "version": self.version, "country": country,
+                               "neighbors": self.csr.neighbors(country)})
+            with self._lock:
+                payload = self._neighbors.setdefault(country, payload)
+        return payload
+
+
+class GraphAPI:
+    """GraphPayloads for the RouteManager's current graph, replaced when the routes change"""
+
+    def __init__(self, route_manager):
+        self.route_manager = route_manager
+        self._payloads = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        csr = self.route_manager.csr
+        payloads = self._payloads
+        if payloads is None or payloads.csr is not csr:
+            with self._lock:
+                if self._payloads is None or self._payloads.csr is not csr:
+                    self._payloads = GraphPayloads(csr)
+                payloads = self._payloads
+        return payloads
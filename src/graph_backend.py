@@ -0,0 +1,311 @@
+import argparse
+import random
+import timeit
+import tracemalloc
+
+import numpy as np
+
+# Hop count stored for node pairs that have no connecting path
+UNREACHABLE = 255
+
+
+def bfs(adjacency, source):
+    """Hop distances from source over adjacency lists, UNREACHABLE where there is no path"""
+    row = [UNREACHABLE] * len(adjacency)
+    row[source] = 0
+    frontier = [source]
+    depth = 0
+    while frontier:
+        depth += 1
+        next_frontier = []
+        for u in frontier:
+            for v in adjacency[u]:
+                if row[v] == UNREACHABLE:
+                    row[v] = depth
+                    next_frontier.append(v)
+        frontier = next_frontier
+    return row
+
+
+class CSRGraph:
+    """Directed graph over dense integer node IDs, stored as CSR arrays
+
+    Forward and reverse adjacency are kept as (indptr, indices) pairs and every
+    node has a neighbor bitset, so has_edge is a single bit test. Node names are
+    only used at the API boundary.
+    """
+
+    def __init__(self, nodes, indptr, indices, edge_attributes=None):
+        self.nodes = list(nodes)
+        self.node_ids = {node: i for i, node in enumerate(self.nodes)}
+        self.indptr = np.asarray(indptr, dtype=np.int32)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.edge_attributes = dict(edge_attributes or {})
+
+        n = len(self.nodes)
+        sources = np.repeat(np.arange(n, dtype=np.int32), np.diff(self.indptr))
+        order = np.argsort(self.indices, kind="stable")
+        self.reverse_indptr = np.zeros(n + 1, dtype=np.int32)
+        self.reverse_indptr[1:] = np.cumsum(np.bincount(self.indices, minlength=n))
+        self.reverse_indices = sources[order]
+
+        # Plain Python lists and ints are what the per-request hot paths touch
+        indptr_list = self.indptr.tolist()
+        indices_list = self.indices.tolist()
+        self.adjacency = [indices_list[indptr_list[u]:indptr_list[u + 1]] for u in range(n)]
+        reverse_indptr_list = self.reverse_indptr.tolist()
+        reverse_indices_list = self.reverse_indices.tolist()
+        self.reverse_adjacency = [reverse_indices_list[reverse_indptr_list[v]:reverse_indptr_list[v + 1]]
+                                  for v in range(n)]
+        self._neighbor_names = [tuple(self.nodes[v] for v in neighbors) for neighbors in self.adjacency]
+        self.neighbor_bits = [sum(1 << v for v in set(neighbors)) for neighbors in self.adjacency]
+
+    @classmethod
+    def from_edges(cls, edges, nodes=None, edge_attributes=None):
+        """Build from (source, target) name pairs, keeping first-appearance order
+
+        Nodes are numbered in order of first appearance (or the given order)
+        and each adjacency row keeps the order in which its edges appear.
+        """
+        edges = list(edges)
+        if nodes is None:
+            nodes = list(dict.fromkeys(node for edge in edges for node in edge))
+        node_ids = {node: i for i, node in enumerate(nodes)}
+
+        sources = np.array([node_ids[u] for u, _ in edges], dtype=np.int32)
+        targets = np.array([node_ids[v] for _, v in edges], dtype=np.int32)
+        order = np.argsort(sources, kind="stable")
+        indptr = np.zeros(len(nodes) + 1, dtype=np.int32)
+        indptr[1:] = np.cumsum(np.bincount(sources, minlength=len(nodes)))
+
+        attributes = {name: np.asarray(values)[order] for name, values in (edge_attributes or {}).items()}
+        return cls(nodes, indptr, targets[order], attributes)
+
+    def __contains__(self, node):
+        return node in self.node_ids
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def number_of_edges(self):
+        return len(self.indices)
+
+    def neighbors(self, node):
+        """Names of the direct destinations of node"""
+        node_id = self.node_ids.get(node)
+        if node_id is None:
+            return []
+        return list(self._neighbor_names[node_id])
+
+    def has_edge(self, source, target):
+        """Bit test against the source's neighbor bitset"""
+        u = self.node_ids.get(source)
+        v = self.node_ids.get(target)
+        if u is None or v is None:
+            return False
+        return (self.neighbor_bits[u] >> v) & 1 == 1
+
+    def out_degree(self):
+        return dict(zip(self.nodes, np.diff(self.indptr).tolist()))
+
+    def in_degree(self):
+        return dict(zip(self.nodes, np.diff(self.reverse_indptr).tolist()))
+
+    def edge_position(self, u, v):
+        """Index of edge (u, v) in indices / edge_attributes, or None"""
+        start, end = self.indptr[u], self.indptr[u + 1]
+        positions = np.flatnonzero(self.indices[start:end] == v)
+        return None if len(positions) == 0 else int(start + positions[0])
+
+    def bfs(self, source, reverse=False):
+        """Hop distances from source (or to it, if reverse) as a list, UNREACHABLE if none"""
+        return bfs(self.reverse_adjacency if reverse else self.adjacency, source)
+
+    def shortest_path_count(self, source, target):
+        """Number of distinct shortest paths from source to target, 0 if there is none
+
+        A BFS from source that accumulates path counts level by level and stops
+        at the level that reaches target.
+        """
+        if source == target:
+            return 1
+        counts = {source: 1}
+        frontier = [source]
+        while frontier and target not in counts:
+            next_counts = {}
+            for u in frontier:
+                for v in self.adjacency[u]:
+                    if v not in counts:
+                        next_counts[v] = next_counts.get(v, 0) + counts[u]
+            counts.update(next_counts)
+            frontier = list(next_counts)
+        return counts.get(target, 0)
+
+    def bidirectional_path(self, source, target):
+        """One shortest path from source to target as a list of IDs, or None
+
+        Expands whichever frontier is smaller, so only a small part of a
+        large graph is visited for nearby pairs.
+        """
+        if source == target:
+            return [source]
+        forward_parents = {source: None}
+        backward_parents = {target: None}
+        forward_frontier = [source]
+        backward_frontier = [target]
+
+        while forward_frontier and backward_frontier:
+            if len(forward_frontier) <= len(backward_frontier):
+                frontier, parents, other, adjacency = (forward_frontier, forward_parents, backward_parents,
+                                                       self.adjacency)
+            else:
+                frontier, parents, other, adjacency = (backward_frontier, backward_parents, forward_parents,
+                                                       self.reverse_adjacency)
+
+            next_frontier = []
+            meeting = None
+            for u in frontier:
+                for v in adjacency[u]:
+                    if v not in parents:
+                        parents[v] = u
+                        next_frontier.append(v)
+                        if v in other and meeting is None:
+                            meeting = v
+            if meeting is not None:
+                return self._join_paths(meeting, forward_parents, backward_parents)
+
+            if frontier is forward_frontier:
+                forward_frontier = next_frontier
+            else:
+                backward_frontier = next_frontier
+        return None
+
+    @staticmethod
+    def _join_paths(meeting, forward_parents, backward_parents):
+        path = []
+        node = meeting
+        while node is not None:
+            path.append(node)
+            node = forward_parents[node]
+        path.reverse()
+        node = backward_parents[meeting]
+        while node is not None:
+            path.append(node)
+            node = backward_parents[node]
+        return path
+
+    def to_networkx(self):
+        """Materialize a networkx DiGraph with the same node, neighbor and attribute order"""
+        import networkx as nx
+
+        graph = nx.DiGraph()
+        graph.add_nodes_from(self.nodes)
+        names = list(self.edge_attributes)
+        edge_values = zip(*(self.edge_attributes[name].tolist() for name in names))
+        graph.add_edges_from(
+            (self.nodes[u], self.nodes[v], dict(zip(names, next(edge_values))))
+            for u, neighbors in enumerate(self.adjacency) for v in neighbors)
+        return graph
+
+
+class NetworkXGraph:
+    """The original networkx-backed move checks, kept for comparison"""
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __contains__(self, node):
+        return node in self.graph
+
+    def __len__(self):
+        return self.graph.number_of_nodes()
+
+    def number_of_edges(self):
+        return self.graph.number_of_edges()
+
+    def neighbors(self, node):
+        if node in self.graph:
+            return list(self.graph.neighbors(node))
+        return []
+
+    def has_edge(self, source, target):
+        return target in self.neighbors(source)
+
+    def out_degree(self):
+        return dict(self.graph.out_degree())
+
+    def in_degree(self):
+        return dict(self.graph.in_degree())
+
+
+def _measure(build):
+    """Run build() under tracemalloc and return (result, bytes still allocated)"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return result, after - before
+
+
+def compare_backends(route_manager, samples=10000, seed=0):
+    """Measure memory and per-call latency of both backends on the same graph
+
+    Returns {backend name: {"memory_bytes", "get_neighbors_ns", "check_valid_move_ns"}}.
+    """
+    import networkx  # noqa: F401  (imported up front so it is not counted as backend memory)
+
+    csr = route_manager.csr
+    edges = [(csr.nodes[u], csr.nodes[v]) for u, neighbors in enumerate(csr.adjacency) for v in neighbors]
+
+    backends = {
+        "csr": _measure(lambda: CSRGraph(csr.nodes, csr.indptr.copy(), csr.indices.copy())),
+        "networkx": _measure(lambda: NetworkXGraph(_networkx_from_edges(csr.nodes, edges))),
+    }
+
+    rng = random.Random(seed)
+    queries = [(rng.choice(csr.nodes), rng.choice(csr.nodes)) for _ in range(samples)]
+    # Half of the move checks hit real edges so both branches are exercised
+    queries[::2] = [rng.choice(edges) for _ in range(len(queries[::2]))]
+
+    report = {}
+    for name, (backend, memory) in backends.items():
+        neighbors_time = timeit.timeit(lambda: [backend.neighbors(u) for u, _ in queries], number=1)
+        move_time = timeit.timeit(lambda: [backend.has_edge(u, v) for u, v in queries], number=1)
+        report[name] = {
+            "memory_bytes": memory,
+            "get_neighbors_ns": neighbors_time / samples * 1e9,
+            "check_valid_move_ns": move_time / samples * 1e9,
+        }
+    return report
+
+
+def _networkx_from_edges(nodes, edges):
+    import networkx as nx
+
+    graph = nx.DiGraph()
+    graph.add_nodes_from(nodes)
+    graph.add_edges_from(edges)
+    return graph
+
+
+def main(argv=None):
+    """Print memory and latency of the CSR and networkx backends side by side"""
+    from route import RouteManager
+
+    parser = argparse.ArgumentParser(description="Compare RouteManager graph backends")
+    parser.add_argument("--samples", type=int, default=10000, help="calls timed per operation")
+    args = parser.parse_args(argv)
+
+    report = compare_backends(RouteManager(), samples=args.samples)
+
+    print(f"{'backend':<10} {'memory':>12} {'get_neighbors':>16} {'check_valid_move':>18}")
+    for name, row in report.items():
+        print(f"{name:<10} {row['memory_bytes'] / 1024:>9.1f} KiB {row['get_neighbors_ns']:>13.0f} ns "
+              f"{row['check_valid_move_ns']:>15.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
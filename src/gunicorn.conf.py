@@ -0,0 +1,25 @@
+# Pre-fork serving: gunicorn -c gunicorn.conf.py app:app (run from src/)
+#
+# The master builds the route snapshot once before forking and exports its
+# path; every worker then maps that file with RouteManager.attach instead of
+# parsing the CSVs itself. Games are kept in a SQLite store all workers share
+# (GAME_STORE, default sqlite:data/game_store.db); a per-process memory store
+# would lose a game whenever its next request reached another worker.
+import os
+
+from prefork import publish
+
+bind = os.getenv("BIND", "127.0.0.1:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+threads = int(os.getenv("WORKER_THREADS", "1"))
+
+os.environ.setdefault("GAME_STORE", "sqlite:data/game_store.db")
+if workers > 1 and not os.environ["GAME_STORE"].startswith("sqlite:"):
+    raise RuntimeError(f"GAME_STORE={os.environ['GAME_STORE']} is per process and cannot serve {workers} workers; "
+                       "use sqlite:<path>")
+
+
+def on_starting(server):
+    route_manager = publish(granularity=os.getenv("ROUTE_GRANULARITY", "country"))
+    server.log.info("Published %s route snapshot %s (%d nodes)", route_manager.granularity,
+                    route_manager.snapshot_file, len(route_manager.countries))
@@ -0,0 +1,465 @@
+import abc
+import argparse
+import contextlib
+import http.client
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+# Kinds of simulated player; see the Player subclasses below
+PLAYER_KINDS = ("optimal", "wanderer", "typo")
+
+DEFAULT_MIX = "optimal=2,wanderer=1,typo=1"
+
+# Moves a player makes in one game before giving up and restarting
+DEFAULT_MAX_MOVES = 30
+
+# Servers the harness can start itself
+SERVERS = ("werkzeug", "gunicorn")
+
+# The game settings the page embeds for its script, and the message shown after a rejected input
+_GAME_JSON = re.compile(r"const game = (\{.*?\});")
+_ERROR_TEXT = re.compile(r'<p id="error-text">(.*?)</p>', re.S)
+
+
+class Player(abc.ABC):
+    """A simulated player choosing the next country to type, given where it is and where it goes
+
+    Each player knows the route graph from its own RouteManager (the same
+    CSVs the server reads), so it plays without help from the server.
+    """
+
+    kind = None
+
+    def __init__(self, route_manager, rng):
+        self.route_manager = route_manager
+        self.rng = rng
+
+    @abc.abstractmethod
+    def next_input(self, current, destination, rejected):
+        """Text to submit to /play, or None when stuck; rejected is True when the previous input was refused"""
+
+
+class OptimalPlayer(Player):
+    """Always flies the next leg of a shortest path"""
+
+    kind = "optimal"
+
+    def next_input(self, current, destination, rejected):
+        path = self.route_manager.shortest_path(current, destination)
+        return path[1] if path else None
+
+
+class WanderingPlayer(Player):
+    """Flies to a random neighbor from get_neighbors, and to the destination once it is one"""
+
+    kind = "wanderer"
+
+    def next_input(self, current, destination, rejected):
+        neighbors = self.route_manager.get_neighbors(current)
+        if destination in neighbors:
+            return destination
+        return self.rng.choice(neighbors) if neighbors else None
+
+
+class TypoPlayer(OptimalPlayer):
+    """Heads for the destination but types misspelled or ambiguous names
+
+    Every move is first tried as an ambiguous prefix or a misspelling of the
+    intended country; after the server refuses one, the correct name is sent.
+    """
+
+    kind = "typo"
+
+    def __init__(self, route_manager, rng, ambiguous_prefixes=None):
+        super().__init__(route_manager, rng)
+        self.ambiguous_prefixes = ambiguous_prefixes or {}
+
+    def next_input(self, current, destination, rejected):
+        country = super().next_input(current, destination, rejected)
+        if country is None or rejected:
+            return country
+        prefix = self.ambiguous_prefixes.get(country)
+        if prefix and self.rng.random() < 0.5:
+            return prefix
+        return misspell(country, self.rng)
+
+
+def misspell(name, rng):
+    """name with one random typo: a swapped, dropped, doubled or replaced letter"""
+    if len(name) < 4:
+        return name.lower()
+    i = rng.randrange(1, len(name) - 1)
+    typo = rng.choice(("swap", "drop", "double", "replace"))
+    if typo == "swap":
+        return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+    if typo == "drop":
+        return name[:i] + name[i + 1:]
+    if typo == "double":
+        return name[:i] + name[i] + name[i:]
+    return name[:i] + rng.choice("abcdefghijklmnopqrstuvwxyz") + name[i + 1:]
+
+
+def ambiguous_prefixes(names, min_length=3):
+    """{name: its longest proper prefix that also starts another name}, for names that have one"""
+    lowered = [name.lower() for name in names]
+    prefixes = {}
+    for name, key in zip(names, lowered):
+        for length in range(len(key) - 1, min_length - 1, -1):
+            prefix = key[:length]
+            if sum(other.startswith(prefix) for other in lowered) > 1:
+                prefixes[name] = name[:length]
+                break
+    return prefixes
+
+
+PLAYER_CLASSES = {cls.kind: cls for cls in (OptimalPlayer, WanderingPlayer, TypoPlayer)}
+
+
+def parse_mix(text):
+    """Parse "optimal=2,wanderer=1" into [(kind, weight)]"""
+    mix = []
+    for item in text.split(","):
+        kind, _, weight = item.partition("=")
+        kind = kind.strip()
+        if kind not in PLAYER_KINDS:
+            raise ValueError(f"Unknown player kind '{kind}', expected one of {PLAYER_KINDS}")
+        mix.append((kind, int(weight or 1)))
+    return mix
+
+
+class Client:
+    """One player's HTTP session against the game: a keep-alive connection and the session cookie
+
+    Every request is timed and recorded in the shared Recorder under
+    "METHOD /path", whatever its outcome; redirects are not followed.
+    """
+
+    def __init__(self, host, port, recorder, timeout=30):
+        self.connection = http.client.HTTPConnection(host, port, timeout=timeout)
+        self.recorder = recorder
+        self.cookie = None
+
+    def request(self, method, path, form=None):
+        """(status, body) of one request, or (None, "") when it failed in transport"""
+        headers = {"Cookie": self.cookie} if self.cookie else {}
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        endpoint = f"{method} {path.split('?')[0]}"
+        start = time.perf_counter()
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            text = response.read().decode("utf-8", "replace")
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.recorder.record(endpoint, time.perf_counter() - start, None)
+            return None, ""
+        self.recorder.record(endpoint, time.perf_counter() - start, response.status)
+        cookie = response.getheader("Set-Cookie")
+        if cookie:
+            self.cookie = cookie.split(";", 1)[0]
+        return response.status, text
+
+    def close(self):
+        self.connection.close()
+
+
+class Recorder:
+    """Latencies and statuses per endpoint, and game outcomes per player kind, shared by all players"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.statuses = {}
+        self.games = {kind: {"started": 0, "won": 0, "abandoned": 0, "failed": 0, "errors": 0, "moves": 0,
+                              "rejected": 0}
+                      for kind in PLAYER_KINDS}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds, status):
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            statuses = self.statuses.setdefault(endpoint, {})
+            statuses[status] = statuses.get(status, 0) + 1
+
+    def count(self, kind, event, amount=1):
+        with self._lock:
+            self.games[kind][event] += amount
+
+
+def play_games(player, client, recorder, stop, max_moves=DEFAULT_MAX_MOVES, think_time=0.0):
+    """Play games through the web pages until stop is set
+
+    A game starts with GET /, which the page answers with the puzzle; moves
+    are POSTed to /play until the win page comes back. A player that has not
+    arrived after max_moves, or that has no move left, gives up with GET
+    /restart. Any other answer to a move, such as the redirect to / the
+    server sends when it lost the game, ends the game as failed. An exception
+    in the player is counted as an error and the player starts over.
+    """
+    while not stop.is_set():
+        try:
+            _play_game(player, client, recorder, stop, max_moves, think_time)
+        except Exception:
+            recorder.count(player.kind, "errors")
+            client.request("GET", "/restart")
+
+
+def _play_game(player, client, recorder, stop, max_moves, think_time):
+    kind = player.kind
+    status, page = client.request("GET", "/")
+    game = _game_settings(page) if status == 200 else None
+    if game is None:
+        # Server error or no puzzle available; back off briefly instead of spinning
+        stop.wait(0.05)
+        return
+    recorder.count(kind, "started")
+    current, destination = game["current"], game["destination"]
+
+    rejected = False
+    for _ in range(max_moves):
+        if stop.is_set():
+            return
+        if think_time:
+            time.sleep(think_time)
+        text = player.next_input(current, destination, rejected)
+        if text is None:
+            # Dead end (no flights out, or the destination is out of reach)
+            break
+        status, page = client.request("POST", "/play", {"next_country": text})
+        recorder.count(kind, "moves")
+        if status == 200 and "score-value" in page:
+            recorder.count(kind, "won")
+            return
+        game = _game_settings(page) if status == 200 else None
+        if game is None:
+            # Lost game (redirect to /), server error or an unexpected page; start a new one
+            recorder.count(kind, "failed")
+            return
+        error = _ERROR_TEXT.search(page)
+        rejected = bool(error and error.group(1).strip())
+        if rejected:
+            recorder.count(kind, "rejected")
+        current = game["current"]
+    recorder.count(kind, "abandoned")
+    client.request("GET", "/restart")
+
+
+def _game_settings(page):
+    match = _GAME_JSON.search(page)
+    return json.loads(match.group(1)) if match else None
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def summarize(recorder, seconds):
+    """Throughput, p50/p95/p99 latency and error rate per endpoint, plus game outcomes per player kind
+
+    A request is an error when it failed in transport or got a 4xx/5xx status;
+    a redirect from /play is not an error of the request, but the game it
+    ends is counted as failed.
+    """
+    endpoints = {}
+    for endpoint, latencies in sorted(recorder.latencies.items()):
+        latencies = sorted(latencies)
+        statuses = recorder.statuses[endpoint]
+        errors = sum(count for status, count in statuses.items() if status is None or status >= 400)
+        endpoints[endpoint] = {
+            "requests": len(latencies), "throughput_rps": len(latencies) / seconds,
+            "p50_s": percentile(latencies, 0.50), "p95_s": percentile(latencies, 0.95),
+            "p99_s": percentile(latencies, 0.99), "max_s": latencies[-1],
+            "error_rate": errors / len(latencies),
+            "statuses": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+        }
+    games = {}
+    for kind, counts in recorder.games.items():
+        if counts["started"]:
+            games[kind] = {**counts, "rejected_rate": counts["rejected"] / counts["moves"] if counts["moves"] else 0.0,
+                           "failed_rate": counts["failed"] / counts["started"]}
+    requests = sum(endpoint["requests"] for endpoint in endpoints.values())
+    return {"seconds": seconds, "requests": requests, "throughput_rps": requests / seconds,
+            "games_won_per_second": sum(counts["won"] for counts in recorder.games.values()) / seconds,
+            "endpoints": endpoints, "games": games}
+
+
+def run_load(host, port, route_manager, players=8, duration=20.0, mix=DEFAULT_MIX, seed=0,
+             max_moves=DEFAULT_MAX_MOVES, think_time=0.0):
+    """Drive the game at host:port with concurrent simulated players for duration seconds
+
+    Players are threads, each with its own session and connection; kinds are
+    assigned round-robin by the weights in mix. Latencies are measured by the
+    client, so they include the client's own scheduling: on a small machine
+    the players compete with the server for CPU.
+    """
+    kinds = [kind for kind, weight in parse_mix(mix) for _ in range(weight)]
+    prefixes = ambiguous_prefixes(route_manager.countries)
+    recorder = Recorder()
+    stop = threading.Event()
+    clients = []
+    threads = []
+    for i in range(players):
+        rng = random.Random(seed * 1_000_003 + i)
+        kind = kinds[i % len(kinds)]
+        if kind == "typo":
+            player = TypoPlayer(route_manager, rng, prefixes)
+        else:
+            player = PLAYER_CLASSES[kind](route_manager, rng)
+        client = Client(host, port, recorder)
+        clients.append(client)
+        threads.append(threading.Thread(target=play_games, args=(player, client, recorder, stop, max_moves,
+                                                                 think_time), daemon=True))
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    stop.wait(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+    for client in clients:
+        client.close()
+    return {"players": players, "mix": mix, **summarize(recorder, seconds)}
+
+
+def free_port(host="127.0.0.1"):
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def start_server(server="werkzeug", host="127.0.0.1", port=None, granularity="country", workers=4, log_file=None,
+                 game_store=None, ready_timeout=120.0):
+    """Start the app in a subprocess on a local port and wait until it answers
+
+    "werkzeug" is Flask's threaded development server in one process;
+    "gunicorn" runs gunicorn.conf.py with workers processes, which need a
+    shared game_store such as "sqlite:<path>". Returns (process, port).
+    """
+    if server not in SERVERS:
+        raise ValueError(f"Unknown server '{server}', expected one of {SERVERS}")
+    port = port or free_port(host)
+    env = dict(os.environ, ROUTE_GRANULARITY=granularity)
+    env.setdefault("SESSION_KEY", "loadtest")
+    if game_store:
+        env["GAME_STORE"] = game_store
+    if server == "gunicorn":
+        env.update(BIND=f"{host}:{port}", WEB_CONCURRENCY=str(workers))
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"]
+    else:
+        command = [sys.executable, "-c",
+                   f"from app import app; app.run(host={host!r}, port={port}, threaded=True)"]
+    log = open(log_file, "ab") if log_file else subprocess.DEVNULL
+    process = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                               stdout=log, stderr=subprocess.STDOUT)
+    if log_file:
+        log.close()
+
+    deadline = time.monotonic() + ready_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{server} server exited with status {process.returncode} before it was ready")
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=2)
+            connection.request("GET", "/api/v1/version")
+            ready = connection.getresponse().status == 200
+            connection.close()
+        except OSError:
+            ready = False
+        if ready:
+            return process, port
+        time.sleep(0.2)
+    stop_server(process)
+    raise TimeoutError(f"{server} server did not answer on port {port} within {ready_timeout:.0f}s")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def print_report(result):
+    ms = 1000
+    print(f"\n{result['players']} players ({result['mix']}): {result['requests']} requests in "
+          f"{result['seconds']:.1f}s, {result['throughput_rps']:.1f} req/s, "
+          f"{result['games_won_per_second']:.2f} games won/s")
+    print(f"  {'endpoint':<14} {'requests':>8} {'req/s':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9} "
+          f"{'errors':>7}")
+    for endpoint, stats in result["endpoints"].items():
+        print(f"  {endpoint:<14} {stats['requests']:>8} {stats['throughput_rps']:>8.1f} "
+              f"{stats['p50_s'] * ms:>7.1f}ms {stats['p95_s'] * ms:>7.1f}ms {stats['p99_s'] * ms:>7.1f}ms "
+              f"{stats['max_s'] * ms:>7.1f}ms {stats['error_rate']:>7.1%}")
+    print(f"  {'player':<14} {'games':>8} {'won':>8} {'gave up':>9} {'failed':>8} {'errors':>8} {'moves':>9} "
+          f"{'rejected':>9}")
+    for kind, counts in result["games"].items():
+        print(f"  {kind:<14} {counts['started']:>8} {counts['won']:>8} {counts['abandoned']:>9} "
+              f"{counts['failed']:>8} {counts['errors']:>8} {counts['moves']:>9} {counts['rejected_rate']:>9.1%}")
+
+
+def main(argv=None):
+    """Load-test the game with concurrent bot players at one or more concurrency levels"""
+    parser = argparse.ArgumentParser(description="Drive the game with concurrent simulated players, offline")
+    parser.add_argument("--players", type=int, nargs="+", default=[1, 4, 16],
+                        help="concurrent players; one run per value (default: 1 4 16)")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per run")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"player kinds and weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--max-moves", type=int, default=DEFAULT_MAX_MOVES, help="moves before a player gives up")
+    parser.add_argument("--think-time", type=float, default=0.0, help="seconds a player waits before each move")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--granularity", choices=("country", "city", "airport"), default="country")
+    parser.add_argument("--server", choices=SERVERS, default="werkzeug", help="server the harness starts")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn worker processes")
+    parser.add_argument("--port", type=int, help="port of a server already running on 127.0.0.1 (none is started)")
+    parser.add_argument("--server-log", help="append the started server's output to this file")
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+    parse_mix(args.mix)
+
+    from route import RouteManager
+
+    host = "127.0.0.1"
+    with contextlib.ExitStack() as stack:
+        if args.port:
+            port = args.port
+        else:
+            # Games go to a throwaway SQLite store the gunicorn workers share
+            game_store = None
+            if args.server == "gunicorn":
+                game_store = f"sqlite:{os.path.join(stack.enter_context(tempfile.TemporaryDirectory()), 'games.db')}"
+            process, port = start_server(args.server, host, granularity=args.granularity, workers=args.workers,
+                                         log_file=args.server_log, game_store=game_store)
+            stack.callback(stop_server, process)
+        # Built after the server so it reuses the snapshot the server just wrote
+        route_manager = RouteManager(granularity=args.granularity)
+        results = []
+        for players in args.players:
+            result = run_load(host, port, route_manager, players=players, duration=args.duration, mix=args.mix,
+                              seed=args.seed, max_moves=args.max_moves, think_time=args.think_time)
+            print_report(result)
+            results.append(result)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"server": None if args.port else args.server, "granularity": args.granularity,
+                       "runs": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
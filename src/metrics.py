@@ -0,0 +1,317 @@
+import bisect
+import functools
+import heapq
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter as _Counter
+
+# Latency buckets in seconds, from the ~1 µs move checks up to slow CSV loads
+DEFAULT_BUCKETS = (0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                   0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base class: a named family of series, one per combination of label values"""
+
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"{self.name} takes labels {self.label_names}, got {labels}")
+        return tuple(labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in values]
+
+
+class Gauge(Metric):
+    """A value read from a callback at scrape time, e.g. a queue depth
+
+    The callback returns a number, or a {label values tuple: number} dict
+    when the gauge has labels.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, callback, labels=()):
+        super().__init__(name, documentation, labels)
+        self.callback = callback
+
+    def _samples(self):
+        values = self.callback()
+        if not self.label_names:
+            values = {(): values}
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+
+class Histogram(Metric):
+    """Cumulative bucket counts, sum and count per label combination"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+
+    def labels(self, *labels):
+        """The series for one label combination; hot paths keep it to skip the label lookup"""
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(key, _HistogramSeries(self.buckets))
+        return series
+
+    def observe(self, value, *labels):
+        self.labels(*labels).observe(value)
+
+    def count(self, *labels):
+        series = self._series.get(self._key(labels))
+        return series.count() if series else 0
+
+    def _samples(self):
+        with self._lock:
+            series = sorted(self._series.items(), key=lambda item: item[0])
+        lines = []
+        names = self.label_names + ("le",)
+        for key, values in series:
+            counts, total = values.snapshot()
+            for bound, cumulative in zip(self.buckets + (float("inf"),), itertools.accumulate(counts)):
+                lines.append(f"{self.name}_bucket{_format_labels(names, key + (_format_value(bound),))} "
+                             f"{cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {sum(counts)}")
+        return lines
+
+
+class _HistogramSeries:
+    __slots__ = ("buckets", "counts", "total", "lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.total += value
+
+    def count(self):
+        return sum(self.counts)
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.total
+
+
+class Registry:
+    """Metrics exposed together in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """Add metric, or return the one already registered under its name"""
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def gauge(self, name, documentation, callback, labels=()):
+        metric = self.register(Gauge(name, documentation, callback, labels))
+        metric.callback = callback
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+# Metrics of this process; the game server exposes it at /metrics
+REGISTRY = Registry()
+
+SPAN_SECONDS = REGISTRY.histogram("route_span_seconds", "Time spent in instrumented RouteManager and game steps",
+                                  labels=("span",))
+
+
+class span:
+    """Time a block into route_span_seconds{span=name}
+
+    Usable as a context manager or as a decorator; costs two perf_counter
+    calls and one histogram update.
+    """
+
+    __slots__ = ("name", "start", "seconds")
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.perf_counter() - self.start
+        SPAN_SECONDS.observe(self.seconds, self.name)
+
+    def __call__(self, function):
+        observe = SPAN_SECONDS.labels(self.name).observe
+        perf_counter = time.perf_counter
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                observe(perf_counter() - start)
+        return wrapper
+
+
+class SamplingProfiler:
+    """Stack sampler for a random fraction of requests that keeps the slowest ones
+
+    A background thread wakes every interval seconds and, for requests
+    selected with probability sample_rate, records the collapsed stack of the
+    thread serving them. When a request finishes it is kept if it is among
+    the keep slowest seen so far. Requests that are not sampled only pay for
+    one random() call.
+    """
+
+    def __init__(self, sample_rate=0.01, interval=0.002, keep=20):
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.keep = keep
+        self._active = {}
+        self._slowest = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start_request(self):
+        """Begin sampling the calling thread; returns a token for finish_request, or None"""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        token = threading.get_ident()
+        with self._lock:
+            self._active[token] = _Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+        return token
+
+    def finish_request(self, token, label, seconds):
+        if token is None:
+            return
+        with self._lock:
+            stacks = self._active.pop(token, None)
+            if stacks is None:
+                return
+            entry = (seconds, next(self._sequence), label, stacks)
+            if len(self._slowest) < self.keep:
+                heapq.heappush(self._slowest, entry)
+            elif seconds > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, entry)
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, stacks in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None and thread_id != own:
+                        stacks[_collapse(frame)] += 1
+
+    def slowest(self, stacks=10):
+        """The kept requests, slowest first, each with its most frequent stacks"""
+        with self._lock:
+            entries = sorted(self._slowest, reverse=True)
+        return [{"request": label, "seconds": seconds, "samples": sum(counts.values()),
+                 "stacks": [{"stack": stack, "samples": count} for stack, count in counts.most_common(stacks)]}
+                for seconds, _, label, counts in entries]
+
+    def dump(self, path):
+        """Write the kept requests in collapsed-stack format (one "frames count" line per stack)"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            for request in self.slowest(stacks=None):
+                f.write(f"# {request['request']} {request['seconds'] * 1000:.3f} ms\n")
+                for stack in request["stacks"]:
+                    f.write(f"{stack['stack']} {stack['samples']}\n")
+
+
+def _collapse(frame):
+    """Stack of frame as "file:function;..." from the outermost call inwards"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
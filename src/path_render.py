@@ -0,0 +1,220 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+from route_stats import graph_version
+
+DEFAULT_CACHE_DIR = "data/path_images"
+
+# Bump when the drawing changes, so images cached by an older version are not served
+RENDER_VERSION = 1
+
+# Longest path rendered for a request; longer ones are refused rather than drawn
+MAX_PATH_NODES = 16
+
+# Set in each pool worker by _init_worker
+_worker_canvas = None
+
+
+class PathCanvas:
+    """A figure with the background map drawn once, reused for every path
+
+    draw_path adds the path's artists, writes the PNG and removes them again,
+    so the background scatter is not rebuilt per image. Uses the Agg canvas
+    directly, so no display or pyplot state is involved. Not thread-safe.
+    """
+
+    def __init__(self, positions, background, dpi=100, size=(10, 5.5)):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        self.positions = positions
+        self.figure = Figure(figsize=size, dpi=dpi)
+        FigureCanvasAgg(self.figure)
+        self.axes = self.figure.add_axes((0.02, 0.02, 0.96, 0.9))
+        self.axes.set_xlim(-180, 180)
+        self.axes.set_ylim(-60, 80)
+        self.axes.set_aspect("equal")
+        self.axes.axis("off")
+        self.axes.scatter(background[:, 1], background[:, 0], s=6, color="#c5cdd8", linewidths=0)
+        self.title = self.figure.suptitle("", fontsize=11)
+
+    def draw_path(self, path, file, title=None):
+        """Draw path (longitude across, latitude up) and write it to file as PNG"""
+        axes = self.axes
+        latitudes = [self.positions[node][0] for node in path]
+        longitudes = [self.positions[node][1] for node in path]
+        artists = [*axes.plot(longitudes, latitudes, color="#e74c3c", linewidth=2, zorder=2),
+                   axes.scatter(longitudes, latitudes, s=40, color="#4a6fa5", zorder=3),
+                   axes.scatter(longitudes[-1:], latitudes[-1:], s=80, color="#2ecc71", zorder=4)]
+        artists.extend(axes.annotate(node, (lon, lat), xytext=(4, 4), textcoords="offset points", fontsize=8,
+                                     zorder=5)
+                       for node, lon, lat in zip(path, longitudes, latitudes))
+        self.title.set_text(title or "")
+        try:
+            tmp_file = f"{file}.{os.getpid()}.tmp"
+            self.figure.savefig(tmp_file, format="png")
+            os.replace(tmp_file, file)
+        finally:
+            for artist in artists:
+                artist.remove()
+        return file
+
+
+class PathRenderer:
+    """PNG images of paths on a fixed geographic layout, cached on disk
+
+    Every node is placed at its coordinates from RouteManager.node_coordinates
+    (longitude across, latitude up), so the same country is always in the
+    same place and no layout is computed per image. Images are stored in
+    cache_dir under a hash of the path, the graph version and RENDER_VERSION;
+    a path already rendered for this graph is only a file lookup.
+    """
+
+    def __init__(self, route_manager, cache_dir=DEFAULT_CACHE_DIR, dpi=100):
+        self.route_manager = route_manager
+        self.cache_dir = cache_dir
+        self.dpi = dpi
+        self._layout = None
+        self._canvas = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def layout(self):
+        """(graph version, {node: (latitude, longitude)}, all positions) for the current graph"""
+        csr = self.route_manager.csr
+        if self._layout is None or self._layout[0] is not csr:
+            coordinates = self.route_manager.node_coordinates()
+            known = ~np.isnan(coordinates).any(axis=1)
+            positions = {node: tuple(coordinates[i].tolist()) for i, node in enumerate(csr.nodes) if known[i]}
+            self._layout = (csr, graph_version(csr), positions, coordinates[known])
+            self._canvas = None
+        return self._layout[1:]
+
+    def canvas(self):
+        if self._canvas is None:
+            _, positions, background = self.layout()
+            self._canvas = PathCanvas(positions, background, self.dpi)
+        return self._canvas
+
+    def key(self, path):
+        version = self.layout()[0]
+        text = "\0".join([f"v{RENDER_VERSION}", version, str(self.dpi), *path])
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+    def file_for(self, path):
+        return os.path.join(self.cache_dir, f"{self.key(path)}.png")
+
+    def check(self, path):
+        """Raise ValueError unless path is a drawable sequence of known, placed nodes"""
+        positions = self.layout()[1]
+        if not 1 <= len(path) <= MAX_PATH_NODES:
+            raise ValueError(f"A path to render needs 1 to {MAX_PATH_NODES} nodes, got {len(path)}")
+        unknown = [node for node in path if node not in positions]
+        if unknown:
+            raise ValueError(f"No position for {', '.join(unknown)}")
+
+    def render(self, path, title=None):
+        """The cached image file for path, drawn first if it is not on disk yet"""
+        self.check(path)
+        file = self.file_for(path)
+        if os.path.exists(file):
+            self.hits += 1
+            return file
+        self.misses += 1
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with self._lock:
+            return self.canvas().draw_path(path, file, title=title or _title(path))
+
+    def render_many(self, paths, processes=None):
+        """Image files for many paths, drawing the missing ones in a process pool
+
+        Returns the files in the order of paths. Each worker receives the
+        layout once and draws the background map once, when it starts.
+        """
+        files = []
+        jobs = []
+        for path in paths:
+            self.check(path)
+            file = self.file_for(path)
+            files.append(file)
+            if os.path.exists(file):
+                self.hits += 1
+            else:
+                self.misses += 1
+                jobs.append((list(path), file))
+        if not jobs:
+            return files
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        _, positions, background = self.layout()
+        processes = processes or os.cpu_count() or 1
+        if processes > 1 and len(jobs) > 1:
+            context = multiprocessing.get_context("spawn")
+            with context.Pool(processes, initializer=_init_worker, initargs=(positions, background, self.dpi)) as pool:
+                pool.map(_render_job, jobs, chunksize=max(1, len(jobs) // (processes * 4)))
+        else:
+            with self._lock:
+                canvas = self.canvas()
+                for path, file in jobs:
+                    canvas.draw_path(path, file, title=_title(path))
+        return files
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "cache_dir": self.cache_dir}
+
+
+def _title(path):
+    return f"{path[0]} to {path[-1]} ({len(path) - 1} flights)"
+
+
+def _init_worker(positions, background, dpi):
+    global _worker_canvas
+    _worker_canvas = PathCanvas(positions, background, dpi)
+
+
+def _render_job(job):
+    path, file = job
+    return _worker_canvas.draw_path(path, file, title=_title(path))
+
+
+def main(argv=None):
+    """Render paths from route_tester --batch JSONL answers, or random puzzle routes, into the cache"""
+    from route import GRANULARITIES, RouteManager
+
+    parser = argparse.ArgumentParser(description="Render path images into the on-disk cache")
+    parser.add_argument("--answers", help="JSONL file written by route_tester --batch --format jsonl ('-' for stdin)")
+    parser.add_argument("--random", type=int, default=0, metavar="N", help="also render N random puzzle routes")
+    parser.add_argument("--granularity", choices=GRANULARITIES, default="country")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--processes", type=int, help="worker processes (default: all cores)")
+    args = parser.parse_args(argv)
+
+    route_manager = RouteManager(granularity=args.granularity)
+    paths = []
+    if args.answers:
+        with (sys.stdin if args.answers == "-" else open(args.answers, encoding="utf-8")) as lines:
+            paths.extend(answer["path"] for answer in map(json.loads, lines) if answer.get("path"))
+    for _ in range(args.random):
+        path = route_manager.pick_random_route(min_path_length=2)[2]
+        if path is not None:
+            paths.append(path)
+
+    renderer = PathRenderer(route_manager, cache_dir=args.cache_dir)
+    start = time.perf_counter()
+    renderer.render_many(paths, processes=args.processes)
+    seconds = time.perf_counter() - start
+    print(f"{len(paths)} paths, {renderer.misses} rendered and {renderer.hits} already cached, "
+          f"in {seconds:.2f}s ({args.cache_dir})")
+
+
+if __name__ == "__main__":
+    main()
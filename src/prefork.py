@@ -0,0 +1,124 @@
+import argparse
+import multiprocessing
+import os
+import time
+
+# Environment variable through which the master tells workers where the published snapshot is
+SNAPSHOT_ENV = "ROUTE_SNAPSHOT"
+
+# How a measured worker gets its route data
+WORKER_MODES = ("rebuild", "snapshot", "attach")
+
+
+def publish(granularity="country", snapshot_file=None, **options):
+    """Build or refresh the route snapshot in the master and export its path to workers
+
+    Workers forked (or spawned) afterwards inherit SNAPSHOT_ENV and call
+    RouteManager.attach on it, mapping the same file rather than parsing the
+    CSVs again.
+    """
+    from route import RouteManager
+
+    route_manager = RouteManager(granularity=granularity, snapshot_file=snapshot_file, **options)
+    os.environ[SNAPSHOT_ENV] = os.path.abspath(route_manager.snapshot_file)
+    return route_manager
+
+
+def memory_usage():
+    """RSS, PSS and USS of this process in bytes, from /proc (None where unavailable)
+
+    RSS counts shared pages in full in every process; PSS splits them between
+    the processes mapping them and USS leaves them out, so they show what
+    sharing saves.
+    """
+    usage = {"rss": None, "pss": None, "uss": None}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            fields = {line.split(":")[0]: int(line.split()[1]) * 1024 for line in f if line.split()[-1] == "kB"}
+    except OSError:
+        import resource
+
+        usage["rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return usage
+    usage["rss"] = fields.get("Rss")
+    usage["pss"] = fields.get("Pss")
+    usage["uss"] = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    return usage
+
+
+def _worker(mode, granularity, snapshot_file, barrier, results):
+    """Start like a serving worker would, then report startup time and memory"""
+    start = time.perf_counter()
+    from route import RouteManager
+    imported = time.perf_counter()
+
+    if mode == "rebuild":
+        route_manager = RouteManager(granularity=granularity, use_snapshot=False)
+    elif mode == "snapshot":
+        route_manager = RouteManager(granularity=granularity, snapshot_file=snapshot_file)
+    else:
+        route_manager = RouteManager.attach(snapshot_file)
+    # Serve one puzzle so the pages a request touches are mapped in
+    route_manager.pick_random_route(min_path_length=2)
+    ready = time.perf_counter()
+
+    # Measure only once every worker holds its data, so shared pages are split between all of them
+    barrier.wait()
+    results.put({"import_seconds": imported - start, "startup_seconds": ready - start, **memory_usage()})
+    barrier.wait()
+
+
+def measure_workers(mode, workers=4, granularity="country", snapshot_file=None):
+    """Start workers in parallel in fresh interpreters and collect their startup reports
+
+    For "attach" the master publishes the snapshot first; "snapshot" workers
+    validate and map the same file themselves; "rebuild" workers each parse
+    the CSVs, which is what every worker does without a shared snapshot.
+    """
+    if mode not in WORKER_MODES:
+        raise ValueError(f"Unknown worker mode '{mode}', expected one of {WORKER_MODES}")
+
+    publish_seconds = 0.0
+    if mode != "rebuild":
+        start = time.perf_counter()
+        snapshot_file = publish(granularity, snapshot_file).snapshot_file
+        publish_seconds = time.perf_counter() - start
+
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [context.Process(target=_worker, args=(mode, granularity, snapshot_file, barrier, results))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return {"mode": mode, "workers": workers, "publish_seconds": publish_seconds, "reports": reports}
+
+
+def _mean(reports, key):
+    values = [report[key] for report in reports if report[key] is not None]
+    return sum(values) / len(values) if values else float("nan")
+
+
+def main(argv=None):
+    """Print per-worker startup time and memory for each way of getting the route data"""
+    parser = argparse.ArgumentParser(description="Measure pre-fork worker startup time and memory")
+    parser.add_argument("--workers", type=int, default=4, help="workers started in parallel")
+    parser.add_argument("--granularity", choices=("country", "city", "airport"), default="country")
+    parser.add_argument("--modes", nargs="+", choices=WORKER_MODES, default=list(WORKER_MODES))
+    args = parser.parse_args(argv)
+
+    mib = 1024 * 1024
+    print(f"{'mode':<10} {'publish':>9} {'import':>9} {'startup':>9} {'RSS':>10} {'PSS':>10} {'USS':>10}")
+    for mode in args.modes:
+        result = measure_workers(mode, args.workers, args.granularity)
+        reports = result["reports"]
+        print(f"{mode:<10} {result['publish_seconds']:>8.3f}s {_mean(reports, 'import_seconds'):>8.3f}s "
+              f"{_mean(reports, 'startup_seconds'):>8.3f}s {_mean(reports, 'rss') / mib:>6.1f} MiB "
+              f"{_mean(reports, 'pss') / mib:>6.1f} MiB {_mean(reports, 'uss') / mib:>6.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+import datetime
+import hashlib
+import random
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from metrics import span
+
+# Difficulty tiers, easiest first, with the exclusive upper score bound of each
+DIFFICULTY_TIERS = ("easy", "medium", "hard")
+_TIER_BOUNDS = (3.0, 4.0, float("inf"))
+
+DEFAULT_CAPACITY = 64
+
+# Pause of the refill thread after a round that added nothing, doubling up to the maximum
+_MIN_BACKOFF_SECONDS = 0.1
+_MAX_BACKOFF_SECONDS = 30.0
+
+
+class Puzzle:
+    """A pre-generated game: source, destination and one optimal path, with its difficulty inputs"""
+
+    __slots__ = ("source", "destination", "path", "path_count", "min_out_degree", "generation")
+
+    def __init__(self, source, destination, path, path_count, min_out_degree, generation):
+        self.source = source
+        self.destination = destination
+        self.path = path
+        self.path_count = path_count
+        self.min_out_degree = min_out_degree
+        self.generation = generation
+
+    @property
+    def hops(self):
+        return len(self.path) - 1
+
+    @property
+    def score(self):
+        """Hop length, plus up to 1 for having few optimal routes and up to 1 for a thinly connected stop"""
+        return self.hops + 1.0 / self.path_count + 2.0 / (1 + self.min_out_degree)
+
+    @property
+    def tier(self):
+        return difficulty_tier(self.score)
+
+    def to_dict(self):
+        return {"source": self.source, "destination": self.destination, "path": self.path,
+                "hops": self.hops, "path_count": self.path_count, "min_out_degree": self.min_out_degree,
+                "score": round(self.score, 3), "tier": self.tier}
+
+
+def difficulty_tier(score):
+    for tier, bound in zip(DIFFICULTY_TIERS, _TIER_BOUNDS):
+        if score < bound:
+            return tier
+    return DIFFICULTY_TIERS[-1]
+
+
+@span("make_puzzle")
+def make_puzzle(route_manager, min_path_length=2, rng=None):
+    """Draw a random route and measure its difficulty, or None if no route is long enough"""
+    generation = route_manager.generation
+    source, destination, path = route_manager.pick_random_route(min_path_length=min_path_length, rng=rng)
+    if source is None:
+        return None
+
+    csr = route_manager.csr
+    ids = [csr.node_ids[node] for node in path]
+    out_degree = np.diff(csr.indptr)
+    return Puzzle(source, destination, path,
+                  path_count=csr.shortest_path_count(ids[0], ids[-1]),
+                  min_out_degree=int(out_degree[ids[:-1]].min()),
+                  generation=generation)
+
+
+class PuzzlePool:
+    """Per-tier queues of ready puzzles, topped up by a background thread
+
+    Requests only dequeue. When a tier drops below low_water the refill thread
+    draws routes until every tier is back at capacity, sorting each one into
+    the tier its difficulty score falls in; a round gives up after
+    max_attempts draws. A tier that a whole round could not add a single
+    puzzle to is marked unfillable until the routes change, so it no longer
+    triggers refills, and the thread backs off after rounds that add nothing.
+    Puzzles from before a route update (an older RouteManager generation)
+    are dropped on dequeue.
+    """
+
+    def __init__(self, route_manager, capacity=DEFAULT_CAPACITY, low_water=None, min_path_length=2,
+                 max_attempts=5000, seed=None):
+        self.route_manager = route_manager
+        self.capacity = capacity
+        self.low_water = capacity // 2 if low_water is None else low_water
+        self.min_path_length = min_path_length
+        self.max_attempts = max_attempts
+        self._rng = random.Random(seed)
+        self._queues = {tier: deque() for tier in DIFFICULTY_TIERS}
+        self._condition = threading.Condition()
+        self._daily = {}
+        # Tiers no puzzle could be drawn for, with the RouteManager generation that was checked
+        self._unfillable = {}
+        self._thread = None
+        self._stopped = False
+
+        self.dequeued = 0
+        self.empty_waits = 0
+        self.stale_dropped = 0
+        self.refills = 0
+        self.generated = 0
+        self.refill_seconds = 0.0
+        self.last_refill_seconds = 0.0
+
+    def start(self):
+        """Fill the pool once, then keep it topped up from a daemon thread"""
+        self.refill()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="puzzle-pool", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _fillable(self):
+        generation = self.route_manager.generation
+        return {tier: queue for tier, queue in self._queues.items() if self._unfillable.get(tier) != generation}
+
+    def _needs_refill(self):
+        return any(len(queue) < self.low_water for queue in self._fillable().values())
+
+    def _run(self):
+        backoff = _MIN_BACKOFF_SECONDS
+        while True:
+            with self._condition:
+                while not self._stopped and not self._needs_refill():
+                    self._condition.wait()
+                if self._stopped:
+                    return
+            if self.refill():
+                backoff = _MIN_BACKOFF_SECONDS
+                continue
+            # Nothing added: wait out the backoff, which requests waking the condition do not cut short
+            deadline = time.monotonic() + backoff
+            with self._condition:
+                while not self._stopped and (remaining := deadline - time.monotonic()) > 0:
+                    self._condition.wait(remaining)
+            backoff = min(backoff * 2, _MAX_BACKOFF_SECONDS)
+
+    def refill(self):
+        """Draw routes until every fillable tier is at capacity or the attempt limit is reached"""
+        start = time.perf_counter()
+        generation = self.route_manager.generation
+        added = dict.fromkeys(DIFFICULTY_TIERS, 0)
+        filled = False
+        for _ in range(self.max_attempts):
+            with self._condition:
+                if all(len(queue) >= self.capacity for queue in self._fillable().values()):
+                    filled = True
+                    break
+            puzzle = make_puzzle(self.route_manager, self.min_path_length, self._rng)
+            if puzzle is None:
+                break
+            with self._condition:
+                queue = self._queues[puzzle.tier]
+                if len(queue) < self.capacity:
+                    queue.append(puzzle)
+                    added[puzzle.tier] += 1
+                    self._condition.notify_all()
+
+        generated = sum(added.values())
+        elapsed = time.perf_counter() - start
+        with self._condition:
+            if not filled:
+                for tier, queue in self._queues.items():
+                    if not added[tier] and len(queue) < self.low_water:
+                        self._unfillable[tier] = generation
+            self.refills += 1
+            self.generated += generated
+            self.refill_seconds += elapsed
+            self.last_refill_seconds = elapsed
+        return generated
+
+    @span("puzzle_pool_get")
+    def get(self, tier=None, timeout=1.0):
+        """Dequeue a puzzle from tier (or the fullest tier), waiting up to timeout; None if none arrives"""
+        if tier is not None and tier not in self._queues:
+            raise ValueError(f"Unknown difficulty '{tier}', expected one of {DIFFICULTY_TIERS}")
+
+        deadline = time.monotonic() + timeout
+        generation = self.route_manager.generation
+        with self._condition:
+            while True:
+                queue = self._queues[tier] if tier is not None else max(self._queues.values(), key=len)
+                while queue and queue[0].generation != generation:
+                    queue.popleft()
+                    self.stale_dropped += 1
+                if queue:
+                    puzzle = queue.popleft()
+                    self.dequeued += 1
+                    if self._needs_refill():
+                        self._condition.notify_all()
+                    return puzzle
+
+                self.empty_waits += 1
+                self._condition.notify_all()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._thread is None:
+                    return None
+                self._condition.wait(remaining)
+
+    def daily_puzzle(self, date=None, min_path_length=3):
+        """The puzzle of the day, identical in every worker that loaded the same routes
+
+        The draw is seeded from the date and the route data's source hash, so
+        it depends on nothing local to the process.
+        """
+        date = date or datetime.date.today()
+        route_manager = self.route_manager
+        key = (date.isoformat(), route_manager.source_hash, route_manager.generation, min_path_length)
+        puzzle = self._daily.get(key)
+        if puzzle is None:
+            seed = hashlib.sha256(f"{key[0]}:{key[1]}:{key[2]}".encode()).digest()
+            rng = random.Random(int.from_bytes(seed[:8], "big"))
+            puzzle = make_puzzle(route_manager, min_path_length, rng)
+            self._daily = {key: puzzle}
+        return puzzle
+
+    def stats(self):
+        with self._condition:
+            refills = self.refills
+            fillable = self._fillable()
+            return {
+                "depth": {tier: len(queue) for tier, queue in self._queues.items()},
+                "capacity": self.capacity,
+                "low_water": self.low_water,
+                "dequeued": self.dequeued,
+                "empty_waits": self.empty_waits,
+                "stale_dropped": self.stale_dropped,
+                "refills": refills,
+                "generated": self.generated,
+                "unfillable": [tier for tier in DIFFICULTY_TIERS if tier not in fillable],
+                "last_refill_ms": self.last_refill_seconds * 1000,
+                "mean_refill_ms": self.refill_seconds / refills * 1000 if refills else 0.0,
+            }
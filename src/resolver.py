@@ -0,0 +1,227 @@
+import csv
+import os
+import re
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+
+# Match tiers, best first. Within a resolution only the best non-empty tier counts.
+EXACT, ALIAS, PREFIX, WORD_PREFIX, AIRPORT, FUZZY = range(6)
+TIER_NAMES = ("exact", "alias", "prefix", "word-prefix", "airport", "fuzzy")
+
+# Targets kept per trie node; enough to list suggestions and detect ambiguity
+_TRIE_NODE_TARGETS = 32
+
+
+def normalize(text):
+    """Lowercase, strip accents and punctuation, collapse whitespace"""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text).split())
+
+
+def bounded_edit_distance(a, b, limit):
+    """Levenshtein distance between a and b, or None if it exceeds limit"""
+    if abs(len(a) - len(b)) > limit:
+        return None
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        row_min = i
+        for j, cb in enumerate(b, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            row_min = min(row_min, current[j])
+        if row_min > limit:
+            return None
+        previous = current
+    return previous[-1] if previous[-1] <= limit else None
+
+
+def _trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Candidate:
+    __slots__ = ("name", "tier", "distance")
+
+    def __init__(self, name, tier, distance=0):
+        self.name = name
+        self.tier = tier
+        self.distance = distance
+
+    @property
+    def kind(self):
+        return TIER_NAMES[self.tier]
+
+    def to_dict(self):
+        return {"name": self.name, "kind": self.kind, "distance": self.distance}
+
+    def __repr__(self):
+        return f"Candidate({self.name!r}, {self.kind}, {self.distance})"
+
+
+class _TrieNode:
+    __slots__ = ("children", "targets", "count")
+
+    def __init__(self):
+        self.children = {}
+        self.targets = set()
+        self.count = 0
+
+
+class CountryResolver:
+    """Resolve free-text player input to graph node names
+
+    Built once from the node names plus optional aliases (ISO codes, short
+    names) and airport codes. Lookups go, best tier first, through exact
+    names, aliases, a prefix trie over whole names and over every word start,
+    IATA codes (after the prefixes, so "spa" means Spain rather than the
+    airport SPA), and finally a trigram index that shortlists keys for a
+    bounded edit-distance check. Results for recent normalized inputs are
+    kept in an LRU.
+    """
+
+    def __init__(self, names, aliases=None, airport_codes=None, max_edits=2, cache_size=4096):
+        self.names = list(names)
+        self.max_edits = max_edits
+        name_ids = {name: i for i, name in enumerate(self.names)}
+
+        self._exact = {normalize(name): i for i, name in enumerate(self.names)}
+        self._aliases = {}
+        for alias, name in (aliases or {}).items():
+            key = normalize(alias)
+            if name in name_ids and key and key not in self._exact:
+                self._aliases.setdefault(key, name_ids[name])
+        self._airports = {code.upper(): name_ids[name] for code, name in (airport_codes or {}).items()
+                          if isinstance(code, str) and name in name_ids}
+
+        # Keys searched by prefix and fuzzy matching: names and multi-letter aliases
+        keys = [(key, i) for key, i in self._exact.items()]
+        keys += [(key, i) for key, i in self._aliases.items() if len(key) > 3]
+        self._keys = keys
+
+        self._root = _TrieNode()
+        self._word_root = _TrieNode()
+        for key, target in keys:
+            self._insert(self._root, key, target)
+            for match in re.finditer(r"(?<= )\S", key):
+                self._insert(self._word_root, key[match.start():], target)
+        self._freeze(self._root)
+        self._freeze(self._word_root)
+
+        self._ngrams = {}
+        for index, (key, _) in enumerate(keys):
+            for gram in _trigrams(key):
+                self._ngrams.setdefault(gram, []).append(index)
+
+        self._cached_resolve = lru_cache(maxsize=cache_size)(self._resolve_normalized)
+
+    @classmethod
+    def from_route_manager(cls, route_manager, aliases_file="data/country_aliases.csv", **options):
+        """Resolver over the manager's nodes; ISO aliases apply at country granularity only"""
+        aliases = {}
+        if getattr(route_manager, "granularity", "country") == "country" and os.path.exists(aliases_file):
+            aliases = load_aliases(aliases_file)
+        airport_codes = getattr(route_manager, "airport_to_node", None) or route_manager.airport_to_country
+        return cls(route_manager.countries, aliases=aliases, airport_codes=airport_codes, **options)
+
+    @staticmethod
+    def _insert(root, key, target):
+        node = root
+        for char in key:
+            node = node.children.setdefault(char, _TrieNode())
+            node.targets.add(target)
+
+    @staticmethod
+    def _freeze(root):
+        """Replace per-node target sets with a capped sorted tuple and a count"""
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            node.count = len(node.targets)
+            node.targets = tuple(sorted(node.targets)[:_TRIE_NODE_TARGETS])
+            stack.extend(node.children.values())
+
+    @staticmethod
+    def _walk(root, prefix):
+        node = root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
+
+    def resolve(self, text, limit=5):
+        """Ranked candidates for text, all from the best matching tier
+
+        Returns (candidates, total), where total counts every target in that
+        tier even when only the first few are returned.
+        """
+        candidates, total = self._cached_resolve(normalize(text))
+        return list(candidates[:limit]), total
+
+    def resolve_one(self, text, limit=5):
+        """(name, candidates, total): name is set only when the best tier has a single match"""
+        candidates, total = self.resolve(text, limit=limit)
+        if total == 1:
+            return candidates[0].name, candidates, total
+        return None, candidates, total
+
+    def cache_info(self):
+        return self._cached_resolve.cache_info()
+
+    def _resolve_normalized(self, key):
+        if not key:
+            return (), 0
+        if key in self._exact:
+            return (Candidate(self.names[self._exact[key]], EXACT),), 1
+        if key in self._aliases:
+            return (Candidate(self.names[self._aliases[key]], ALIAS),), 1
+
+        for root, tier in ((self._root, PREFIX), (self._word_root, WORD_PREFIX)):
+            node = self._walk(root, key)
+            if node is not None and node.count:
+                names = sorted(self.names[i] for i in node.targets)
+                return tuple(Candidate(name, tier) for name in names), node.count
+
+        if key.upper() in self._airports:
+            return (Candidate(self.names[self._airports[key.upper()]], AIRPORT),), 1
+
+        return self._fuzzy(key)
+
+    def _fuzzy(self, key):
+        limit = 1 if len(key) <= 4 else self.max_edits
+        grams = _trigrams(key)
+        # q-gram lemma: each edit destroys at most 3 trigrams
+        threshold = max(1, len(grams) - 3 * limit)
+        shared = Counter(index for gram in grams for index in self._ngrams.get(gram, ()))
+
+        best = {}
+        for index, count in shared.items():
+            if count < threshold:
+                continue
+            candidate_key, target = self._keys[index]
+            distance = bounded_edit_distance(key, candidate_key, limit)
+            if distance is not None and distance < best.get(target, limit + 1):
+                best[target] = distance
+        if not best:
+            return (), 0
+
+        closest = min(best.values())
+        ranked = sorted((distance, self.names[target]) for target, distance in best.items())
+        # Only the closest distance counts towards ambiguity; farther matches are still listed
+        total = sum(1 for distance in best.values() if distance == closest)
+        return tuple(Candidate(name, FUZZY, distance) for distance, name in ranked), total
+
+
+def load_aliases(path):
+    """{alias: country} from a CSV with Country, ISO2, ISO3 and ;-separated Aliases columns"""
+    aliases = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            country = row["Country"]
+            for alias in [row["ISO2"], row["ISO3"], *(row["Aliases"] or "").split(";")]:
+                if alias.strip():
+                    aliases[alias.strip()] = country
+    return aliases
@@ -1,63 +1,647 @@
-import pandas as pd
-import networkx as nx
+import argparse
+import os
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
 import random
 
+from csv_columns import read_columns
+from geo import DISTANCE_AGGREGATES, haversine_km, mean_positions, router_cache_info, router_for
+from graph_backend import UNREACHABLE, CSRGraph, NetworkXGraph
+from metrics import span
+from route_diff import (ROUTE_COLUMNS, edge_attributes_from_routes, read_route_diff, repair_after_insertions,
+                        repair_after_removals, rows_using_edges)
+from snapshot import SNAPSHOT_VERSION, Snapshot, source_hash
+
+# Graph implementations RouteManager can serve get_neighbors / check_valid_move from
+BACKENDS = ("csr", "networkx")
+
+# What a graph node stands for: a country, a "City, Country" label or an IATA code
+GRANULARITIES = ("country", "city", "airport")
+
+# Per-edge attributes aggregated from routes.csv, in snapshot order
+EDGE_ATTRIBUTES = ("route_count", "airline_count", "airport_pair_count", "distance_km")
+
+# CSV parsers _load_data can use; "csv" is the stdlib reader, which keeps pandas out of cold starts
+LOADERS = ("pandas", "csv")
+
+# Columns read from airports.csv (routes.csv columns are route_diff.ROUTE_COLUMNS)
+AIRPORT_COLUMNS = ("Country", "City", "IATA", "Latitude", "Longitude")
+
+# Edge attributes that are lengths rather than counts
+FLOAT_EDGE_ATTRIBUTES = ("distance_km",)
+
+# Destinations whose reverse-BFS distance vector RouteManager keeps for hints unless told otherwise
+DEFAULT_HINT_CACHE_SIZE = 1024
+
+# Bytes of distance data RouteManager may keep in memory unless told otherwise.
+# The country graph needs well under 1 MiB; airport and city graphs do not fit
+# an all-pairs index in this budget and fall back to sampling plus cached rows.
+DEFAULT_DISTANCE_MEMORY_BUDGET = 32 * 1024 * 1024
+
+
+def _edge_dtype(name):
+    return np.float32 if name in FLOAT_EDGE_ATTRIBUTES else np.int32
+
+
+def _aggregate_lengths(groups, lengths, count, aggregate):
+    """Min or median of lengths per group number in 0..count-1, skipping NaN; NaN for empty groups"""
+    known = ~np.isnan(lengths)
+    groups, lengths = groups[known], lengths[known]
+    order = np.lexsort((lengths, groups))
+    ordered = lengths[order]
+    counts = np.bincount(groups, minlength=count)
+    starts = np.cumsum(counts) - counts
+    result = np.full(count, np.nan)
+    present = counts > 0
+    starts, counts = starts[present], counts[present]
+    if aggregate == "min":
+        result[present] = ordered[starts]
+    else:
+        result[present] = (ordered[starts + (counts - 1) // 2] + ordered[starts + counts // 2]) / 2
+    return result
+
+
+def index_pairs_by_length(distances):
+    """Connected pairs sorted by length: (flat source * n + target indices, start of each "length >= k" suffix)"""
+    reachable = distances != UNREACHABLE
+    np.fill_diagonal(reachable, False)
+    flat = np.flatnonzero(reachable)
+    lengths = distances.ravel()[flat]
+    order = np.argsort(lengths, kind="stable")
+    pair_index = flat[order].astype(np.int64)
+    max_length = int(lengths.max()) if len(lengths) else 0
+    length_offsets = np.searchsorted(lengths[order], np.arange(max_length + 2), side="left")
+    return pair_index, length_offsets
+
+
+class GraphState:
+    """Everything a query reads, swapped as a whole on a route update so no reader sees half of one"""
+
+    def __init__(self, csr, distances=None, pair_index=None, length_offsets=None, generation=0,
+                 backend="csr"):
+        self.csr = csr
+        self.distances = distances
+        self.pair_index = pair_index
+        self.length_offsets = length_offsets
+        self.generation = generation
+        self.distance_rows = OrderedDict()
+        self.distance_rows_lock = threading.Lock()
+        self.distance_columns = OrderedDict()
+        self._graph = None
+        self.node_coordinates = None
+        self.backend = NetworkXGraph(self.graph) if backend == "networkx" else csr
+
+    @property
+    def graph(self):
+        if self._graph is None:
+            self._graph = self.csr.to_networkx()
+        return self._graph
+
 
 class RouteManager:
+    """Flight route graph plus the distance data used to pick and check puzzles
+
+    At granularity "country" nodes are country names; at "city" they are
+    "City, Country" labels and at "airport" IATA codes. The countries and
+    country_ids attributes hold the node labels in every mode.
+
+    When the all-pairs index (hop matrix plus pairs sorted by length) fits in
+    distance_memory_budget it is computed up front. Otherwise puzzles are found
+    by sampling pairs and running a bidirectional BFS, and single-source BFS
+    rows are kept in an LRU bounded by the same budget. The per-destination
+    caches (hint columns and great-circle trees) are each held to it as well.
+
+    Every edge also carries distance_km, the min or median (distance_aggregate)
+    great-circle length of its airport pairs; great_circle() answers shortest
+    routes by kilometres flown.
+
+    Graph and distance data live in a GraphState that apply_route_diff
+    replaces atomically; the attributes below read through to it.
+    """
+
     def __init__(self, routes_file='data/routes.csv', airports_file='data/airports.csv',
-                 output_file='data/country_routes_min_2_stops.csv'):
+                 output_file='data/country_routes_min_2_stops.csv', snapshot_file=None,
+                 use_snapshot=True, backend="csr", granularity="country",
+                 distance_memory_budget=DEFAULT_DISTANCE_MEMORY_BUDGET, max_sample_attempts=1000,
+                 distance_aggregate="median", hint_cache_size=DEFAULT_HINT_CACHE_SIZE, loader="csv",
+                 snapshot=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unknown granularity '{granularity}', expected one of {GRANULARITIES}")
+        if loader not in LOADERS:
+            raise ValueError(f"Unknown loader '{loader}', expected one of {LOADERS}")
+        if distance_aggregate not in DISTANCE_AGGREGATES:
+            raise ValueError(f"Unknown distance aggregate '{distance_aggregate}', expected one of "
+                             f"{DISTANCE_AGGREGATES}")
+        if snapshot_file is None:
+            snapshot_file = os.path.join(os.path.dirname(routes_file), f"route_snapshot_{granularity}.bin")
         self.routes_file = routes_file
         self.airports_file = airports_file
         self.output_file = output_file
-        self.graph = None
-        self.countries = None
+        self.snapshot_file = snapshot_file
+        self.granularity = granularity
+        self.distance_aggregate = distance_aggregate
+        self.backend_name = backend
+        self.distance_memory_budget = distance_memory_budget
+        self.max_sample_attempts = max_sample_attempts
+        self.hint_cache_size = hint_cache_size
+        self.hint_cache_hits = 0
+        self.hint_cache_misses = 0
+        self.loader = loader
+        self.routes_table = None
+        self.airports_table = None
+        self.airport_to_node = None
+        self._airport_positions = None
+        self.loaded_from_snapshot = False
+        self._state = None
+        self._edge_routes = None
+        self._update_lock = threading.Lock()
+
+        # A snapshot handed in by the caller (see attach) is served as is
+        if snapshot is not None:
+            self.source_hash = snapshot.source_hash
+            self._use_snapshot(snapshot)
+            return
+
+        # Reuse the on-disk snapshot when it was built from the same CSVs,
+        # otherwise load data, build graph and precompute hop distances
+        self.source_hash = source_hash(routes_file, airports_file, extra=f"{granularity}:{distance_aggregate}")
+        if not (use_snapshot and self._load_snapshot()):
+            self._load_data()
+            csr = self._build_country_graph()
+            self._state = GraphState(csr, *self._build_distance_index(csr), backend=backend)
+
+            if use_snapshot:
+                self.save_snapshot()
+
+    @classmethod
+    def attach(cls, snapshot_file, **options):
+        """Serve from a snapshot another process published, without reading the CSVs
+
+        Meant for pre-fork workers: the master builds the snapshot once and
+        every worker maps the same file, so the arrays are shared through the
+        page cache instead of being rebuilt per process. Raises
+        FileNotFoundError when snapshot_file is missing or of another format version.
+        """
+        snapshot = Snapshot.load(snapshot_file)
+        if snapshot is None:
+            raise FileNotFoundError(f"No route snapshot of format version {SNAPSHOT_VERSION} at '{snapshot_file}'")
+        return cls(snapshot_file=snapshot_file, granularity=snapshot.metadata["granularity"],
+                   distance_aggregate=snapshot.metadata["distance_aggregate"], snapshot=snapshot, **options)
+
+    @property
+    def csr(self):
+        return self._state.csr
 
-        # Load data and build graph
-        self._load_data()
-        self._build_country_graph()
+    @property
+    def backend(self):
+        return self._state.backend
 
+    @property
+    def countries(self):
+        return self._state.csr.nodes
+
+    @property
+    def country_ids(self):
+        return self._state.csr.node_ids
+
+    @property
+    def distances(self):
+        return self._state.distances
+
+    @property
+    def pair_index(self):
+        return self._state.pair_index
+
+    @property
+    def length_offsets(self):
+        return self._state.length_offsets
+
+    @property
+    def generation(self):
+        """Number of route diffs applied since the graph was loaded"""
+        return self._state.generation
+
+    @property
+    def graph(self):
+        """networkx view of the country graph, built on first use (visualization only)"""
+        return self._state.graph
+
+    @property
+    def distance_mode(self):
+        """Distance strategy in use: "all-pairs" (full hop matrix) or "sampled" (BFS on demand)"""
+        return "all-pairs" if self._state.distances is not None else "sampled"
+
+    @span("load_data")
     def _load_data(self):
-        """Load route and airport data from CSV files"""
-        df = pd.read_csv(self.routes_file)
-        df2 = pd.read_csv(self.airports_file)
+        """Load route and airport data from CSV files
+
+        Only the needed columns are kept. loader "pandas" reads them into
+        DataFrames with pd.read_csv; "csv" streams them through the stdlib csv
+        module into NumPy arrays, so a cold start never imports pandas.
+        """
+        routes = self._read_routes()
+        if self.loader == "csv":
+            airports = {name: np.array(values) for name, values in
+                        read_columns(self.airports_file, AIRPORT_COLUMNS).items()}
+            for name in ("Latitude", "Longitude"):
+                airports[name] = np.array([float(value) if value else np.nan for value in airports[name].tolist()])
+            airports = {**airports, "City": np.where(airports["City"] == "", None, airports["City"].astype(object))}
+        else:
+            import pandas as pd
+
+            airports = pd.read_csv(self.airports_file, usecols=list(AIRPORT_COLUMNS))
+
+        self.routes_table = routes
+        self.airports_table = airports
+        self.airport_to_country = dict(zip(airports["IATA"].tolist(), airports["Country"].tolist()))
+
+        # Map each airport to the graph node it belongs to at this granularity
+        rows = [(code, city, country) for code, city, country in
+                zip(airports["IATA"].tolist(), airports["City"].tolist(), airports["Country"].tolist())
+                if code != "\\N"]
+        if self.granularity == "country":
+            self.airport_to_node = self.airport_to_country
+        elif self.granularity == "city":
+            self.airport_to_node = {code: f"{city}, {country}" for code, city, country in rows
+                                    if isinstance(city, str)}
+        else:
+            self.airport_to_node = {code: code for code, _, _ in rows}
+
+    def _read_routes(self):
+        """The ROUTE_COLUMNS of the routes CSV, as a DataFrame or a dict of NumPy arrays depending on loader"""
+        if self.loader == "csv":
+            return {name: np.array(values) for name, values in read_columns(self.routes_file, ROUTE_COLUMNS).items()}
+        import pandas as pd
+
+        return pd.read_csv(self.routes_file, usecols=ROUTE_COLUMNS)
+
+    def _aggregate_country_edges(self):
+        """Collapse airport routes into one edge per directed node pair
+
+        Returns (edges, attributes): (source, target) node pairs in order of
+        their first appearance in routes.csv and the EDGE_ATTRIBUTES as
+        aligned arrays. distance_km is the min or median (see
+        distance_aggregate) great-circle length of the edge's distinct
+        airport pairs. Grouped with pandas for loader "pandas" and with NumPy
+        over the column arrays for "csv".
+        """
+        if self.loader == "csv":
+            return self._aggregate_edges_numpy()
 
-        self.routes_df = df[["Source airport", "Destination airport"]]
-        self.airports_df = df2[["Country", "City", "IATA"]]
-        self.airport_to_country = dict(zip(self.airports_df["IATA"], self.airports_df["Country"]))
+        import pandas as pd
 
+        routes = pd.DataFrame({
+            "source": self.routes_table["Source airport"].map(self.airport_to_node),
+            "target": self.routes_table["Destination airport"].map(self.airport_to_node),
+            "airline": self.routes_table["Airline"],
+            "source_airport": self.routes_table["Source airport"],
+            "dest_airport": self.routes_table["Destination airport"],
+        })
+
+        # Drop unmapped airports and self-loops
+        routes = routes.dropna(subset=["source", "target"])
+        routes = routes[routes["source"] != routes["target"]]
+
+        grouped = routes.groupby(["source", "target"], sort=False)
+        edges = grouped.agg(route_count=("airline", "size"), airline_count=("airline", "nunique"))
+        airport_pairs = routes.drop_duplicates(["source", "target", "source_airport", "dest_airport"])
+        edges["airport_pair_count"] = airport_pairs.groupby(["source", "target"], sort=False).size()
+        lengths = airport_pairs.assign(distance_km=self._airport_distances(airport_pairs["source_airport"],
+                                                                           airport_pairs["dest_airport"]))
+        edges["distance_km"] = lengths.groupby(["source", "target"], sort=False)["distance_km"].agg(
+            self.distance_aggregate)
+        edges = edges.reset_index()
+        return list(zip(edges["source"], edges["target"])), {name: edges[name].to_numpy() for name in EDGE_ATTRIBUTES}
+
+    def _route_endpoints(self, routes):
+        """Node IDs of every route's ends as arrays over the route rows, with the node names and airport codes
+
+        Returns (sources, targets, names, codes, source_codes, dest_codes):
+        unmapped airports get node -1, and the *_codes arrays index codes.
+        """
+        count = len(routes["Source airport"])
+        codes, code_ids = np.unique(np.concatenate([routes["Source airport"], routes["Destination airport"]]),
+                                    return_inverse=True)
+        names = list(dict.fromkeys(self.airport_to_node.values()))
+        name_ids = {name: i for i, name in enumerate(names)}
+        airport_to_node = self.airport_to_node
+        code_nodes = np.array([name_ids.get(airport_to_node.get(code), -1) for code in codes.tolist()],
+                              dtype=np.int64)
+        source_codes, dest_codes = code_ids[:count], code_ids[count:]
+        return code_nodes[source_codes], code_nodes[dest_codes], names, codes, source_codes, dest_codes
+
+    def _aggregate_edges_numpy(self):
+        """_aggregate_country_edges over the "csv" loader's column arrays, grouping with np.unique and bincount"""
+        routes = self.routes_table
+        sources, targets, names, codes, source_codes, dest_codes = self._route_endpoints(routes)
+        # Drop unmapped airports and self-loops
+        valid = (sources >= 0) & (targets >= 0) & (sources != targets)
+        n, code_count = len(names), len(codes)
+
+        # Number edges in order of their first route
+        keys, first, edge_of_route = np.unique(sources[valid] * n + targets[valid], return_index=True,
+                                               return_inverse=True)
+        order = np.argsort(first, kind="stable")
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        edge_of_route = rank[edge_of_route]
+        keys = keys[order]
+        count = len(keys)
+
+        airline_ids = np.unique(routes["Airline"][valid], return_inverse=True)[1]
+        airline_total = int(airline_ids.max()) + 1 if len(airline_ids) else 1
+        edge_airlines = np.unique(edge_of_route * airline_total + airline_ids) // airline_total
+
+        pairs = np.unique((edge_of_route * code_count + source_codes[valid]) * code_count + dest_codes[valid])
+        pair_edges = pairs // (code_count * code_count)
+        positions = self._airport_coordinates()
+        unknown = (np.nan, np.nan)
+        code_positions = np.array([positions.get(code, unknown) for code in codes.tolist()],
+                                  dtype=np.float64).reshape(-1, 2)
+        pair_sources = code_positions[pairs // code_count % code_count]
+        pair_targets = code_positions[pairs % code_count]
+        lengths = haversine_km(pair_sources[:, 0], pair_sources[:, 1], pair_targets[:, 0], pair_targets[:, 1])
+
+        attributes = {
+            "route_count": np.bincount(edge_of_route, minlength=count),
+            "airline_count": np.bincount(edge_airlines, minlength=count),
+            "airport_pair_count": np.bincount(pair_edges, minlength=count),
+            "distance_km": _aggregate_lengths(pair_edges, lengths, count, self.distance_aggregate),
+        }
+        return [(names[key // n], names[key % n]) for key in keys.tolist()], attributes
+
+    def _airport_coordinates(self):
+        """{IATA code: (latitude, longitude)}, from the loaded airports or read from the CSV on first use"""
+        if self._airport_positions is None:
+            airports = self.airports_table
+            if airports is None:
+                airports = read_columns(self.airports_file, ("IATA", "Latitude", "Longitude"))
+            positions = {}
+            for code, latitude, longitude in zip(*(np.asarray(airports[name]).tolist()
+                                                   for name in ("IATA", "Latitude", "Longitude"))):
+                if code != "\\N" and code not in positions:
+                    positions[code] = (float(latitude), float(longitude))
+            self._airport_positions = positions
+        return self._airport_positions
+
+    def _airport_distances(self, source_airports, dest_airports):
+        """Great-circle km between airports given as aligned IATA code sequences, NaN where unknown"""
+        positions = self._airport_coordinates()
+        unknown = (np.nan, np.nan)
+        sources = np.array([positions.get(code, unknown) for code in source_airports], dtype=np.float64)
+        targets = np.array([positions.get(code, unknown) for code in dest_airports], dtype=np.float64)
+        if not len(sources):
+            return np.zeros(0)
+        return haversine_km(sources[:, 0], sources[:, 1], targets[:, 0], targets[:, 1])
+
+    @span("build_country_graph")
     def _build_country_graph(self):
-        """Build a directed graph at the country level"""
-        self.graph = nx.DiGraph()
+        """Build a directed graph at the configured granularity"""
+        edges, attributes = self._aggregate_country_edges()
+
+        return CSRGraph.from_edges(edges, edge_attributes={name: attributes[name].astype(_edge_dtype(name))
+                                                           for name in EDGE_ATTRIBUTES})
+
+    def _distance_index_fits(self, n):
+        """Whether the hop matrix plus the sorted pair index for n nodes fit the memory budget"""
+        return n * n * (np.dtype(np.uint8).itemsize + np.dtype(np.int64).itemsize) <= self.distance_memory_budget
+
+    @span("build_distance_index")
+    def _build_distance_index(self, csr):
+        """(distances, pair_index, length_offsets) for csr, all None when they do not fit the memory budget"""
+        n = len(csr.nodes)
+        if not self._distance_index_fits(n):
+            return None, None, None
 
-        # Add edges based on flights, using countries instead of airports
-        for _, row in self.routes_df.iterrows():
-            source_airport = row["Source airport"]
-            dest_airport = row["Destination airport"]
+        # One BFS per source node, stored as a compact uint8 matrix keyed by node ID
+        distances = np.full((n, n), UNREACHABLE, dtype=np.uint8)
+        for source in range(n):
+            distances[source] = csr.bfs(source)
 
-            # Get corresponding countries
-            source_country = self.airport_to_country.get(source_airport)
-            dest_country = self.airport_to_country.get(dest_airport)
+        return (distances, *index_pairs_by_length(distances))
 
-            # Ensure valid mapping and avoid self-loops
-            if source_country and dest_country and source_country != dest_country:
-                self.graph.add_edge(source_country, dest_country)
+    def distance_row(self, source_id):
+        """Hop distances from one node to every node as a uint8 array
 
-        # Store list of countries
-        self.countries = list(self.graph.nodes)
+        Served from the hop matrix when present, otherwise from an LRU of BFS
+        rows that holds at most distance_memory_budget bytes.
+        """
+        state = self._state
+        if state.distances is not None:
+            return state.distances[source_id]
+
+        with state.distance_rows_lock:
+            row = state.distance_rows.get(source_id)
+            if row is not None:
+                state.distance_rows.move_to_end(source_id)
+                return row
+
+        row = np.array(state.csr.bfs(source_id), dtype=np.uint8)
+        max_rows = max(1, self.distance_memory_budget // max(row.nbytes, 1))
+        with state.distance_rows_lock:
+            state.distance_rows[source_id] = row
+            while len(state.distance_rows) > max_rows:
+                state.distance_rows.popitem(last=False)
+        return row
+
+    def distances_to(self, target_id):
+        """Hop distances from every node to one node as a uint8 array
+
+        Computed once per destination by a BFS over the reverse adjacency (or
+        copied out of the hop matrix) and kept in an LRU that every game
+        shares, of at most hint_cache_size destinations and
+        distance_memory_budget bytes.
+        """
+        state = self._state
+        with state.distance_rows_lock:
+            column = state.distance_columns.get(target_id)
+            if column is not None:
+                state.distance_columns.move_to_end(target_id)
+                self.hint_cache_hits += 1
+                return column
+            self.hint_cache_misses += 1
+
+        if state.distances is not None:
+            column = np.ascontiguousarray(state.distances[:, target_id])
+        else:
+            column = np.array(state.csr.bfs(target_id, reverse=True), dtype=np.uint8)
+        max_columns = self._max_hint_columns(len(column))
+        with state.distance_rows_lock:
+            state.distance_columns[target_id] = column
+            while len(state.distance_columns) > max_columns:
+                state.distance_columns.popitem(last=False)
+        return column
+
+    def _max_hint_columns(self, n):
+        return max(1, min(self.hint_cache_size, self.distance_memory_budget // max(n, 1)))
+
+    def hint(self, current, destination):
+        """Flights left from current to destination and the neighbors that bring it one closer
+
+        Returns None when either node is unknown. remaining is None when the
+        destination cannot be reached from current.
+        """
+        state = self._state
+        current_id = state.csr.node_ids.get(current)
+        destination_id = state.csr.node_ids.get(destination)
+        if current_id is None or destination_id is None:
+            return None
+        column = self.distances_to(destination_id)
+        remaining = int(column[current_id])
+        if remaining == UNREACHABLE:
+            return {"current": current, "destination": destination, "remaining": None, "progress": []}
+        neighbors = state.csr.adjacency[current_id]
+        progress = [state.csr.nodes[v] for v in neighbors if column[v] == remaining - 1]
+        return {"current": current, "destination": destination, "remaining": remaining, "progress": progress}
+
+    def hint_cache_info(self):
+        """Sizes and hit counts of the hint LRU and of the great-circle tree cache (None until first used)"""
+        state = self._state
+        n = len(state.csr.nodes)
+        lookups = self.hint_cache_hits + self.hint_cache_misses
+        return {"destinations": len(state.distance_columns), "max_destinations": self._max_hint_columns(n),
+                "bytes": len(state.distance_columns) * n, "hits": self.hint_cache_hits,
+                "misses": self.hint_cache_misses, "hit_rate": self.hint_cache_hits / lookups if lookups else 0.0,
+                "great_circle_trees": router_cache_info(state.csr)}
+
+    @span("load_snapshot")
+    def _load_snapshot(self):
+        """Populate the manager from a fresh snapshot; return False if there is none"""
+        snapshot = Snapshot.load(self.snapshot_file, expected_hash=self.source_hash)
+        if snapshot is None:
+            return False
+        self._use_snapshot(snapshot)
+        return True
+
+    def _use_snapshot(self, snapshot):
+        """Serve graph and distance data straight from the snapshot's arrays"""
+        self.airport_to_country = snapshot.metadata["airport_to_country"]
+        self.airport_to_node = snapshot.metadata.get("airport_to_node", self.airport_to_country)
+        csr = CSRGraph(snapshot.metadata["nodes"], snapshot["adjacency_indptr"], snapshot["adjacency_indices"],
+                       {name: snapshot[f"edge_{name}"] for name in EDGE_ATTRIBUTES})
+
+        # The budget may have changed since the snapshot was written
+        if not self._distance_index_fits(len(csr.nodes)):
+            distance_index = (None, None, None)
+        elif "distances" in snapshot.arrays:
+            distance_index = (snapshot["distances"], snapshot["pair_index"], snapshot["length_offsets"])
+        else:
+            distance_index = self._build_distance_index(csr)
+        self._state = GraphState(csr, *distance_index, backend=self.backend_name)
+        self.loaded_from_snapshot = True
+
+    def save_snapshot(self):
+        """Write the node table, adjacency and distance data to snapshot_file"""
+        state = self._state
+        arrays = {"adjacency_indptr": state.csr.indptr,
+                  "adjacency_indices": state.csr.indices,
+                  **{f"edge_{name}": values for name, values in state.csr.edge_attributes.items()}}
+        if state.distances is not None:
+            arrays.update(distances=state.distances, pair_index=state.pair_index,
+                          length_offsets=state.length_offsets)
+
+        metadata = {"granularity": self.granularity, "distance_aggregate": self.distance_aggregate,
+                    "nodes": state.csr.nodes,
+                    "airport_to_country": self.airport_to_country}
+        if self.granularity != "country":
+            metadata["airport_to_node"] = self.airport_to_node
+        snapshot = Snapshot(self.source_hash, metadata, arrays)
+        snapshot.write(self.snapshot_file)
+
+    @staticmethod
+    def _pair_offset(state, min_path_length):
+        """Position in pair_index of the first pair with length >= min_path_length"""
+        k = min(max(min_path_length, 0), len(state.length_offsets) - 1)
+        return int(state.length_offsets[k])
+
+    @staticmethod
+    def _cached_row(state, source_id):
+        """Distance row for source_id if it is available without running a BFS"""
+        if state.distances is not None:
+            return state.distances[source_id]
+        with state.distance_rows_lock:
+            return state.distance_rows.get(source_id)
+
+    def path_length(self, source, target):
+        """Number of flights on the shortest path, or None if there is no path"""
+        state = self._state
+        source_id, target_id = state.csr.node_ids[source], state.csr.node_ids[target]
+        row = self._cached_row(state, source_id)
+        if row is None:
+            path = state.csr.bidirectional_path(source_id, target_id)
+            return None if path is None else len(path) - 1
+        length = row[target_id]
+        return None if length == UNREACHABLE else int(length)
+
+    def shortest_path(self, source, target):
+        """Reconstruct one shortest path, or None if there is no path
+
+        Walks the hop matrix when it is available and falls back to a
+        bidirectional BFS otherwise.
+        """
+        return self._shortest_path(self._state, source, target)
+
+    @staticmethod
+    def _shortest_path(state, source, target):
+        csr, distances = state.csr, state.distances
+        if source not in csr.node_ids or target not in csr.node_ids:
+            return None
+        current, goal = csr.node_ids[source], csr.node_ids[target]
+
+        if distances is None:
+            path = csr.bidirectional_path(current, goal)
+            return None if path is None else [csr.nodes[i] for i in path]
+
+        remaining = distances[current, goal]
+        if remaining == UNREACHABLE:
+            return None
+
+        path = [current]
+        while remaining > 0:
+            remaining -= 1
+            current = next(v for v in csr.adjacency[current] if distances[v, goal] == remaining)
+            path.append(current)
+        return [csr.nodes[i] for i in path]
+
+    def pairs_by_length(self, min_length, max_length=None):
+        """List (source, target, length) for connected pairs within the length range
+
+        Without the all-pairs index this runs one BFS per source node, which is
+        slow at airport or city granularity.
+        """
+        state = self._state
+        if state.distances is None:
+            return list(self._iter_pairs_by_bfs(state, min_length, max_length))
+
+        start = self._pair_offset(state, min_length)
+        end = len(state.pair_index) if max_length is None else self._pair_offset(state, max_length + 1)
+        flat = np.sort(state.pair_index[start:end])
+        nodes = state.csr.nodes
+        sources, targets = np.divmod(flat, len(nodes))
+        lengths = state.distances[sources, targets]
+        return [(nodes[s], nodes[t], int(length))
+                for s, t, length in zip(sources.tolist(), targets.tolist(), lengths.tolist())]
+
+    @staticmethod
+    def _iter_pairs_by_bfs(state, min_length, max_length):
+        """Yield (source, target, length) in source-major order, one BFS row at a time"""
+        upper = UNREACHABLE - 1 if max_length is None else max_length
+        nodes = state.csr.nodes
+        for source_id in range(len(nodes)):
+            row = np.asarray(state.csr.bfs(source_id), dtype=np.uint8)
+            targets = np.flatnonzero((row >= max(min_length, 1)) & (row <= upper))
+            for target_id, length in zip(targets.tolist(), row[targets].tolist()):
+                yield nodes[source_id], nodes[target_id], length
 
     def find_routes_with_min_stops(self, min_path_length=2):
         """Find country pairs with path length >= min_path_length"""
-        routes_with_min_stops = []
-
-        for source in self.graph.nodes:
-            for target in self.graph.nodes:
-                if source != target:  # Avoid self-loops
-                    try:
-                        path_length = nx.shortest_path_length(self.graph, source=source, target=target)
-                        if path_length >= min_path_length:
-                            routes_with_min_stops.append((source, target, path_length))
-                    except nx.NetworkXNoPath:
-                        continue  # No path exists between these countries
+        import pandas as pd
+
+        routes_with_min_stops = self.pairs_by_length(min_path_length)
 
         # Convert results to DataFrame and save
         result_df = pd.DataFrame(routes_with_min_stops,
@@ -66,41 +650,302 @@ class RouteManager:
 
         return result_df
 
-    def pick_random_route(self, min_path_length=3):
-        """Pick a random source and destination with path length >= min_path_length"""
-        valid_pairs = []
+    @span("pick_random_route")
+    def pick_random_route(self, min_path_length=3, rng=None):
+        """Pick a random source and destination with path length >= min_path_length
 
-        for source in self.graph.nodes:
-            for target in self.graph.nodes:
-                if source != target:  # Avoid self-loops
-                    try:
-                        path_length = nx.shortest_path_length(self.graph, source=source, target=target)
-                        if path_length >= min_path_length:
-                            valid_pairs.append((source, target))
-                    except nx.NetworkXNoPath:
-                        continue  # No path exists between these countries
+        Returns (source, destination, correct_path), or (None, None, None) when
+        no pair is long enough. Pass a seeded random.Random as rng for a
+        reproducible draw on the same graph.
+        """
+        rng = rng or random
+        state = self._state
+        if state.distances is None:
+            return self._sample_random_route(state, min_path_length, rng)
 
-        if not valid_pairs:
-            return None, None
+        start = self._pair_offset(state, min_path_length)
 
-        source, destination = random.choice(valid_pairs)
-        correct_path = nx.shortest_path(self.graph, source=source, target=destination)
+        if start >= len(state.pair_index):
+            return None, None, None
+
+        nodes = state.csr.nodes
+        source_id, destination_id = divmod(int(state.pair_index[rng.randrange(start, len(state.pair_index))]),
+                                           len(nodes))
+        source, destination = nodes[source_id], nodes[destination_id]
+        correct_path = self._shortest_path(state, source, destination)
 
         return source, destination, correct_path
 
+    def _sample_random_route(self, state, min_path_length, rng):
+        """Draw random pairs until a bidirectional BFS finds one that is long enough"""
+        nodes = state.csr.nodes
+        n = len(nodes)
+        for _ in range(self.max_sample_attempts if n > 1 else 0):
+            source_id, destination_id = rng.randrange(n), rng.randrange(n)
+            if source_id == destination_id:
+                continue
+            path = state.csr.bidirectional_path(source_id, destination_id)
+            if path is not None and len(path) - 1 >= min_path_length:
+                correct_path = [nodes[i] for i in path]
+                return correct_path[0], correct_path[-1], correct_path
+
+        return None, None, None
+
+    def _route_multiset(self):
+        """Per-edge Counter of (airline, source airport, destination airport), built on first use"""
+        if self._edge_routes is None:
+            routes = self.routes_table
+            if routes is None:
+                routes = self._read_routes()
+            if self.loader == "csv":
+                sources, targets, names, *_ = self._route_endpoints(routes)
+                valid = (sources >= 0) & (targets >= 0) & (sources != targets)
+                names = np.array(names, dtype=object)
+                sources, targets = names[sources[valid]], names[targets[valid]]
+            else:
+                sources = routes["Source airport"].map(self.airport_to_node)
+                targets = routes["Destination airport"].map(self.airport_to_node)
+                valid = (sources.notna() & targets.notna() & (sources != targets)).to_numpy()
+                sources, targets = sources[valid], targets[valid]
+
+            self._edge_routes = {}
+            for u, v, airline, source_airport, dest_airport in zip(
+                    sources, targets, routes["Airline"][valid].tolist(),
+                    routes["Source airport"][valid].tolist(), routes["Destination airport"][valid].tolist()):
+                self._edge_routes.setdefault((u, v), Counter())[(airline, source_airport, dest_airport)] += 1
+        return self._edge_routes
+
+    @span("apply_route_diff")
+    def apply_route_diff(self, added=(), removed=()):
+        """Apply added and removed (source airport, destination airport, airline) routes to the live graph
+
+        Only the distance rows the change can affect are repaired, new node IDs
+        are appended and the new state is swapped in at once. Returns update counts.
+        """
+        with self._update_lock:
+            state = self._state
+            edge_routes = self._route_multiset()
+            nodes = list(state.csr.nodes)
+            node_ids = dict(state.csr.node_ids)
+            pending = {}
+            skipped = 0
+
+            for route, delta in [(route, -1) for route in removed] + [(route, 1) for route in added]:
+                source_airport, dest_airport, airline = route
+                u = self.airport_to_node.get(source_airport)
+                v = self.airport_to_node.get(dest_airport)
+                if u is None or v is None or u == v:
+                    skipped += 1
+                    continue
+
+                if (u, v) not in pending:
+                    pending[(u, v)] = Counter(edge_routes.get((u, v), ()))
+                routes = pending[(u, v)]
+                key = (airline, source_airport, dest_airport)
+                if delta < 0 and routes[key] == 0:
+                    skipped += 1
+                    continue
+                routes[key] += delta
+                if routes[key] == 0:
+                    del routes[key]
+
+                for node in (u, v):
+                    if node not in node_ids:
+                        node_ids[node] = len(nodes)
+                        nodes.append(node)
+
+            old_csr = state.csr
+            removed_edges = [(node_ids[u], node_ids[v]) for (u, v), routes in pending.items()
+                             if not routes and old_csr.has_edge(u, v)]
+            added_edges = [(node_ids[u], node_ids[v]) for (u, v), routes in pending.items()
+                           if routes and not old_csr.has_edge(u, v)]
+            removed_set = set(removed_edges)
+
+            # Existing edges keep their position in each row, new edges go last
+            old_edges = [(u, v) for u, neighbors in enumerate(old_csr.adjacency) for v in neighbors]
+            keep = [i for i, edge in enumerate(old_edges) if edge not in removed_set]
+            edges = [old_edges[i] for i in keep] + added_edges
+            attributes = {name: values[keep].tolist() + [0] * len(added_edges)
+                          for name, values in old_csr.edge_attributes.items()}
+            for index, (u, v) in enumerate(edges):
+                routes = pending.get((nodes[u], nodes[v]))
+                if routes:
+                    for name, value in edge_attributes_from_routes(routes).items():
+                        attributes[name][index] = value
+                    attributes["distance_km"][index] = self._edge_distance(routes)
+
+            csr = CSRGraph.from_edges([(nodes[u], nodes[v]) for u, v in edges], nodes=nodes,
+                                      edge_attributes={name: np.array(values, dtype=_edge_dtype(name))
+                                                       for name, values in attributes.items()})
+            distance_index, repaired, pairs_changed = self._repair_distances(state, csr, removed_edges,
+                                                                             added_edges)
+            new_state = GraphState(csr, *distance_index, generation=state.generation + 1,
+                                   backend=self.backend_name)
+            if state.distances is None:
+                new_state.distance_rows.update(repaired)
+                repaired = len(repaired)
+
+            for edge, routes in pending.items():
+                if routes:
+                    edge_routes[edge] = routes
+                else:
+                    edge_routes.pop(edge, None)
+            self._state = new_state
+
+            return {
+                "routes_added": len(added),
+                "routes_removed": len(removed),
+                "routes_skipped": skipped,
+                "edges_added": len(added_edges),
+                "edges_removed": len(removed_edges),
+                "nodes_added": len(nodes) - len(old_csr.nodes),
+                "rows_repaired": repaired,
+                "pairs_changed": pairs_changed,
+                "generation": new_state.generation,
+            }
+
+    def _repair_distances(self, state, csr, removed_edges, added_edges):
+        """(distance index, repaired rows, changed pairs) for csr, repairing only the rows the edge changes affect"""
+        n_old, n = len(state.csr.nodes), len(csr.nodes)
+        # Adjacency after the removals but before the insertions
+        removed_set = set(removed_edges)
+        adjacency = [[v for v in row if (u, v) not in removed_set] for u, row in enumerate(state.csr.adjacency)]
+        adjacency += [[] for _ in range(n - n_old)]
+
+        if state.distances is None:
+            with state.distance_rows_lock:
+                cached = dict(state.distance_rows)
+            rows = {}
+            pairs_changed = 0
+            for source, row in cached.items():
+                padded = np.full(n, UNREACHABLE, dtype=np.uint8)
+                padded[:n_old] = row
+                affected = len(rows_using_edges(padded[None, :], removed_edges)) or any(
+                    int(padded[u]) + 1 < int(padded[v]) for u, v in added_edges)
+                if affected:
+                    repaired = np.array(csr.bfs(source), dtype=np.uint8)
+                    pairs_changed += int(np.count_nonzero(repaired != padded))
+                    rows[source] = repaired
+                else:
+                    rows[source] = padded
+            return (None, None, None), rows, pairs_changed
+
+        if not self._distance_index_fits(n):
+            return (None, None, None), 0, None
+
+        old = np.full((n, n), UNREACHABLE, dtype=np.uint8)
+        old[:n_old, :n_old] = state.distances
+        np.fill_diagonal(old, 0)
+        distances = old.copy()
+        removal_rows = repair_after_removals(distances, adjacency, removed_edges)
+        insertion_rows = repair_after_insertions(distances, added_edges)
+
+        pairs_changed = int(np.count_nonzero(distances != old))
+        repaired = len(np.union1d(removal_rows, insertion_rows))
+        return (distances, *index_pairs_by_length(distances)), repaired, pairs_changed
+
+    def _edge_distance(self, routes):
+        """distance_km of one edge from its Counter of (airline, source airport, destination airport)"""
+        pairs = list({(source, dest) for _, source, dest in routes})
+        lengths = self._airport_distances([source for source, _ in pairs], [dest for _, dest in pairs])
+        return float(np.nanmin(lengths) if self.distance_aggregate == "min" else np.nanmedian(lengths))
+
+    def node_coordinates(self):
+        """(latitude, longitude) in degrees of every node, as an array indexed by node ID
+
+        An airport node sits at its airport; a city or country at the
+        spherical mean of its airports.
+        """
+        state = self._state
+        if state.node_coordinates is None:
+            node_ids = state.csr.node_ids
+            ids, latitudes, longitudes = [], [], []
+            for code, (latitude, longitude) in self._airport_coordinates().items():
+                node_id = node_ids.get(self.airport_to_node.get(code))
+                if node_id is not None:
+                    ids.append(node_id)
+                    latitudes.append(latitude)
+                    longitudes.append(longitude)
+            state.node_coordinates = mean_positions(np.array(ids, dtype=np.int64), np.array(latitudes),
+                                                    np.array(longitudes), len(state.csr.nodes))
+        return state.node_coordinates
+
+    def great_circle(self):
+        """The shared GreatCircleRouter for the current graph
+
+        The A* heuristic is only admissible when every node is a single
+        airport, so coarser granularities search without one. Its tree cache
+        is held to distance_memory_budget bytes.
+        """
+        csr = self._state.csr
+        coordinates = self.node_coordinates() if self.granularity == "airport" else None
+        return router_for(csr, coordinates, max_tree_bytes=self.distance_memory_budget)
+
+    def apply_routes_file(self, routes_file):
+        """Diff routes_file against the current routes CSV and apply the changes live"""
+        added, removed = read_route_diff(self.routes_file, routes_file)
+        result = self.apply_route_diff(added, removed)
+        self.routes_file = routes_file
+        self.routes_table = None
+        self.source_hash = source_hash(routes_file, self.airports_file,
+                                       extra=f"{self.granularity}:{self.distance_aggregate}")
+        return result
+
+    def get_edge_data(self, source, target):
+        """Aggregated route attributes for a direct connection, or None if there is none"""
+        csr = self._state.csr
+        if source not in csr.node_ids or target not in csr.node_ids:
+            return None
+        edge = csr.edge_position(csr.node_ids[source], csr.node_ids[target])
+        if edge is None:
+            return None
+        return {name: values[edge].item() for name, values in csr.edge_attributes.items()}
+
     def get_neighbors(self, country):
         """Get neighboring countries"""
-        if country in self.graph:
-            return list(self.graph.neighbors(country))
-        return []
+        return self._state.backend.neighbors(country)
 
     def check_valid_move(self, current_country, next_country):
         """Check if a move from current_country to next_country is valid"""
-        return next_country in self.get_neighbors(current_country)
+        return self._state.backend.has_edge(current_country, next_country)
+
+
+def main(argv=None):
+    """Prebuild the route snapshot, e.g. at deploy time"""
+    parser = argparse.ArgumentParser(description="Build the route graph snapshot used by RouteManager")
+    parser.add_argument("--routes", default="data/routes.csv", help="routes CSV file")
+    parser.add_argument("--airports", default="data/airports.csv", help="airports CSV file")
+    parser.add_argument("--snapshot", help="snapshot file to write (default: next to the routes CSV)")
+    parser.add_argument("--granularity", choices=GRANULARITIES, default="country", help="what a graph node stands for")
+    parser.add_argument("--distance-memory-budget", type=int, default=DEFAULT_DISTANCE_MEMORY_BUDGET,
+                        metavar="BYTES", help="largest all-pairs distance index to precompute")
+    parser.add_argument("--distance-aggregate", choices=DISTANCE_AGGREGATES, default="median",
+                        help="how airport-pair distances combine into one edge length")
+    parser.add_argument("--loader", choices=LOADERS, default="csv", help="CSV parser used when building")
+    parser.add_argument("--force", action="store_true", help="rebuild even if the snapshot is fresh")
+    parser.add_argument("--export-min-stops", type=int, metavar="N",
+                        help="also export country pairs with at least N flights to CSV")
+    parser.add_argument("--output", default="data/country_routes_min_2_stops.csv", help="CSV file for the export")
+    args = parser.parse_args(argv)
+
+    route_manager = RouteManager(routes_file=args.routes, airports_file=args.airports,
+                                 output_file=args.output, snapshot_file=args.snapshot,
+                                 use_snapshot=not args.force, granularity=args.granularity,
+                                 distance_memory_budget=args.distance_memory_budget,
+                                 distance_aggregate=args.distance_aggregate, loader=args.loader)
+    if args.force:
+        route_manager.save_snapshot()
+
+    state = "up to date" if route_manager.loaded_from_snapshot else "written"
+    print(f"Snapshot '{route_manager.snapshot_file}' {state} ({len(route_manager.countries)} "
+          f"{route_manager.granularity} nodes, {route_manager.distance_mode} distances, "
+          f"source hash {route_manager.source_hash[:12]}).")
+
+    if args.export_min_stops is not None:
+        route_manager.find_routes_with_min_stops(min_path_length=args.export_min_stops)
+        print(f"Country-to-country routes with at least {args.export_min_stops} flights saved to "
+              f"'{route_manager.output_file}'.")
 
 
-# If run directly, generate the CSV file
 if __name__ == "__main__":
-    route_manager = RouteManager()
-    route_manager.find_routes_with_min_stops(min_path_length=3)
-    print(f"Country-to-country routes with at least 3 flights saved to '{route_manager.output_file}'.")
\ No newline at end of file
+    main()
@@ -0,0 +1,64 @@
+from collections import Counter
+
+import numpy as np
+
+from csv_columns import read_columns
+from graph_backend import UNREACHABLE, bfs
+
+# Columns that identify one route in routes.csv
+ROUTE_COLUMNS = ["Source airport", "Destination airport", "Airline"]
+
+
+def read_routes(routes_file):
+    """Multiset of (source airport, destination airport, airline) routes in a routes CSV"""
+    routes = read_columns(routes_file, ROUTE_COLUMNS)
+    return Counter(zip(routes["Source airport"], routes["Destination airport"], routes["Airline"]))
+
+
+def read_route_diff(old_routes_file, new_routes_file):
+    """(added, removed) lists of (source airport, destination airport, airline) between two routes CSVs"""
+    old_routes = read_routes(old_routes_file)
+    new_routes = read_routes(new_routes_file)
+    return list((new_routes - old_routes).elements()), list((old_routes - new_routes).elements())
+
+
+def edge_attributes_from_routes(routes):
+    """route_count, airline_count and airport_pair_count for one edge's route multiset"""
+    return {
+        "route_count": sum(routes.values()),
+        "airline_count": len({airline for airline, _, _ in routes}),
+        "airport_pair_count": len({(source, dest) for _, source, dest in routes}),
+    }
+
+
+def rows_using_edges(distances, edges):
+    """Sources for which some edge (u, v) lies on a shortest path, i.e. d(s, u) + 1 == d(s, v)"""
+    if not edges:
+        return np.array([], dtype=np.int64)
+    u_ids, v_ids = (np.array(ids) for ids in zip(*edges))
+    via = distances[:, u_ids].astype(np.int16) + 1
+    tight = (distances[:, u_ids] != UNREACHABLE) & (via == distances[:, v_ids])
+    return np.flatnonzero(tight.any(axis=1))
+
+
+def repair_after_removals(distances, adjacency, removed_edges):
+    """Re-run BFS in place for the rows whose shortest paths used a removed edge; returns those rows"""
+    rows = rows_using_edges(distances, removed_edges)
+    for source in rows.tolist():
+        distances[source] = bfs(adjacency, source)
+    return rows
+
+
+def repair_after_insertions(distances, added_edges):
+    """Lower distances in place through each inserted edge (u, v) in turn; returns the rows that changed"""
+    work = distances.astype(np.int16)
+    changed = set()
+    for u, v in added_edges:
+        via = work[:, u] + 1
+        rows = np.flatnonzero(via < work[:, v])
+        if len(rows):
+            work[rows] = np.minimum(work[rows], via[rows, None] + work[v][None, :])
+            changed.update(rows.tolist())
+    np.minimum(work, UNREACHABLE, out=work)
+    distances[...] = work
+    return np.array(sorted(changed), dtype=np.int64)
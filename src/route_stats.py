@@ -0,0 +1,304 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import time
+
+import numpy as np
+
+# Graphs smaller than this are analysed in-process; a pool costs more to start than it saves
+POOL_MIN_NODES = 1000
+
+_UNSEEN = -1
+
+# Set in each pool worker by _init_worker
+_worker_graph = None
+
+
+def graph_version(csr):
+    """Content hash of a graph's nodes and edges, used as the statistics cache key"""
+    digest = hashlib.sha256()
+    digest.update("\0".join(csr.nodes).encode("utf-8"))
+    digest.update(np.ascontiguousarray(csr.indptr, dtype=np.int64).tobytes())
+    digest.update(np.ascontiguousarray(csr.indices, dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+
+def _expand(indptr, indices, frontier):
+    """All edges leaving frontier as (parents, children) arrays"""
+    starts = indptr[frontier]
+    counts = indptr[frontier + 1] - starts
+    total = int(counts.sum())
+    if total == 0:
+        return frontier[:0], frontier[:0]
+    parents = np.repeat(frontier, counts)
+    # Position of every edge within its row, added to the row start
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return parents, indices[np.repeat(starts, counts) + offsets]
+
+
+def _source_statistics(indptr, indices, source, betweenness):
+    """Level-synchronous BFS from source plus Brandes' dependency accumulation
+
+    Returns the distance row; adds source's dependencies to betweenness
+    when it is given.
+    """
+    n = len(indptr) - 1
+    distances = np.full(n, _UNSEEN, dtype=np.int32)
+    distances[source] = 0
+    sigma = np.zeros(n)
+    sigma[source] = 1.0
+    frontier = np.array([source], dtype=indices.dtype)
+    levels = []
+    depth = 0
+    while len(frontier):
+        depth += 1
+        parents, children = _expand(indptr, indices, frontier)
+        distances[children[distances[children] == _UNSEEN]] = depth
+        on_level = distances[children] == depth
+        parents, children = parents[on_level], children[on_level]
+        np.add.at(sigma, children, sigma[parents])
+        levels.append((parents, children))
+        frontier = np.unique(children)
+
+    if betweenness is not None:
+        delta = np.zeros(n)
+        for parents, children in reversed(levels):
+            np.add.at(delta, parents, sigma[parents] / sigma[children] * (1.0 + delta[children]))
+        delta[source] = 0.0
+        betweenness += delta
+    return distances
+
+
+def _batch_statistics(indptr, indices, sources, betweenness_sources):
+    """Histogram, per-source eccentricity, reach and total distance, and betweenness contributions"""
+    n = len(indptr) - 1
+    histogram = np.zeros(n + 1, dtype=np.int64)
+    eccentricity = np.zeros(len(sources), dtype=np.int32)
+    reachable = np.zeros(len(sources), dtype=np.int32)
+    total_length = np.zeros(len(sources), dtype=np.int64)
+    betweenness = np.zeros(n)
+    for i, source in enumerate(sources):
+        row = _source_statistics(indptr, indices, source, betweenness if source in betweenness_sources else None)
+        found = row[row > 0]
+        histogram += np.bincount(found, minlength=n + 1)
+        eccentricity[i] = found.max() if len(found) else 0
+        reachable[i] = len(found)
+        total_length[i] = found.sum()
+    return histogram, eccentricity, reachable, total_length, betweenness
+
+
+def _init_worker(indptr, indices):
+    global _worker_graph
+    _worker_graph = (indptr, indices)
+
+
+def _run_batch(args):
+    sources, betweenness_sources = args
+    return _batch_statistics(*_worker_graph, sources, betweenness_sources)
+
+
+def strongly_connected_components(adjacency):
+    """Tarjan's algorithm without recursion; components as lists of node IDs"""
+    n = len(adjacency)
+    index = [-1] * n
+    lowlink = [0] * n
+    on_stack = [False] * n
+    stack = []
+    components = []
+    counter = 0
+    for root in range(n):
+        if index[root] != -1:
+            continue
+        work = [(root, iter(adjacency[root]))]
+        index[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        while work:
+            node, neighbors = work[-1]
+            for v in neighbors:
+                if index[v] == -1:
+                    index[v] = lowlink[v] = counter
+                    counter += 1
+                    stack.append(v)
+                    on_stack[v] = True
+                    work.append((v, iter(adjacency[v])))
+                    break
+                if on_stack[v]:
+                    lowlink[node] = min(lowlink[node], index[v])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        v = stack.pop()
+                        on_stack[v] = False
+                        component.append(v)
+                        if v == node:
+                            break
+                    components.append(component)
+    return components
+
+
+class RouteStatistics:
+    """Exact all-pairs statistics of a route graph, computed once per graph version
+
+    One BFS per source gives the hop-length histogram, unreachable pairs,
+    eccentricities and diameter; Brandes' algorithm on the same BFS gives
+    betweenness centrality. Sources are processed in batches, on a process
+    pool for graphs of POOL_MIN_NODES nodes or more. Betweenness can be
+    estimated from betweenness_sources randomly chosen sources instead of
+    all of them, which keeps airport granularity to seconds.
+
+    Results are memoized per (graph version, options) and, with cache_dir,
+    also stored as JSON next to the data.
+    """
+
+    _memory = {}
+
+    def __init__(self, route_manager, processes=None, batch_size=None, betweenness_sources=None, seed=0,
+                 cache_dir=None):
+        self.route_manager = route_manager
+        self.processes = processes
+        self.batch_size = batch_size
+        self.betweenness_sources = betweenness_sources
+        self.seed = seed
+        self.cache_dir = cache_dir
+
+    def cache_key(self, csr):
+        sources = "all" if self.betweenness_sources is None else f"{self.betweenness_sources}-{self.seed}"
+        return f"{graph_version(csr)[:24]}-{sources}"
+
+    def compute(self):
+        """The statistics dict, from the cache when this graph version was analysed before"""
+        csr = self.route_manager.csr
+        key = self.cache_key(csr)
+        if key in self._memory:
+            return self._memory[key]
+
+        path = os.path.join(self.cache_dir, f"route_stats_{key}.json") if self.cache_dir else None
+        if path and os.path.exists(path):
+            with open(path) as f:
+                statistics = json.load(f)
+            # JSON object keys are strings
+            statistics["length_histogram"] = {int(k): v for k, v in statistics["length_histogram"].items()}
+        else:
+            statistics = self._compute(csr)
+            if path:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(statistics, f)
+                os.replace(tmp_path, path)
+
+        self._memory[key] = statistics
+        return statistics
+
+    def _compute(self, csr):
+        start = time.perf_counter()
+        n = len(csr.nodes)
+        indptr = np.asarray(csr.indptr, dtype=np.int64)
+        indices = np.asarray(csr.indices, dtype=np.int64)
+
+        if self.betweenness_sources is None or self.betweenness_sources >= n:
+            pivots = set(range(n))
+        else:
+            pivots = set(random.Random(self.seed).sample(range(n), self.betweenness_sources))
+
+        processes = self.processes
+        if processes is None:
+            processes = (os.cpu_count() or 1) if n >= POOL_MIN_NODES else 1
+        batch_size = self.batch_size or max(1, -(-n // (processes * 8)))
+        batches = [list(range(i, min(n, i + batch_size))) for i in range(0, n, batch_size)]
+        jobs = [(batch, pivots.intersection(batch)) for batch in batches]
+
+        if processes > 1:
+            context = multiprocessing.get_context("spawn")
+            with context.Pool(processes, initializer=_init_worker, initargs=(indptr, indices)) as pool:
+                results = pool.map(_run_batch, jobs)
+        else:
+            results = [_batch_statistics(indptr, indices, *job) for job in jobs]
+
+        histogram = sum(result[0] for result in results)
+        eccentricity = np.concatenate([result[1] for result in results])
+        reachable = np.concatenate([result[2] for result in results])
+        total_length = np.concatenate([result[3] for result in results])
+        betweenness = sum(result[4] for result in results)
+        if pivots and len(pivots) < n:
+            betweenness *= n / len(pivots)
+        if n > 2:
+            betweenness /= (n - 1) * (n - 2)
+
+        components = strongly_connected_components(csr.adjacency)
+        components.sort(key=len, reverse=True)
+        reachable_pairs = int(histogram.sum())
+        lengths = np.flatnonzero(histogram)
+
+        return {
+            "nodes": n,
+            "edges": int(len(indices)),
+            "pairs": n * (n - 1),
+            "reachable_pairs": reachable_pairs,
+            "unreachable_pairs": n * (n - 1) - reachable_pairs,
+            "length_histogram": {int(k): int(histogram[k]) for k in lengths},
+            "mean_length": float((lengths * histogram[lengths]).sum() / reachable_pairs) if reachable_pairs else 0.0,
+            "diameter": int(lengths.max()) if len(lengths) else 0,
+            # Longest shortest path from each node to the nodes it can reach
+            "eccentricity": dict(zip(csr.nodes, eccentricity.tolist())),
+            "mean_distance": dict(zip(csr.nodes, (total_length / np.maximum(reachable, 1)).tolist())),
+            "reaches_all": [csr.nodes[i] for i in np.flatnonzero(reachable == n - 1)],
+            "strongly_connected_components": [[csr.nodes[i] for i in component] for component in components],
+            "betweenness": dict(zip(csr.nodes, betweenness.tolist())),
+            "betweenness_sources": len(pivots),
+            "processes": processes,
+            "seconds": time.perf_counter() - start,
+        }
+
+
+def top(mapping, count=5, reverse=True):
+    """The count items of a {name: value} dict with the largest (or smallest) values"""
+    return sorted(mapping.items(), key=lambda item: item[1], reverse=reverse)[:count]
+
+
+def main(argv=None):
+    """Compute exact statistics for a granularity and print them, optionally also as JSON"""
+    from route import GRANULARITIES, RouteManager
+
+    parser = argparse.ArgumentParser(description="Exact all-pairs statistics of the route graph")
+    parser.add_argument("--granularity", choices=GRANULARITIES, default="country")
+    parser.add_argument("--processes", type=int, help="worker processes (default: all cores for large graphs)")
+    parser.add_argument("--batch-size", type=int, help="sources per batch sent to a worker")
+    parser.add_argument("--betweenness-sources", type=int,
+                        help="estimate betweenness from this many random sources instead of all")
+    parser.add_argument("--cache-dir", default="data", help="directory for cached results ('' to disable)")
+    parser.add_argument("--json", help="also write the statistics to this JSON file")
+    args = parser.parse_args(argv)
+
+    route_manager = RouteManager(granularity=args.granularity)
+    statistics = RouteStatistics(route_manager, processes=args.processes, batch_size=args.batch_size,
+                                 betweenness_sources=args.betweenness_sources,
+                                 cache_dir=args.cache_dir or None).compute()
+
+    print(f"{statistics['nodes']} nodes, {statistics['edges']} edges, diameter {statistics['diameter']}, "
+          f"{statistics['unreachable_pairs']} unreachable pairs, "
+          f"{len(statistics['strongly_connected_components'])} strongly connected components "
+          f"(computed in {statistics['seconds']:.2f}s on {statistics['processes']} process(es))")
+    for length, count in statistics["length_histogram"].items():
+        print(f"  Length {length}: {count} pairs")
+    print("Top hubs by betweenness:")
+    for node, value in top(statistics["betweenness"], 10):
+        print(f"  {node}: {value:.4f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(statistics, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,22 @@
-import pandas as pd
-import networkx as nx
-import matplotlib.pyplot as plt
-from route import RouteManager
+from route import GRANULARITIES, RouteManager
+from exact_length import engine_for
+from route_stats import RouteStatistics, top
+from path_render import PathRenderer
+import argparse
+import importlib.util
+import csv
+import json
+import multiprocessing
+import shutil
 import sys
+import time
+
+# Fields of one batch answer, in CSV column order
+BATCH_FIELDS = ("source", "destination", "exact_length", "status", "length", "path", "error")
+BATCH_FORMATS = ("csv", "jsonl")
+
+# Set in each batch worker by _init_batch_worker
+_batch_route_manager = None
 
 
 def show_shortest_path(source, destination, route_manager):
@@ -15,83 +29,78 @@ def show_shortest_path(source, destination, route_manager):
         print(f"Error: Destination country '{destination}' not found in graph.")
         return False
 
-    try:
-        path = nx.shortest_path(route_manager.graph, source=source, target=destination)
-        path_length = len(path) - 1
-
-        print(f"\nShortest path from {source} to {destination}:")
-        print(" → ".join(path))
-        print(f"Path length: {path_length} (requires {path_length} flights)")
-
-        return True
-    except nx.NetworkXNoPath:
+    path = route_manager.shortest_path(source, destination)
+    if path is None:
         print(f"No path exists from {source} to {destination}.")
         return False
 
+    path_length = len(path) - 1
+
+    print(f"\nShortest path from {source} to {destination}:")
+    print(" → ".join(path))
+    print(f"Path length: {path_length} (requires {path_length} flights)")
 
-def plot_path(source, destination, route_manager, path=None):
-    """Plot the shortest path or a specific path between source and destination countries"""
+    return True
+
+
+def plot_path(source, destination, route_manager, path=None, output=None):
+    """Render the shortest path or a specific path between source and destination countries
+
+    The image is drawn on a fixed geographic layout and cached under
+    path_render.DEFAULT_CACHE_DIR; with output it is also copied there.
+    Returns the image file, or False on failure.
+    """
     try:
         if path is None:
-            path = nx.shortest_path(route_manager.graph, source=source, target=destination)
+            path = route_manager.shortest_path(source, destination)
+        if path is None:
+            print(f"No path exists from {source} to {destination}.")
+            return False
 
-        # Create a subgraph with the path edges
-        path_edges = list(zip(path[:-1], path[1:]))
         # Check if all edges exist in the graph
-        for edge in path_edges:
-            if not route_manager.graph.has_edge(*edge):
+        for edge in zip(path[:-1], path[1:]):
+            if not route_manager.check_valid_move(*edge):
                 print(f"Error: Edge {edge} does not exist in the graph.")
                 return False
 
-        path_graph = route_manager.graph.edge_subgraph(path_edges)
-
-        plt.figure(figsize=(12, 8))
-        pos = nx.spring_layout(path_graph, seed=42)
-
-        # Draw the graph
-        nx.draw(path_graph, pos, with_labels=True, node_color='lightblue',
-                node_size=1500, font_size=10, font_weight='bold',
-                arrows=True, arrowsize=20, edge_color='gray')
-
-        # Draw path edges in red
-        nx.draw_networkx_edges(path_graph, pos, edgelist=path_edges,
-                               width=2, edge_color='red', arrows=True, arrowsize=20)
-
-        plt.title(f"Path from {source} to {destination} (Length: {len(path) - 1})")
-        plt.tight_layout()
-        plt.savefig(f"{source}_to_{destination}_path.png")
-        print(f"Path visualization saved as '{source}_to_{destination}_path.png'")
-
-        plt.show()
-        return True
-    except nx.NetworkXNoPath:
-        print(f"No path exists from {source} to {destination}.")
-        return False
+        file = PathRenderer(route_manager).render(path)
+        if output:
+            shutil.copyfile(file, output)
+            file = output
+        print(f"Path visualization saved as '{file}'")
+        return file
     except Exception as e:
         print(f"Error plotting path: {e}")
         return False
 
 
-def find_paths_with_exact_length(route_manager, exact_length=3):
-    """Find paths with exactly the specified length"""
+def find_paths_with_exact_length(route_manager, exact_length=3, mode="shortest"):
+    """Find paths with exactly the specified length
+
+    mode "shortest" lists pairs whose shortest path has that length; "walk"
+    and "simple" list every pair joined by a route of exactly that many
+    flights (simple routes visit no country twice), using the batched
+    exact-length engine.
+    """
+    if mode in ("walk", "simple"):
+        return list(engine_for(route_manager.csr).all_pairs(exact_length, simple=mode == "simple"))
+
     paths_with_exact_length = []
 
-    for source in route_manager.countries:
-        for target in route_manager.countries:
-            if source != target:
-                try:
-                    path = nx.shortest_path(route_manager.graph, source=source, target=target)
-                    path_length = len(path) - 1
-                    if path_length == exact_length:
-                        paths_with_exact_length.append((source, target, path))
-                except nx.NetworkXNoPath:
-                    continue
+    # Pairs come straight from the precomputed length index
+    for source, target, _ in route_manager.pairs_by_length(exact_length, exact_length):
+        path = route_manager.shortest_path(source, target)
+        paths_with_exact_length.append((source, target, path))
 
     return paths_with_exact_length
 
 
-def find_path_with_exact_length_between_countries(source, destination, route_manager, exact_length):
-    """Find a valid path with exactly the specified length between two countries"""
+def find_path_with_exact_length_between_countries(source, destination, route_manager, exact_length, simple=False):
+    """Find a valid path with exactly the specified length between two countries
+
+    Countries may be visited more than once unless simple is set; only the
+    destination is never passed through early.
+    """
     if source not in route_manager.countries:
         print(f"Error: Source country '{source}' not found in graph.")
         return None
@@ -105,47 +114,48 @@ def find_path_with_exact_length_between_countries(source, destination, route_man
         return None
 
     # First check if shortest path is already the exact length
-    try:
-        shortest_path = nx.shortest_path(route_manager.graph, source=source, target=destination)
-        shortest_length = len(shortest_path) - 1
-
-        if shortest_length == exact_length:
-            return shortest_path
-        elif shortest_length > exact_length:
-            print(f"The shortest path length ({shortest_length}) is greater than requested length ({exact_length}).")
-            return None
-    except nx.NetworkXNoPath:
+    shortest_length = route_manager.path_length(source, destination)
+
+    if shortest_length is None:
         print(f"No path exists from {source} to {destination}.")
         return None
+    elif shortest_length == exact_length:
+        return route_manager.shortest_path(source, destination)
+    elif shortest_length > exact_length:
+        print(f"The shortest path length ({shortest_length}) is greater than requested length ({exact_length}).")
+        return None
 
-    # Use a modified BFS to find paths of the exact length
+    # Dynamic programming over hop layers finds the first route of the exact length
+    # without enumerating the others
     print(f"Searching for path with exactly {exact_length} flights between {source} and {destination}...")
+    engine = engine_for(route_manager.csr)
+    if simple:
+        path = engine.simple_path(source, destination, exact_length)
+    else:
+        path = engine.walk(source, destination, exact_length)
 
-    def find_paths_of_length(G, source, target, length):
-        if length == 0:
-            return [[source]] if source == target else []
-
-        if length == 1:
-            return [[source, target]] if G.has_edge(source, target) else []
-
-        paths = []
-        for neighbor in G.neighbors(source):
-            if neighbor != target:  # Avoid early arrival
-                for path in find_paths_of_length(G, neighbor, target, length - 1):
-                    if path[0] == neighbor:  # Ensure valid path
-                        paths.append([source] + path)
+    if path is None:
+        print(f"No path with exactly {exact_length} flights found between {source} and {destination}.")
+        return None
 
-        return paths
+    return path
 
-    # Try to find paths with the requested length
-    paths = find_paths_of_length(route_manager.graph, source, destination, exact_length)
 
-    if not paths:
-        print(f"No path with exactly {exact_length} flights found between {source} and {destination}.")
+def count_paths_with_exact_length(source, destination, route_manager, exact_length, simple_limit=100000):
+    """Print how many routes of exactly exact_length flights join two countries, with a random one"""
+    if source not in route_manager.countries or destination not in route_manager.countries:
+        print("Error: Both countries must be in the graph.")
         return None
 
-    # Return the first valid path
-    return paths[0]
+    engine = engine_for(route_manager.csr)
+    walks = engine.count_walks(source, destination, exact_length)
+    simple = engine.count_simple_paths(source, destination, exact_length, limit=simple_limit)
+
+    print(f"\nRoutes with exactly {exact_length} flights from {source} to {destination}: {walks}")
+    print(f"Without visiting a country twice: {simple}{'+' if simple >= simple_limit else ''}")
+    if simple:
+        print(f"Random example: {' → '.join(engine.random_simple_path(source, destination, exact_length))}")
+    return walks, simple
 
 
 def list_random_examples(route_manager, count=5, min_length=2, max_length=5):
@@ -153,17 +163,7 @@ def list_random_examples(route_manager, count=5, min_length=2, max_length=5):
     import random
 
     # Find all paths within the length range
-    valid_paths = []
-
-    for source in route_manager.countries:
-        for target in route_manager.countries:
-            if source != target:
-                try:
-                    path_length = nx.shortest_path_length(route_manager.graph, source=source, target=target)
-                    if min_length <= path_length <= max_length:
-                        valid_paths.append((source, target, path_length))
-                except nx.NetworkXNoPath:
-                    continue
+    valid_paths = route_manager.pairs_by_length(min_length, max_length)
 
     # Sample random paths
     if not valid_paths:
@@ -175,51 +175,56 @@ def list_random_examples(route_manager, count=5, min_length=2, max_length=5):
 
     print(f"\nRandom examples of routes with path length between {min_length} and {max_length}:")
     for source, target, length in samples:
-        path = nx.shortest_path(route_manager.graph, source=source, target=target)
+        path = route_manager.shortest_path(source, target)
         print(f"{source} to {target} (length {length}): {' → '.join(path)}")
 
     return samples
 
 
-def print_route_statistics(route_manager):
-    """Print statistics about the routes graph"""
-    print("\nRoute Statistics:")
-    print(f"Total countries: {len(route_manager.countries)}")
-    print(f"Total connections: {route_manager.graph.number_of_edges()}")
+def print_route_statistics(route_manager, processes=None, betweenness_sources=None):
+    """Print statistics about the routes graph
 
-    # Count paths of different lengths
-    path_lengths = {}
-    max_processed = 1000  # Limit to avoid excessive processing
-    processed = 0
-
-    for source in route_manager.countries:
-        if processed >= max_processed:
-            break
+    Path lengths, eccentricities, components and betweenness are exact over
+    all pairs (see route_stats.RouteStatistics) and cached per graph version.
+    """
+    statistics = RouteStatistics(route_manager, processes=processes,
+                                 betweenness_sources=betweenness_sources).compute()
 
-        for target in route_manager.countries:
-            if source != target:
-                try:
-                    path_length = nx.shortest_path_length(route_manager.graph, source=source, target=target)
-                    path_lengths[path_length] = path_lengths.get(path_length, 0) + 1
-                    processed += 1
-                    if processed >= max_processed:
-                        break
-                except nx.NetworkXNoPath:
-                    continue
-
-    print("\nPath length distribution (based on sample):")
-    for length in sorted(path_lengths.keys()):
-        print(f"  Length {length}: {path_lengths[length]} paths")
+    print("\nRoute Statistics:")
+    print(f"Total countries: {len(route_manager.countries)}")
+    print(f"Total connections: {route_manager.csr.number_of_edges()}")
+    print(f"Connected pairs: {statistics['reachable_pairs']} of {statistics['pairs']} "
+          f"({statistics['unreachable_pairs']} unreachable)")
+    print(f"Diameter: {statistics['diameter']} flights, mean shortest path {statistics['mean_length']:.2f} flights")
+
+    print("\nPath length distribution (all pairs):")
+    for length, count in statistics["length_histogram"].items():
+        print(f"  Length {length}: {count} paths")
+
+    components = statistics["strongly_connected_components"]
+    print(f"\nStrongly connected components: {len(components)} (largest has {len(components[0])} countries)")
+    for component in components[1:6]:
+        print(f"  {', '.join(component)}")
+
+    # Centrality within the largest component: fewest flights to the farthest country, then on average
+    centrality = {country: (statistics["eccentricity"][country], statistics["mean_distance"][country])
+                  for country in components[0]}
+    most_central = [country for country, _ in top(centrality, 5, reverse=False)]
+    print(f"Most central countries: {', '.join(most_central)}")
+
+    print("\nTop 5 hub countries (share of shortest paths passing through):")
+    for country, value in top(statistics["betweenness"], 5):
+        print(f"  {country}: {value:.3f}")
 
     # Countries with most connections
-    out_degrees = dict(route_manager.graph.out_degree())
+    out_degrees = route_manager.csr.out_degree()
     top_sources = sorted(out_degrees.items(), key=lambda x: x[1], reverse=True)[:5]
 
     print("\nTop 5 source countries (most outgoing flights):")
     for country, count in top_sources:
         print(f"  {country}: {count} destinations")
 
-    in_degrees = dict(route_manager.graph.in_degree())
+    in_degrees = route_manager.csr.in_degree()
     top_destinations = sorted(in_degrees.items(), key=lambda x: x[1], reverse=True)[:5]
 
     print("\nTop 5 destination countries (most incoming flights):")
@@ -227,9 +232,169 @@ def print_route_statistics(route_manager):
         print(f"  {country}: {count} sources")
 
 
-def main():
+def read_queries(lines):
+    """Yield (source, destination, exact_length or None, error or None) from CSV lines
+
+    Blank lines, lines starting with # and a leading header row are skipped;
+    names containing commas must be quoted. A malformed row is yielded with
+    error describing it, so the batch answers it as "bad_query" and goes on.
+    """
+    for row_number, row in enumerate(csv.reader(lines), 1):
+        if not row or not row[0].strip() or row[0].lstrip().startswith("#"):
+            continue
+        if row_number == 1 and row[0].strip().lower() in ("source", "source country"):
+            continue
+        source, destination = row[0].strip(), row[1].strip() if len(row) > 1 else ""
+        if not destination:
+            yield source, destination, None, f"line {row_number}: needs a source and a destination"
+            continue
+        exact_length = row[2].strip() if len(row) > 2 else ""
+        try:
+            yield source, destination, int(exact_length) if exact_length else None, None
+        except ValueError:
+            yield source, destination, None, f"line {row_number}: exact_length {exact_length!r} is not an integer"
+
+
+def answer_query(route_manager, source, destination, exact_length=None, error=None, simple=False):
+    """Answer one query without printing, as a dict with the BATCH_FIELDS keys
+
+    Without exact_length the answer is a shortest path; with it, the first
+    route of exactly that many flights (repeating no country when simple is
+    set). status is "ok", "unknown_country", "same_country", "no_path",
+    "too_short" (the shortest path is already longer), "no_exact_path" or
+    "bad_query" (error, from read_queries, says what was wrong with the row).
+    """
+    answer = {"source": source, "destination": destination, "exact_length": exact_length,
+              "status": "ok", "length": None, "path": None, "error": error}
+    if error is not None:
+        answer["status"] = "bad_query"
+        return answer
+    if source not in route_manager.countries or destination not in route_manager.countries:
+        answer["status"] = "unknown_country"
+        return answer
+    if source == destination:
+        answer["status"] = "same_country"
+        return answer
+
+    shortest_length = route_manager.path_length(source, destination)
+    if shortest_length is None:
+        answer["status"] = "no_path"
+    elif exact_length is None or shortest_length == exact_length:
+        answer["length"] = shortest_length
+        answer["path"] = route_manager.shortest_path(source, destination)
+    elif shortest_length > exact_length:
+        answer["status"] = "too_short"
+    else:
+        engine = engine_for(route_manager.csr)
+        path = (engine.simple_path if simple else engine.walk)(source, destination, exact_length)
+        if path is None:
+            answer["status"] = "no_exact_path"
+        else:
+            answer["length"] = exact_length
+            answer["path"] = path
+    return answer
+
+
+def _share_exact_length_layers(route_manager, cache_targets):
+    """Let the shared exact-length engine keep layers for up to cache_targets destinations"""
+    engine = engine_for(route_manager.csr)
+    engine.max_cached_targets = max(engine.max_cached_targets, cache_targets)
+
+
+def _init_batch_worker(snapshot_file, cache_targets):
+    global _batch_route_manager
+    _batch_route_manager = RouteManager.attach(snapshot_file)
+    _share_exact_length_layers(_batch_route_manager, cache_targets)
+
+
+def _answer_in_worker(args):
+    query, simple = args
+    return answer_query(_batch_route_manager, *query, simple=simple)
+
+
+def _batch_writer(output, output_format):
+    """A function writing one answer to output in output_format"""
+    if output_format == "jsonl":
+        def write(answer):
+            output.write(json.dumps(answer, ensure_ascii=False) + "\n")
+        return write
+
+    writer = csv.writer(output)
+    writer.writerow(BATCH_FIELDS)
+
+    def write(answer):
+        row = dict(answer, path=" → ".join(answer["path"]) if answer["path"] else "")
+        writer.writerow(["" if row[field] is None else row[field] for field in BATCH_FIELDS])
+    return write
+
+
+def run_batch(route_manager, queries, output, output_format="csv", processes=1, simple=False, chunksize=64,
+              cache_targets=1024):
+    """Answer queries and stream each answer to output as soon as it is ready
+
+    All queries share route_manager's precomputed distance index and
+    exact-length engine, whose layers are kept for up to cache_targets
+    destinations so repeated destinations are not recomputed. With
+    processes > 1 the queries are spread over worker processes that attach
+    to route_manager's snapshot file instead of rebuilding the graph;
+    answers still come out in query order.
+    Returns (number of queries, seconds).
+    """
+    if output_format not in BATCH_FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}', expected one of {BATCH_FORMATS}")
+    write = _batch_writer(output, output_format)
+    _share_exact_length_layers(route_manager, cache_targets)
+    start = time.perf_counter()
+    answered = 0
+
+    if processes > 1:
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(processes, initializer=_init_batch_worker,
+                          initargs=(route_manager.snapshot_file, cache_targets)) as pool:
+            jobs = ((query, simple) for query in queries)
+            for answer in pool.imap(_answer_in_worker, jobs, chunksize=chunksize):
+                write(answer)
+                answered += 1
+    else:
+        for query in queries:
+            write(answer_query(route_manager, *query, simple=simple))
+            answered += 1
+
+    output.flush()
+    return answered, time.perf_counter() - start
+
+
+def batch_main(args):
+    """Run the batch mode for parsed command-line args, reporting throughput on stderr"""
+    route_manager = RouteManager(granularity=args.granularity)
+    with (sys.stdin if args.queries == "-" else open(args.queries, newline="", encoding="utf-8")) as lines, \
+            (sys.stdout if args.output == "-" else open(args.output, "w", newline="", encoding="utf-8")) as output:
+        answered, seconds = run_batch(route_manager, read_queries(lines), output, args.format,
+                                      processes=args.processes, simple=args.simple)
+    rate = answered / seconds if seconds else float("inf")
+    print(f"Answered {answered} queries in {seconds:.2f}s ({rate:.0f} queries/s, "
+          f"{args.processes} process(es))", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Explore the route graph interactively, or answer a batch "
+                                                 "of source,destination[,exact_length] queries")
+    parser.add_argument("--batch", dest="queries", metavar="FILE",
+                        help="answer the queries in this CSV file ('-' for stdin) instead of showing the menu")
+    parser.add_argument("--output", default="-", help="where to write batch answers (default: stdout)")
+    parser.add_argument("--format", choices=BATCH_FORMATS, default="csv", help="batch output format")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes for the batch")
+    parser.add_argument("--simple", action="store_true",
+                        help="exact-length answers may not visit a country twice")
+    parser.add_argument("--granularity", choices=GRANULARITIES, default="country")
+    args = parser.parse_args(argv)
+
+    if args.queries is not None:
+        batch_main(args)
+        return
+
     # Initialize RouteManager
-    route_manager = RouteManager()
+    route_manager = RouteManager(granularity=args.granularity)
 
     # Print menu and process commands
     while True:
@@ -240,9 +405,10 @@ def main():
         print("4. Show route statistics")
         print("5. Find paths with exact length")
         print("6. Find a path with exact length between two countries")
+        print("7. Count paths with exact length between two countries")
         print("0. Exit")
 
-        choice = input("\nEnter your choice (0-6): ")
+        choice = input("\nEnter your choice (0-7): ")
 
         if choice == '0':
             print("Exiting Route Tester. Goodbye!")
@@ -297,15 +463,19 @@ def main():
                 if input("Visualize this path? (y/n): ").lower() == 'y':
                     plot_path(source, destination, route_manager, path)
 
+        elif choice == '7':
+            source = input("Enter source country: ")
+            destination = input("Enter destination country: ")
+            exact_length = int(input("Enter exact path length: "))
+            count_paths_with_exact_length(source, destination, route_manager, exact_length)
+
         else:
             print("Invalid choice. Please try again.")
 
 
 if __name__ == "__main__":
-    # Check if matplotlib is available
-    try:
-        import matplotlib.pyplot as plt
-    except ImportError:
+    # Check if matplotlib is available, without paying for its import on every start
+    if importlib.util.find_spec("matplotlib") is None:
         print("Warning: matplotlib is not installed. Path visualization will not be available.")
         print("Install it with: pip install matplotlib")
 
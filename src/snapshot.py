@@ -0,0 +1,123 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+# Bump whenever the layout or the meaning of any stored array changes
+SNAPSHOT_VERSION = 5
+
+MAGIC = b"FRGSNAP\0"
+_PREAMBLE = struct.Struct("<8sII")  # magic, format version, header length
+_ALIGNMENT = 64
+
+
+def source_hash(*paths, extra=""):
+    """Content hash of the input files, used as the snapshot cache key"""
+    digest = hashlib.sha256(f"v{SNAPSHOT_VERSION}:{extra}".encode())
+    for path in paths:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Snapshot:
+    """Header metadata plus read-only arrays backed by a memory-mapped file
+
+    File layout:
+        preamble   magic, format version and header length
+        header     UTF-8 JSON: source hash, metadata and an array directory
+        arrays     raw little-endian array data, each aligned to 64 bytes
+    """
+
+    def __init__(self, source_hash, metadata, arrays):
+        self.source_hash = source_hash
+        self.metadata = metadata
+        self.arrays = arrays
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def to_bytes(self):
+        """Serialize into the binary snapshot layout"""
+        directory = {}
+        offset = 0
+        for name, array in self.arrays.items():
+            array = np.ascontiguousarray(array)
+            offset = -(-offset // _ALIGNMENT) * _ALIGNMENT
+            directory[name] = {"dtype": array.dtype.newbyteorder("<").str, "shape": list(array.shape),
+                               "offset": offset}
+            offset += array.nbytes
+
+        header = json.dumps({"source_hash": self.source_hash, "metadata": self.metadata,
+                             "arrays": directory}).encode("utf-8")
+        data_start = -(-(_PREAMBLE.size + len(header)) // _ALIGNMENT) * _ALIGNMENT
+
+        buffer = bytearray(data_start + offset)
+        _PREAMBLE.pack_into(buffer, 0, MAGIC, SNAPSHOT_VERSION, len(header))
+        buffer[_PREAMBLE.size:_PREAMBLE.size + len(header)] = header
+        for name, array in self.arrays.items():
+            entry = directory[name]
+            raw = np.ascontiguousarray(array, dtype=np.dtype(entry["dtype"])).tobytes()
+            start = data_start + entry["offset"]
+            buffer[start:start + len(raw)] = raw
+        return bytes(buffer)
+
+    @classmethod
+    def from_buffer(cls, buffer):
+        """Parse a snapshot from any buffer without copying the array data
+
+        Returns None when the buffer is not a snapshot of the current format version.
+        """
+        if len(buffer) < _PREAMBLE.size:
+            return None
+        magic, version, header_length = _PREAMBLE.unpack_from(buffer, 0)
+        if magic != MAGIC or version != SNAPSHOT_VERSION:
+            return None
+
+        header = json.loads(bytes(buffer[_PREAMBLE.size:_PREAMBLE.size + header_length]).decode("utf-8"))
+        data_start = -(-(_PREAMBLE.size + header_length) // _ALIGNMENT) * _ALIGNMENT
+
+        arrays = {}
+        for name, entry in header["arrays"].items():
+            dtype = np.dtype(entry["dtype"])
+            shape = tuple(entry["shape"])
+            count = int(np.prod(shape, dtype=np.int64))
+            array = np.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + entry["offset"])
+            array = array.reshape(shape)
+            array.flags.writeable = False
+            arrays[name] = array
+        return cls(header["source_hash"], header["metadata"], arrays)
+
+    def write(self, path):
+        """Atomically write the snapshot to path"""
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self.to_bytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, expected_hash=None):
+        """Memory-map a snapshot file
+
+        Returns None when the file is missing, unreadable, from another format
+        version or (if expected_hash is given) built from different inputs.
+        """
+        try:
+            with open(path, "rb") as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        try:
+            snapshot = cls.from_buffer(buffer)
+        except (ValueError, KeyError, UnicodeDecodeError):
+            return None
+        if snapshot is None or (expected_hash is not None and snapshot.source_hash != expected_hash):
+            return None
+        return snapshot
@@ -0,0 +1,92 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# How a measured process gets its route data
+STARTUP_MODES = ("snapshot", "rebuild")
+
+# Modules a cold start should not need; reported when one was imported anyway
+HEAVY_MODULES = ("pandas", "networkx", "matplotlib")
+
+# Spans that make up each phase of a RouteManager start
+PHASE_SPANS = {
+    "parse": ("load_data",),
+    "build": ("build_country_graph", "build_distance_index"),
+    "snapshot": ("load_snapshot",),
+}
+
+
+def _child(mode, loader, granularity):
+    """Start a RouteManager as the app would and print the phase timings as JSON"""
+    start = time.perf_counter()
+    from metrics import SPAN_SECONDS
+    from route import RouteManager
+    imported = time.perf_counter()
+
+    route_manager = RouteManager(granularity=granularity, loader=loader, use_snapshot=mode == "snapshot")
+    route_manager.pick_random_route(min_path_length=2)
+    ready = time.perf_counter()
+
+    report = {"import_seconds": imported - start, "startup_seconds": ready - start,
+              "from_snapshot": route_manager.loaded_from_snapshot,
+              "heavy_modules": [name for name in HEAVY_MODULES if name in sys.modules]}
+    for phase, names in PHASE_SPANS.items():
+        report[f"{phase}_seconds"] = sum(SPAN_SECONDS.labels(name).snapshot()[1] for name in names)
+    print(json.dumps(report))
+
+
+def measure_startup(mode, loader, granularity="country"):
+    """Start a fresh interpreter for one mode and loader and return its startup report
+
+    process_seconds is the wall time of the whole process, interpreter boot
+    included. In "snapshot" mode the snapshot is built first if it is stale,
+    so the measured start only maps it.
+    """
+    if mode not in STARTUP_MODES:
+        raise ValueError(f"Unknown startup mode '{mode}', expected one of {STARTUP_MODES}")
+    code = (f"import sys; sys.path.insert(0, {os.path.dirname(os.path.abspath(__file__))!r}); "
+            f"import startup; startup._child({mode!r}, {loader!r}, {granularity!r})")
+    if mode == "snapshot":
+        subprocess.run([sys.executable, "-c", code], check=True, capture_output=True)
+
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True)
+    process_seconds = time.perf_counter() - start
+    report = json.loads(completed.stdout.splitlines()[-1])
+    return {"mode": mode, "loader": loader, "process_seconds": process_seconds, **report}
+
+
+def interpreter_seconds():
+    """Wall time of a bare interpreter start, the floor under every measured process"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    """Print where cold-start time goes for each loader and way of getting the route data"""
+    from route import LOADERS
+
+    parser = argparse.ArgumentParser(description="Break RouteManager cold-start time into import, parse and build")
+    parser.add_argument("--granularity", choices=("country", "city", "airport"), default="country")
+    parser.add_argument("--modes", nargs="+", choices=STARTUP_MODES, default=list(STARTUP_MODES))
+    parser.add_argument("--loaders", nargs="+", choices=LOADERS, default=list(LOADERS))
+    args = parser.parse_args(argv)
+
+    print(f"interpreter start {interpreter_seconds():.3f}s")
+    print(f"{'mode':<9} {'loader':<7} {'import':>8} {'parse':>8} {'build':>8} {'snapshot':>9} {'startup':>8} "
+          f"{'process':>8}  heavy modules")
+    for mode in args.modes:
+        for loader in args.loaders:
+            report = measure_startup(mode, loader, args.granularity)
+            print(f"{mode:<9} {loader:<7} {report['import_seconds']:>7.3f}s {report['parse_seconds']:>7.3f}s "
+                  f"{report['build_seconds']:>7.3f}s {report['snapshot_seconds']:>8.3f}s "
+                  f"{report['startup_seconds']:>7.3f}s {report['process_seconds']:>7.3f}s  "
+                  f"{', '.join(report['heavy_modules']) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
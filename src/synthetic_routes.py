@@ -0,0 +1,101 @@
+import argparse
+import os
+import string
+
+import numpy as np
+import pandas as pd
+
+AIRPORT_COLUMNS = ["Airport ID", "Name", "City", "Country", "IATA", "ICAO", "Latitude", "Longitude", "Altitude",
+                   "Timezone", "DST", "Tz database time zone", "Type", "Source"]
+ROUTE_COLUMNS = ["Airline", "Airline ID", "Source airport", "Source airport ID", "Destination airport",
+                 "Destination airport ID", "Codeshare", "Stops", "Equipment"]
+
+
+def iata_code(index):
+    """Three-letter code for index 0..17575 (AAA, AAB, ...)"""
+    letters = string.ascii_uppercase
+    return letters[index // 676 % 26] + letters[index // 26 % 26] + letters[index % 26]
+
+
+def generate_network(countries=200, airports_per_country=4, routes=20000, airlines=300, hub_exponent=1.0,
+                     seed=0):
+    """Random airports and routes in the same shape as data/airports.csv and data/routes.csv
+
+    Airports are drawn as route endpoints with Zipf-like weights
+    (1 / rank ** hub_exponent), so a few hubs carry most routes, as in the
+    real data. Returns (airports DataFrame, routes DataFrame).
+    """
+    airport_count = countries * airports_per_country
+    if airport_count > 26 ** 3:
+        raise ValueError(f"At most {26 ** 3} airports fit in three-letter codes, got {airport_count}")
+    rng = np.random.default_rng(seed)
+
+    ids = np.arange(airport_count)
+    country_of = ids // airports_per_country
+    codes = [iata_code(i) for i in ids]
+    country_names = [f"Country {c:04d}" for c in range(countries)]
+    airports = pd.DataFrame({
+        "Airport ID": ids + 1,
+        "Name": [f"Airport {code}" for code in codes],
+        "City": [f"City {i // 2:05d}" for i in ids],
+        "Country": [country_names[c] for c in country_of],
+        "IATA": codes,
+        "ICAO": ["X" + code for code in codes],
+        "Latitude": rng.uniform(-60, 70, airport_count).round(4),
+        "Longitude": rng.uniform(-180, 180, airport_count).round(4),
+        "Altitude": rng.integers(0, 3000, airport_count),
+        "Timezone": 0, "DST": "U", "Tz database time zone": "Etc/UTC", "Type": "airport", "Source": "synthetic",
+    }, columns=AIRPORT_COLUMNS)
+
+    # Random popularity ranks so hubs are spread over countries
+    weights = 1.0 / (rng.permutation(airport_count) + 1.0) ** hub_exponent
+    weights /= weights.sum()
+    sources = rng.choice(airport_count, size=routes, p=weights)
+    targets = rng.choice(airport_count, size=routes, p=weights)
+    keep = sources != targets
+    sources, targets = sources[keep], targets[keep]
+    airline_ids = rng.integers(0, airlines, len(sources))
+
+    routes_df = pd.DataFrame({
+        "Airline": [iata_code(a)[1:] for a in airline_ids],
+        "Airline ID": airline_ids + 1,
+        "Source airport": [codes[i] for i in sources],
+        "Source airport ID": sources + 1,
+        "Destination airport": [codes[i] for i in targets],
+        "Destination airport ID": targets + 1,
+        "Codeshare": "", "Stops": 0, "Equipment": "320",
+    }, columns=ROUTE_COLUMNS)
+    return airports, routes_df
+
+
+def write_network(directory, **options):
+    """Generate a network and write it as airports.csv and routes.csv; returns their paths"""
+    os.makedirs(directory, exist_ok=True)
+    airports, routes = generate_network(**options)
+    airports_file = os.path.join(directory, "airports.csv")
+    routes_file = os.path.join(directory, "routes.csv")
+    airports.to_csv(airports_file, index=False)
+    routes.to_csv(routes_file, index=False)
+    return routes_file, airports_file
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic routes/airports data set")
+    parser.add_argument("directory", help="output directory")
+    parser.add_argument("--countries", type=int, default=200)
+    parser.add_argument("--airports-per-country", type=int, default=4)
+    parser.add_argument("--routes", type=int, default=20000)
+    parser.add_argument("--airlines", type=int, default=300)
+    parser.add_argument("--hub-exponent", type=float, default=1.0, help="skew of airport popularity")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    routes_file, airports_file = write_network(args.directory, countries=args.countries,
+                                               airports_per_country=args.airports_per_country,
+                                               routes=args.routes, airlines=args.airlines,
+                                               hub_exponent=args.hub_exponent, seed=args.seed)
+    print(f"Wrote '{airports_file}' and '{routes_file}'.")
+
+
+if __name__ == "__main__":
+    main()
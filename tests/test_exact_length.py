@@ -0,0 +1,85 @@
+import random
+
+import pytest
+
+from exact_length import ExactLengthPaths
+from graph_backend import CSRGraph
+
+
+def random_graph(seed, n=7, edges=18):
+    rng = random.Random(seed)
+    nodes = [f"N{i}" for i in range(n)]
+    pairs = {(rng.randrange(n), rng.randrange(n)) for _ in range(edges)}
+    return CSRGraph.from_edges([(nodes[u], nodes[v]) for u, v in pairs if u != v], nodes=nodes)
+
+
+def brute_force_walks(csr, source, target, length, simple=False):
+    """Every length-flight walk from source that reaches target only with its last flight, in adjacency order"""
+    source_id, target_id = csr.node_ids[source], csr.node_ids[target]
+    if length == 0:
+        return [[source]] if source_id == target_id else []
+    walks = []
+
+    def extend(path):
+        if len(path) == length + 1:
+            if path[-1] == target_id:
+                walks.append([csr.nodes[i] for i in path])
+            return
+        if path[-1] == target_id:
+            return
+        for v in csr.adjacency[path[-1]]:
+            if not (simple and v in path):
+                extend(path + [v])
+
+    extend([source_id])
+    return walks
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_walks_match_brute_force(seed):
+    csr = random_graph(seed)
+    engine = ExactLengthPaths(csr, max_cached_targets=2)
+    for length in range(6):
+        for source in csr.nodes:
+            for target in csr.nodes:
+                walks = brute_force_walks(csr, source, target, length)
+                assert engine.count_walks(source, target, length) == len(walks)
+                assert list(engine.iter_walks(source, target, length)) == walks
+                assert engine.walk(source, target, length) == (walks[0] if walks else None)
+                random_walk = engine.random_walk(source, target, length, random.Random(length))
+                assert random_walk in walks if walks else random_walk is None
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_simple_paths_match_brute_force(seed):
+    csr = random_graph(seed)
+    engine = ExactLengthPaths(csr, max_cached_targets=2)
+    for length in range(6):
+        for source in csr.nodes:
+            for target in csr.nodes:
+                paths = brute_force_walks(csr, source, target, length, simple=True)
+                assert list(engine.iter_simple_paths(source, target, length)) == paths
+                assert engine.count_simple_paths(source, target, length) == len(paths)
+                assert engine.simple_path(source, target, length) == (paths[0] if paths else None)
+                random_path = engine.random_simple_path(source, target, length, random.Random(length),
+                                                        max_attempts=3)
+                assert random_path in paths if paths else random_path is None
+
+
+@pytest.mark.parametrize("simple", [False, True])
+@pytest.mark.parametrize("block_budget", [1, 10 ** 6])
+def test_all_pairs_matches_brute_force(simple, block_budget):
+    csr = random_graph(5)
+    engine = ExactLengthPaths(csr)
+    for length in range(1, 6):
+        expected = {(source, target): paths[0] for source in csr.nodes for target in csr.nodes
+                    for paths in [brute_force_walks(csr, source, target, length, simple)] if paths}
+        found = {(source, target): path
+                 for source, target, path in engine.all_pairs(length, simple=simple, block_budget=block_budget)}
+        assert found == expected
+
+
+def test_unknown_node_raises_key_error():
+    engine = ExactLengthPaths(random_graph(0))
+    with pytest.raises(KeyError):
+        engine.count_walks("N0", "Nowhere", 2)
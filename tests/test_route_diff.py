@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from route import RouteManager
+from synthetic_routes import write_network
+
+
+def write_changed_routes(routes_file, path, seed, removals=15, additions=15):
+    """Copy of routes_file with random routes dropped and random routes between known airports added"""
+    rng = np.random.default_rng(seed)
+    routes = pd.read_csv(routes_file, keep_default_na=False)
+    kept = routes.drop(index=rng.choice(len(routes), size=removals, replace=False))
+    airports = pd.read_csv(routes_file.replace("routes.csv", "airports.csv"), keep_default_na=False)
+    codes = airports["IATA"].tolist()
+    new = routes.sample(n=additions, replace=True, random_state=seed).reset_index(drop=True)
+    new["Source airport"] = rng.choice(codes, size=additions)
+    new["Destination airport"] = rng.choice(codes, size=additions)
+    new["Airline"] = "ZZ"
+    pd.concat([kept, new]).to_csv(path, index=False)
+    return str(path)
+
+
+def network(tmp_path, seed):
+    return write_network(str(tmp_path / "network"), countries=30, airports_per_country=2, routes=90, seed=seed)
+
+
+def by_name(route_manager, matrix, nodes=None):
+    """Hop distances between nodes (all by default) keyed by name, so graphs with different node IDs compare"""
+    ids = route_manager.country_ids
+    nodes = route_manager.countries if nodes is None else nodes
+    return {(s, t): int(matrix[ids[s], ids[t]]) for s in nodes for t in nodes}
+
+
+def assert_same_graph(live, rebuilt, live_distances, rebuilt_distances):
+    # Nodes whose last route was removed keep their ID in the live graph, without any flights
+    stale = set(live.countries) - set(rebuilt.countries)
+    assert set(rebuilt.countries) <= set(live.countries)
+    assert all(not live.csr.adjacency[live.country_ids[node]] for node in stale)
+    assert by_name(live, live_distances, rebuilt.countries) == by_name(rebuilt, rebuilt_distances)
+
+
+def length_buckets(route_manager):
+    """Set of (source, destination) node names for every path length in the pair index"""
+    nodes, n = route_manager.countries, len(route_manager.countries)
+    offsets = route_manager.length_offsets
+    return [{tuple(nodes[i] for i in divmod(int(flat), n)) for flat in route_manager.pair_index[start:end]}
+            for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def edges_by_name(route_manager, attribute):
+    csr = route_manager.csr
+    values = csr.edge_attributes[attribute]
+    return {(csr.nodes[u], csr.nodes[v]): values[csr.edge_position(u, v)].item()
+            for u, row in enumerate(csr.adjacency) for v in row}
+
+
+@pytest.mark.parametrize("granularity", ["country", "airport"])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_repaired_index_matches_rebuild(tmp_path, granularity, seed):
+    routes_file, airports_file = network(tmp_path, seed)
+    changed_file = write_changed_routes(routes_file, tmp_path / "changed.csv", seed)
+
+    live = RouteManager(routes_file, airports_file, use_snapshot=False, granularity=granularity)
+    result = live.apply_routes_file(changed_file)
+    rebuilt = RouteManager(changed_file, airports_file, use_snapshot=False, granularity=granularity)
+
+    assert result["edges_added"] or result["edges_removed"]
+    assert_same_graph(live, rebuilt, live.distances, rebuilt.distances)
+    assert length_buckets(live) == length_buckets(rebuilt)
+    for attribute in ("route_count", "airline_count", "airport_pair_count"):
+        assert edges_by_name(live, attribute) == edges_by_name(rebuilt, attribute)
+    assert edges_by_name(live, "distance_km") == pytest.approx(edges_by_name(rebuilt, "distance_km"))
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_repaired_rows_match_rebuild_without_index(tmp_path, seed):
+    routes_file, airports_file = network(tmp_path, seed)
+    changed_file = write_changed_routes(routes_file, tmp_path / "changed.csv", seed)
+
+    # Too small for the all-pairs index, so cached BFS rows are repaired instead
+    live = RouteManager(routes_file, airports_file, use_snapshot=False, distance_memory_budget=200)
+    assert live.distances is None
+    for source_id in range(len(live.countries)):
+        live.distance_row(source_id)
+    cached = list(live._state.distance_rows)
+    live.apply_routes_file(changed_file)
+    rebuilt = RouteManager(changed_file, airports_file, use_snapshot=False)
+
+    assert cached == list(live._state.distance_rows)
+    rows = np.array([live.distance_row(source_id) for source_id in range(len(live.countries))])
+    assert_same_graph(live, rebuilt, rows, rebuilt.distances)
+
+
+def test_removing_and_restoring_routes_round_trips(tmp_path):
+    routes_file, airports_file = network(tmp_path, 3)
+    changed_file = write_changed_routes(routes_file, tmp_path / "changed.csv", 3)
+
+    live = RouteManager(routes_file, airports_file, use_snapshot=False)
+    original = list(live.countries)
+    before = by_name(live, live.distances), length_buckets(live)
+    live.apply_routes_file(changed_file)
+    live.apply_routes_file(routes_file)
+
+    # Nodes added by the first diff stay, unreachable, so compare on the original ones
+    assert by_name(live, live.distances, original) == before[0]
+    assert length_buckets(live) == before[1]